@@ -1,66 +1,153 @@
 import asyncio
+import os
 import time
-from typing import List
+from typing import AsyncIterator, Dict, List
 
 from cloaca.api.shared import (
+    NEARBY_OBSERVATIONS_DISTANCE_KM,
+    ensure_taxonomy,
     fetch_nearby_observations_from_ebird_with_cache,
     fetch_nearby_observations_of_species_from_ebird_with_cache,
+    recent_species_index,
     round_to_nearest_half,
-    shared_clear_nearby_observations_cache,
 )
-from cloaca.parsing.parsing_helpers import Lifer
+from cloaca.parsing.parsing_helpers import LocationToLifers
 from cloaca.types import (
+    LocationGrouper,
     filter_lifers_from_nearby_observations,
-    get_lifers_from_cache,
+    get_uploaded_lifers_from_cache,
     group_lifers_by_location,
-    phoebe_observation_to_lifer,
+    phoebe_observations_to_lifers,
 )
+from cloaca.upload_cache import UploadedLifers
+from phoebe_bird.types.data.observation import Observation as PhoebeObservation
 
 
-async def clear_nearby_observations_cache():
-    await shared_clear_nearby_observations_cache()
+# "ebird" asks eBird for every unseen species, "index" answers from the per
+# species responses we've already fetched (recent_species_index) when one
+# covers the whole search circle, and asks eBird about the rest
+nearby_species_lookup = os.getenv("NEARBY_SPECIES_LOOKUP", "ebird")
 
+# per request: how many species are looked up at once, how long one lookup
+# can take, and when to give up and return whatever has resolved so far
+nearby_species_workers = int(os.getenv("NEARBY_SPECIES_WORKERS", "8"))
+nearby_species_timeout_seconds = float(
+    os.getenv("NEARBY_SPECIES_TIMEOUT_SECONDS", "10")
+)
+nearby_observations_deadline_seconds = float(
+    os.getenv("NEARBY_OBSERVATIONS_DEADLINE_SECONDS", "20")
+)
 
-async def get_nearby_observations(latitude: float, longitude: float, file_id: str):
-    request_start_time = time.time()
-    nearby_observations = await fetch_nearby_observations_from_ebird_with_cache(
-        round_to_nearest_half(latitude), round_to_nearest_half(longitude)
+nearby_species_lookup_stats = {
+    "requests": 0,
+    "partial_requests": 0,
+    "species_looked_up": 0,
+    "species_failed": 0,
+    "species_past_deadline": 0,
+}
+
+
+async def lookup_species_near(
+    species_code: str, latitude: float, longitude: float
+) -> List[PhoebeObservation]:
+    if nearby_species_lookup == "index":
+        indexed = recent_species_index.lookup(
+            species_code, latitude, longitude, NEARBY_OBSERVATIONS_DISTANCE_KM
+        )
+        if indexed is not None:
+            return indexed
+    return await fetch_nearby_observations_of_species_from_ebird_with_cache(
+        species_code, latitude, longitude
     )
 
-    lifers_from_csv = get_lifers_from_cache(file_id)
+
+async def lookup_unseen_species(
+    species_codes: List[str], latitude: float, longitude: float
+) -> AsyncIterator[List[PhoebeObservation]]:
+    """
+    Yield each species' nearby observations as soon as they resolve, at most
+    `nearby_species_workers` at a time. A species that fails or times out is
+    skipped, and once the deadline passes the rest are.
+    """
+    nearby_species_lookup_stats["requests"] += 1
+    semaphore = asyncio.Semaphore(nearby_species_workers)
+
+    async def lookup(species_code: str) -> List[PhoebeObservation]:
+        async with semaphore:
+            try:
+                # the eBird call itself is shared (and shielded) by the
+                # single flight table, so timing out here doesn't cancel it
+                # and its result still lands in the cache for the next request
+                return await asyncio.wait_for(
+                    lookup_species_near(species_code, latitude, longitude),
+                    nearby_species_timeout_seconds,
+                )
+            except Exception as e:
+                print(f"Skipping nearby observations of {species_code}: {e!r}")
+                nearby_species_lookup_stats["species_failed"] += 1
+                return []
+
+    tasks = [asyncio.ensure_future(lookup(code)) for code in species_codes]
+    try:
+        for next_done in asyncio.as_completed(
+            tasks, timeout=nearby_observations_deadline_seconds
+        ):
+            observations = await next_done
+            # counted once it's resolved, not when as_completed hands it out,
+            # so species the deadline cuts off aren't counted as looked up
+            nearby_species_lookup_stats["species_looked_up"] += 1
+            yield observations
+    except TimeoutError:
+        unresolved = sum(not task.done() for task in tasks)
+        print(f"Deadline reached, returning without {unresolved} species")
+        nearby_species_lookup_stats["partial_requests"] += 1
+        nearby_species_lookup_stats["species_past_deadline"] += unresolved
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def get_unseen_species_codes(
+    latitude: float, longitude: float, lifers_from_csv: UploadedLifers
+) -> List[str]:
+    nearby_observations = await fetch_nearby_observations_from_ebird_with_cache(
+        latitude, longitude
+    )
 
     unseen_species = await filter_lifers_from_nearby_observations(
         nearby_observations, lifers_from_csv
     )
 
+    # observations without a species code can't be looked up by species
     unseen_species_codes = list(
-        set([species.species_code for species in unseen_species])
+        {species.species_code for species in unseen_species if species.species_code}
     )
 
     print(f"unseen species codes: {unseen_species_codes}")
 
-    # use async.gather to make multiple requests at once
-    unseen_lifers: List[Lifer] = []
+    return unseen_species_codes
 
-    async def fetch_task(species_code):
-        unseen_observations_for_species = await (
-            fetch_nearby_observations_of_species_from_ebird_with_cache(
-                species_code,
-                round_to_nearest_half(latitude),
-                round_to_nearest_half(longitude),
-            )
-        )
 
-        for observation in unseen_observations_for_species:
-            unseen_lifers.append(await phoebe_observation_to_lifer(observation))
+async def get_nearby_observations(latitude: float, longitude: float, file_id: str):
+    request_start_time = time.time()
+    latitude = round_to_nearest_half(latitude)
+    longitude = round_to_nearest_half(longitude)
+
+    lifers_from_csv = get_uploaded_lifers_from_cache(file_id)
 
-    fetch_tasks = [
-        fetch_task(unseen_species_code) for unseen_species_code in unseen_species_codes
-    ]
+    unseen_species_codes = await get_unseen_species_codes(
+        latitude, longitude, lifers_from_csv
+    )
 
-    await asyncio.gather(*fetch_tasks)
+    # group each species as it resolves, while the rest are still in flight
+    taxonomy = await ensure_taxonomy()
+    grouper = LocationGrouper()
+    async for observations in lookup_unseen_species(
+        unseen_species_codes, latitude, longitude
+    ):
+        grouper.add(phoebe_observations_to_lifers(observations, taxonomy))
 
-    lifers_by_location = group_lifers_by_location(unseen_lifers)
+    lifers_by_location = grouper.result()
 
     print("returning", len(lifers_by_location), "locations")
 
@@ -68,3 +155,37 @@ async def get_nearby_observations(latitude: float, longitude: float, file_id: st
     print(f"request took {duration} seconds")
 
     return lifers_by_location
+
+
+async def stream_nearby_observations(
+    latitude: float, longitude: float, file_id: str
+) -> AsyncIterator[Dict[str, LocationToLifers]]:
+    """
+    Like get_nearby_observations, but yields each species' locations as its
+    lookup resolves. A location can show up in several chunks, with the lifers
+    of different species, so clients merge chunks by location id.
+    """
+    latitude = round_to_nearest_half(latitude)
+    longitude = round_to_nearest_half(longitude)
+
+    # resolved before the response starts, so a bad file id is still an error
+    lifers_from_csv = get_uploaded_lifers_from_cache(file_id)
+
+    async def chunks() -> AsyncIterator[Dict[str, LocationToLifers]]:
+        unseen_species_codes = await get_unseen_species_codes(
+            latitude, longitude, lifers_from_csv
+        )
+        taxonomy = await ensure_taxonomy()
+        async for observations in lookup_unseen_species(
+            unseen_species_codes, latitude, longitude
+        ):
+            if observations:
+                yield group_lifers_by_location(
+                    phoebe_observations_to_lifers(observations, taxonomy)
+                )
+
+    return chunks()
+
+
+def get_nearby_species_lookup_stats() -> Dict[str, int]:
+    return dict(nearby_species_lookup_stats)
@@ -1,37 +1,147 @@
-from dataclasses import dataclass
+import asyncio
+import gzip
+import json
+import os
+import time
+from dataclasses import asdict, astuple, dataclass
 from typing import Dict
 
-from cloaca.api.shared import get_phoebe_client
+from cloaca.api.rate_limit import TokenBucket, retry_with_jitter
+from cloaca.api.shared import (
+    ensure_taxonomy,
+    get_ebird_cache_refresh_headers,
+    get_cached_phoebe_client,
+)
+from cloaca.geo import distance_km
 from cloaca.parsing.parse_ebird_regional_list import (
     SubnationalRegion,
     parse_subnational1_file,
 )
+from cloaca.parsing.lifer_table import StringPool
 from cloaca.parsing.parsing_helpers import Lifer
+from cloaca.single_flight import SingleFlight
+from cloaca.ttl_cache import TTLCache
 from cloaca.types import (
     filter_lifers_from_observations,
-    get_lifers_from_cache,
-    phoebe_observation_to_lifer,
+    get_uploaded_lifers_from_cache,
+    phoebe_observations_to_lifers,
 )
 from phoebe_bird.types.data.observation import Observation as PhoebeObservation
 
 
+def smallest_longitude_span(longitudes: list[float]) -> tuple[float, float]:
+    """
+    (west, east) edges of the narrowest span holding every longitude. It
+    wraps around the antimeridian (west > east) when that's narrower, eg for
+    Alaska's Aleutians, instead of spanning almost every longitude.
+    """
+    ordered = sorted(set(longitudes))
+    # the widest gap between neighbouring longitudes is what the span skips,
+    # starting with the one across the antimeridian
+    widest_gap, west, east = ordered[0] + 360 - ordered[-1], ordered[0], ordered[-1]
+    for previous, current in zip(ordered, ordered[1:]):
+        if current - previous > widest_gap:
+            widest_gap, west, east = current - previous, current, previous
+    return west, east
+
+
+@dataclass
+class RegionBounds:
+    min_latitude: float
+    max_latitude: float
+    # the box wraps around the antimeridian when min_longitude > max_longitude
+    min_longitude: float
+    max_longitude: float
+    # where the region's observations were reported from, which tells
+    # overlapping boxes apart
+    hotspots: tuple[tuple[float, float], ...] = ()
+
+    @classmethod
+    def from_lifers(cls, lifers: list[Lifer]) -> "RegionBounds | None":
+        # the bundled region tables don't have coordinates, so a region's
+        # extent is the box around the hotspots it reported observations from
+        hotspots = {
+            (lifer.latitude, lifer.longitude)
+            for lifer in lifers
+            if lifer.latitude or lifer.longitude
+        }
+        if not hotspots:
+            return None
+        min_longitude, max_longitude = smallest_longitude_span(
+            [longitude for _, longitude in hotspots]
+        )
+        return cls(
+            min_latitude=min(latitude for latitude, _ in hotspots),
+            max_latitude=max(latitude for latitude, _ in hotspots),
+            min_longitude=min_longitude,
+            max_longitude=max_longitude,
+            hotspots=tuple(sorted(hotspots)),
+        )
+
+    def closest_longitude(self, longitude: float) -> float:
+        width = (self.max_longitude - self.min_longitude) % 360
+        if (longitude - self.min_longitude) % 360 <= width:
+            return longitude
+        # outside the box, whichever edge is fewer degrees away either way
+        # round the globe
+        if (self.min_longitude - longitude) % 360 <= (
+            longitude - self.max_longitude
+        ) % 360:
+            return self.min_longitude
+        return self.max_longitude
+
+    def distance_km(self, latitude: float, longitude: float) -> float:
+        """0 inside the box, otherwise the distance to its closest point."""
+        closest_latitude = min(max(latitude, self.min_latitude), self.max_latitude)
+        return distance_km(
+            latitude, longitude, closest_latitude, self.closest_longitude(longitude)
+        )
+
+    def nearest_hotspot_km(self, latitude: float, longitude: float) -> float:
+        if not self.hotspots:
+            return self.distance_km(latitude, longitude)
+        return min(
+            distance_km(latitude, longitude, hotspot_latitude, hotspot_longitude)
+            for hotspot_latitude, hotspot_longitude in self.hotspots
+        )
+
+
 @dataclass
 class SubRegionAndObservations:
     subnational_region: SubnationalRegion
     observations: list[Lifer]
+    bounds: RegionBounds | None = None
 
 
 regional_mapping: Dict[str, SubRegionAndObservations] = {}
 
+# how far outside a region's bounds a caller can be and still count as "near" it
+region_neighbor_distance_km = float(os.getenv("REGION_NEIGHBOR_DISTANCE_KM", "150"))
+
+# (file_id, region codes) -> filtered results. cleared (which bumps the
+# generation) every time get_regional_mapping finishes, so an entry is only
+# ever reused against the same regional mapping it was computed from
+FilteredRegionalLifersKey = tuple[str, tuple[str, ...]]
+filtered_regional_lifers_cache: TTLCache[FilteredRegionalLifersKey, list[Lifer]] = (
+    TTLCache(
+        max_entries=int(os.getenv("FILTERED_REGIONAL_LIFERS_CACHE_MAX_ENTRIES", "256")),
+        ttl_seconds=60 * 60 * 2,
+    )
+)
+
 
 async def fetch_observations_for_regions_from_phoebe(
-    subnational_code: str,
+    subnational_code: str, refresh_http_cache: bool = False
 ) -> list[PhoebeObservation]:
-    return await get_phoebe_client().data.observations.recent.list(
+    # fetch_lifers_for_region retries these itself, through the rate limiter,
+    # so the client's own retries would only multiply the attempts
+    client = get_cached_phoebe_client().with_options(max_retries=0)
+    return await client.data.observations.recent.list(
         back=30,
         cat="species",
         hotspot=True,
         region_code=subnational_code,
+        extra_headers=get_ebird_cache_refresh_headers() if refresh_http_cache else None,
     )
 
 
@@ -39,9 +149,65 @@ def get_lifers_for_region(subnational_code: str) -> list[Lifer]:
     return regional_mapping[subnational_code].observations
 
 
-# go through subnational codes from ebird and prepare the mapping
-# by setting a key for each subnational code
-async def get_regional_mapping():
+@dataclass
+class RegionalMappingRefreshReport:
+    started_at: float
+    duration_seconds: float
+    regions: int
+    observations: int
+    # subnational1 code -> error, these regions kept their previous observations
+    failed_regions: Dict[str, str]
+
+
+last_regional_mapping_refresh: RegionalMappingRefreshReport | None = None
+# callers that show up while a refresh is running share it
+regional_mapping_refreshes: SingleFlight[str, RegionalMappingRefreshReport] = (
+    SingleFlight()
+)
+
+# where the last refreshed mapping is written, so a restart can serve it while
+# the first refresh runs. unset, nothing is persisted
+regional_mapping_snapshot_path = os.getenv("REGIONAL_MAPPING_SNAPSHOT_PATH")
+regional_mapping_snapshot_max_age_seconds = float(
+    os.getenv("REGIONAL_MAPPING_SNAPSHOT_MAX_AGE_SECONDS", str(24 * 60 * 60))
+)
+
+regional_refresh_concurrency = int(os.getenv("REGIONAL_REFRESH_CONCURRENCY", "8"))
+regional_refresh_requests_per_second = float(
+    os.getenv("REGIONAL_REFRESH_REQUESTS_PER_SECOND", "5")
+)
+
+
+async def fetch_lifers_for_region(
+    sub_region: SubnationalRegion,
+    semaphore: asyncio.Semaphore,
+    rate_limiter: TokenBucket,
+    strings: StringPool | None = None,
+    refresh_http_cache: bool = False,
+) -> list[Lifer]:
+    async def rate_limited_fetch() -> list[PhoebeObservation]:
+        await rate_limiter.acquire()
+        return await fetch_observations_for_regions_from_phoebe(
+            sub_region.subnational1_code, refresh_http_cache
+        )
+
+    async with semaphore:
+        phoebe_observations = await retry_with_jitter(rate_limited_fetch)
+
+    print(
+        f"Found {len(phoebe_observations)} observations for {sub_region.subnational1_name}"
+    )
+    return phoebe_observations_to_lifers(
+        phoebe_observations, await ensure_taxonomy(), strings
+    )
+
+
+async def _refresh_regional_mapping(
+    refresh_http_cache: bool,
+) -> RegionalMappingRefreshReport:
+    global regional_mapping, last_regional_mapping_refresh
+
+    started_at = time.time()
     sub_regions = parse_subnational1_file()
 
     filtered_sub_regions = [
@@ -50,47 +216,226 @@ async def get_regional_mapping():
         if sub_region.country_code == "US" and sub_region.subnational1_code
     ]
 
-    for sub_region in filtered_sub_regions:
-        phoebe_observations = await fetch_observations_for_regions_from_phoebe(
-            sub_region.subnational1_code
-        )
-        print(
-            f"Found {len(phoebe_observations)} observations for {sub_region.subnational1_name}"
-        )
-        lifers = [
-            await phoebe_observation_to_lifer(observation)
-            for observation in phoebe_observations
-        ]
+    semaphore = asyncio.Semaphore(regional_refresh_concurrency)
+    rate_limiter = TokenBucket(regional_refresh_requests_per_second)
+    # shared across regions, species (and their names) repeat from state to state
+    strings = StringPool()
+    results = await asyncio.gather(
+        *[
+            fetch_lifers_for_region(
+                sub_region, semaphore, rate_limiter, strings, refresh_http_cache
+            )
+            for sub_region in filtered_sub_regions
+        ],
+        return_exceptions=True,
+    )
+
+    # build the new mapping off to the side so readers never see a half refresh
+    new_mapping: Dict[str, SubRegionAndObservations] = {}
+    failed_regions: Dict[str, str] = {}
+    for sub_region, result in zip(filtered_sub_regions, results):
+        code = sub_region.subnational1_code
+        if isinstance(result, BaseException):
+            print(f"Failed to fetch observations for {code}: {result!r}")
+            failed_regions[code] = repr(result)
+            if code in regional_mapping:
+                new_mapping[code] = regional_mapping[code]
+            continue
 
-        regional_mapping[sub_region.subnational1_code] = SubRegionAndObservations(
-            subnational_region=sub_region, observations=lifers
+        new_mapping[code] = SubRegionAndObservations(
+            subnational_region=sub_region,
+            observations=result,
+            bounds=RegionBounds.from_lifers(result),
         )
 
+    regional_mapping = new_mapping
+    filtered_regional_lifers_cache.clear()
+
+    if regional_mapping_snapshot_path:
+        try:
+            await asyncio.to_thread(
+                save_regional_mapping_snapshot,
+                new_mapping,
+                regional_mapping_snapshot_path,
+            )
+        except Exception as e:
+            print("Error saving regional mapping snapshot:", e)
+
+    report = RegionalMappingRefreshReport(
+        started_at=started_at,
+        duration_seconds=time.time() - started_at,
+        regions=len(new_mapping),
+        observations=sum(len(region.observations) for region in new_mapping.values()),
+        failed_regions=failed_regions,
+    )
+    last_regional_mapping_refresh = report
+
     print("Finished fetching observations for all subnational regions")
-    print(f"Found {len(regional_mapping)} subnational regions")
+    print(
+        f"Found {report.regions} subnational regions in {report.duration_seconds:.1f}s "
+        f"({len(failed_regions)} failed)"
+    )
 
+    return report
 
-async def get_regional_lifers() -> list[Lifer]:
+
+def save_regional_mapping_snapshot(
+    mapping: Dict[str, SubRegionAndObservations], path: str
+):
+    snapshot = [
+        {
+            "region": asdict(region.subnational_region),
+            "observations": [astuple(lifer) for lifer in region.observations],
+        }
+        for region in mapping.values()
+    ]
+    # write then rename, so other workers never read half a file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+def load_regional_mapping_snapshot(
+    path: str, max_age_seconds: float
+) -> Dict[str, SubRegionAndObservations] | None:
+    try:
+        age_seconds = time.time() - os.path.getmtime(path)
+    except FileNotFoundError:
+        return None
+    if age_seconds > max_age_seconds:
+        print(f"Ignoring regional mapping snapshot from {age_seconds:.0f}s ago")
+        return None
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        snapshot = json.load(f)
+
+    strings = StringPool()
+    mapping: Dict[str, SubRegionAndObservations] = {}
+    for region in snapshot:
+        sub_region = SubnationalRegion(**region["region"])
+        observations = [
+            Lifer(*(strings.intern(value) for value in row))
+            for row in region["observations"]
+        ]
+        mapping[sub_region.subnational1_code] = SubRegionAndObservations(
+            subnational_region=sub_region,
+            observations=observations,
+            bounds=RegionBounds.from_lifers(observations),
+        )
+    return mapping
+
+
+async def load_regional_mapping_from_snapshot() -> bool:
+    """Serve the persisted mapping until the first refresh replaces it."""
+    global regional_mapping
+    if not regional_mapping_snapshot_path or regional_mapping:
+        return False
+
+    mapping = await asyncio.to_thread(
+        load_regional_mapping_snapshot,
+        regional_mapping_snapshot_path,
+        regional_mapping_snapshot_max_age_seconds,
+    )
+    # a refresh may have finished while we were reading, don't go back in time
+    if not mapping or regional_mapping:
+        return False
+
+    regional_mapping = mapping
+    filtered_regional_lifers_cache.clear()
+    print(f"Loaded {len(mapping)} regions from {regional_mapping_snapshot_path}")
+    return True
+
+
+def get_last_regional_mapping_refresh() -> RegionalMappingRefreshReport | None:
+    return last_regional_mapping_refresh
+
+
+# go through subnational codes from ebird and prepare the mapping
+# by setting a key for each subnational code
+async def get_regional_mapping(
+    refresh_http_cache: bool = False,
+) -> RegionalMappingRefreshReport:
+    """
+    `refresh_http_cache` skips the persistent eBird response cache, for the
+    hourly refresh, which would otherwise get back the last hour's responses.
+    """
+    return await regional_mapping_refreshes.run(
+        "regional_mapping", lambda: _refresh_regional_mapping(refresh_http_cache)
+    )
+
+
+async def ensure_regional_mapping():
     if not regional_mapping:
         print("Performing initial fetch of regional mapping")
         await get_regional_mapping()
+
+
+async def get_regional_lifers() -> list[Lifer]:
+    await ensure_regional_mapping()
     return [
         lifer for region in regional_mapping.values() for lifer in region.observations
     ]
 
 
+def find_region_codes_near(
+    latitude: float, longitude: float, include_neighbors: bool = False
+) -> list[str]:
+    """
+    The region the point is in, plus (when include_neighbors is set) every
+    other region within region_neighbor_distance_km of it, best match first.
+    Falls back to every region if the caller isn't near any of them (eg
+    outside the US).
+
+    Bounds are boxes around reported hotspots, so neighbouring boxes overlap.
+    Regions whose box contains the point come first, and among those the one
+    with a hotspot closest to the point is taken to be the one it's in.
+    Regions the point is only near (within the padding) come after.
+    """
+    candidates = [
+        (region.bounds, code)
+        for code, region in regional_mapping.items()
+        if region.bounds is not None
+    ]
+    nearby = sorted(
+        (box_distance, bounds.nearest_hotspot_km(latitude, longitude), code)
+        for bounds, code in candidates
+        if (box_distance := bounds.distance_km(latitude, longitude))
+        <= region_neighbor_distance_km
+    )
+    if not nearby:
+        return sorted(regional_mapping.keys())
+
+    codes = [code for _, _, code in nearby]
+    return codes if include_neighbors else codes[:1]
+
+
 # truly the naming is getting horrendous
 async def get_filtered_lifers_for_region(
-    latitude: float, longitude: float, file_id: str
+    latitude: float, longitude: float, file_id: str, include_neighbors: bool = False
 ) -> list[Lifer]:
-    lifers_from_csv = get_lifers_from_cache(file_id)
+    lifers_from_csv = get_uploaded_lifers_from_cache(file_id)
+
+    await ensure_regional_mapping()
 
-    regional_lifers = await get_regional_lifers()
+    # nothing awaits from here on, so the result always matches the current
+    # regional mapping (and cache generation)
+    region_codes = find_region_codes_near(latitude, longitude, include_neighbors)
+    key = (file_id, tuple(region_codes))
+    cached = filtered_regional_lifers_cache.get(key)
+    if cached is not None:
+        print(f"Returning {len(cached)} cached regional lifers for {region_codes}")
+        return cached
+
+    regional_lifers = [
+        lifer for code in region_codes for lifer in regional_mapping[code].observations
+    ]
 
     filtered = filter_lifers_from_observations(regional_lifers, lifers_from_csv)
+    filtered_regional_lifers_cache.set(key, filtered)
 
     print(
-        f"Returning {len(filtered)} regional lifers (started with {len(regional_lifers)})"
+        f"Returning {len(filtered)} regional lifers for {region_codes} (started with {len(regional_lifers)})"
     )
 
     return filtered
@@ -1,28 +1,120 @@
-from typing import List, Dict, Any
+import itertools
+import math
+import os
+from typing import List
 
-import duckdb
-from cloaca.db.popular_hotspots import get_popular_hotspots
+from pydantic import BaseModel
 
+from cloaca.db.cursor_pool import DuckDBCursorPool
+from cloaca.db.popular_hotspots import (
+    KM_PER_DEGREE_LATITUDE,
+    POPULAR_HOTSPOTS_LIMIT,
+    get_popular_hotspots_json_rows,
+)
+from cloaca.geo import distance_km
+from cloaca.ttl_cache import TTLCache
 
-async def get_popular_hotspots_api(
-    duck_db_conn: duckdb.DuckDBPyConnection,
+# lookups are snapped to this grid (in degrees, ~1km by default) and the radius
+# is rounded up to a multiple of the step, so panning the map mostly hits cache
+cache_grid_degrees = float(os.getenv("POPULAR_HOTSPOTS_CACHE_GRID_DEGREES", "0.01"))
+cache_radius_step_km = float(os.getenv("POPULAR_HOTSPOTS_CACHE_RADIUS_STEP_KM", "1"))
+
+PopularHotspotsCacheKey = tuple[float, float, float, int]
+# (latitude, longitude, JSON object) per hotspot, busiest first
+PopularHotspotRows = List[tuple[float, float, str]]
+
+# the parsed db only changes when it's rebuilt, and the cache is cleared when
+# the new file is swapped in, so the TTL is just a backstop
+popular_hotspots_cache: TTLCache[PopularHotspotsCacheKey, PopularHotspotRows] = (
+    TTLCache(
+        max_entries=int(os.getenv("POPULAR_HOTSPOTS_CACHE_MAX_ENTRIES", "512")),
+        ttl_seconds=float(
+            os.getenv("POPULAR_HOTSPOTS_CACHE_TTL_SECONDS", str(6 * 60 * 60))
+        ),
+    )
+)
+
+
+class PopularHotspot(BaseModel):
+    locality_id: str
+    locality_name: str
+    latitude: float
+    longitude: float
+    avg_weekly_checklists: float
+    likely_common_species_count: int | None = None
+    likely_common_species_std_error: float | None = None
+    likely_uncommon_species_count: int | None = None
+    likely_common_and_uncommon_species_count: int | None = None
+
+
+def quantize_to_step(value: float, step: float) -> float:
+    # round() again to get rid of float noise like 40.690000000000005
+    return round(round(value / step) * step, 10)
+
+
+def get_popular_hotspots_cache_key(
+    latitude: float, longitude: float, radius_km: float, month: int
+) -> PopularHotspotsCacheKey:
+    return (
+        quantize_to_step(latitude, cache_grid_degrees),
+        quantize_to_step(longitude, cache_grid_degrees),
+        round(math.ceil(radius_km / cache_radius_step_km) * cache_radius_step_km, 10),
+        month,
+    )
+
+
+def get_cache_radius_padding_km() -> float:
+    # furthest a lookup can be from its snapped center: half a grid cell each
+    # way, and a degree of longitude is never longer than one of latitude
+    return math.hypot(cache_grid_degrees / 2, cache_grid_degrees / 2) * (
+        KM_PER_DEGREE_LATITUDE
+    )
+
+
+def clear_popular_hotspots_cache():
+    popular_hotspots_cache.clear()
+
+
+async def get_popular_hotspots_json_api(
+    duck_db_pool: DuckDBCursorPool,
     latitude: float,
     longitude: float,
     radius_km: float,
     month: int,
-) -> List[Dict[str, Any]]:
+) -> str:
     """
-    API function to get popular hotspots within a radius for a given month.
+    Popular hotspots within a radius for a given month, as a JSON array shaped
+    like a list of PopularHotspot. DuckDB serializes each row to JSON,
+    skipping the per-row python objects, dicts and response validation, and
+    the response is those objects joined into an array.
 
-    Args:
-        latitude: Center latitude
-        longitude: Center longitude
-        radius_km: Search radius in kilometers
-        month: Month number (1-12)
+    Lookups sharing a quantized location, radius and month share a cache
+    entry: every hotspot within reach of any of them, ie around the snapped
+    center with the radius padded by the snapping, uncapped. Each response is
+    then cut down to the caller's own circle and capped at
+    POPULAR_HOTSPOTS_LIMIT, so it's the same as querying it directly.
 
-    Returns:
-        List of hotspot dictionaries with locality info and average weekly checklists
+    A failed query isn't cached, the error goes to the caller.
     """
-    hotspots = get_popular_hotspots(duck_db_conn, latitude, longitude, radius_km, month)
+    key = get_popular_hotspots_cache_key(latitude, longitude, radius_km, month)
+    rows = popular_hotspots_cache.get(key)
+    if rows is None:
+        generation = popular_hotspots_cache.generation
+        cache_latitude, cache_longitude, cache_radius_km, _ = key
+        rows = await duck_db_pool.run(
+            get_popular_hotspots_json_rows,
+            cache_latitude,
+            cache_longitude,
+            cache_radius_km + get_cache_radius_padding_km(),
+            month,
+        )
+        popular_hotspots_cache.set(key, rows, generation=generation)
 
-    return [hotspot.to_dict() for hotspot in hotspots]
+    in_circle = (
+        hotspot_json
+        for hotspot_latitude, hotspot_longitude, hotspot_json in rows
+        # the same great circle distance as ST_Distance_Sphere
+        if distance_km(latitude, longitude, hotspot_latitude, hotspot_longitude)
+        <= radius_km
+    )
+    return "[" + ",".join(itertools.islice(in_circle, POPULAR_HOTSPOTS_LIMIT)) + "]"
@@ -0,0 +1,249 @@
+import asyncio
+import datetime
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict
+
+import httpx
+
+# how long each eBird endpoint's responses are reused for, first match wins.
+# anything that doesn't match isn't cached
+EBIRD_CACHE_TTLS: list[tuple[re.Pattern[str], float]] = [
+    (re.compile(r"/ref/taxonomy/ebird$"), 24 * 60 * 60),
+    (re.compile(r"/data/obs/geo/recent$"), 30 * 60),
+    (re.compile(r"/data/nearest/geo/recent/[^/]+$"), 30 * 60),
+    (re.compile(r"/data/obs/[^/]+/recent/notable$"), 30 * 60),
+    # the hourly regional refresh
+    (re.compile(r"/data/obs/[^/]+/recent$"), 60 * 60),
+    # a past day's checklists barely change, see RECENT_HISTORIC_DAYS
+    (
+        re.compile(
+            r"/data/obs/[^/]+/historic/(?P<year>\d+)/(?P<month>\d+)/(?P<day>\d+)$"
+        ),
+        7 * 24 * 60 * 60,
+    ),
+]
+
+# checklists for today and yesterday are still coming in, and eBird's dates
+# are the region's local ones, which can be a day behind UTC. so a historic
+# day this recent is never cached
+RECENT_HISTORIC_DAYS = 2
+
+# sent by the background refreshes (taxonomy, regional, stale nearby
+# observations), which exist to see eBird's current data: the cache isn't
+# read, but the fresh response is still stored for every other worker.
+# stripped before the request goes upstream
+CACHE_REFRESH_HEADER = "x-cloaca-cache-refresh"
+
+# the body is stored decoded, so these no longer describe it
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+def is_recent_historic_day(match: re.Match[str], now: float) -> bool:
+    try:
+        day = datetime.date(int(match["year"]), int(match["month"]), int(match["day"]))
+    except ValueError:
+        # not a real date, nothing worth keeping
+        return True
+    today = datetime.datetime.fromtimestamp(now, datetime.timezone.utc).date()
+    return day >= today - datetime.timedelta(days=RECENT_HISTORIC_DAYS)
+
+
+def get_ttl_for_url(
+    url: httpx.URL,
+    now: float,
+    ttls: list[tuple[re.Pattern[str], float]] = EBIRD_CACHE_TTLS,
+) -> float | None:
+    for pattern, ttl_seconds in ttls:
+        match = pattern.search(url.path)
+        if match is None:
+            continue
+        if "year" in match.groupdict() and is_recent_historic_day(match, now):
+            return None
+        return ttl_seconds
+    return None
+
+
+class SQLiteResponseCache:
+    """
+    Response bodies by URL in a SQLite file, shared by every worker process
+    pointed at it and kept across restarts.
+    """
+
+    def __init__(self, path: str, busy_timeout_seconds: float = 5):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(
+            path,
+            timeout=busy_timeout_seconds,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL,
+                    status_code INTEGER NOT NULL,
+                    headers TEXT NOT NULL,
+                    body BLOB NOT NULL
+                )
+                """
+            )
+
+    def get(
+        self, url: str, now: float
+    ) -> tuple[int, list[tuple[str, str]], bytes] | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT status_code, headers, body FROM responses "
+                "WHERE url = ? AND expires_at > ?",
+                (url, now),
+            ).fetchone()
+        if row is None:
+            return None
+        status_code, headers, body = row
+        return status_code, json.loads(headers), body
+
+    def set(
+        self,
+        url: str,
+        status_code: int,
+        headers: list[tuple[str, str]],
+        body: bytes,
+        expires_at: float,
+    ):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (url, expires_at, status_code, json.dumps(headers), body),
+            )
+
+    def expire(self, now: float) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "DELETE FROM responses WHERE expires_at <= ?", (now,)
+            ).rowcount
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, stored_bytes = self._connection.execute(
+                "SELECT count(*), coalesce(sum(length(body)), 0) FROM responses"
+            ).fetchone()
+        return {"path": self.path, "entries": entries, "stored_bytes": stored_bytes}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class CachingTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps the transport under an httpx client, answering GETs for endpoints in
+    `ttls` from `cache` and storing successful responses from upstream.
+    Sits under the web API's Phoebe client only, bird calls and piper poll
+    eBird for what's new and go straight to it.
+
+    Requests carrying CACHE_REFRESH_HEADER skip the lookup and go upstream.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        cache: SQLiteResponseCache,
+        ttls: list[tuple[re.Pattern[str], float]] = EBIRD_CACHE_TTLS,
+        clock: Callable[[], float] = time.time,
+    ):
+        self._transport = transport
+        self._cache = cache
+        self._ttls = ttls
+        self._clock = clock
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.refreshed = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        refresh = request.headers.pop(CACHE_REFRESH_HEADER, None) is not None
+        ttl_seconds = get_ttl_for_url(request.url, self._clock(), self._ttls)
+        if request.method != "GET" or ttl_seconds is None:
+            self.bypassed += 1
+            return await self._transport.handle_async_request(request)
+
+        url = str(request.url)
+        if refresh:
+            self.refreshed += 1
+        else:
+            # sqlite does blocking file IO, and the taxonomy is several MB
+            cached = await asyncio.to_thread(self._cache.get, url, self._clock())
+            if cached is not None:
+                self.hits += 1
+                status_code, headers, body = cached
+                return httpx.Response(
+                    status_code, headers=headers, content=body, request=request
+                )
+            self.misses += 1
+
+        response = await self._transport.handle_async_request(request)
+        if response.status_code != 200:
+            return response
+
+        try:
+            body = await response.aread()
+        finally:
+            await response.aclose()
+        headers = [
+            (name, value)
+            for name, value in response.headers.items()
+            if name.lower() not in _DROPPED_HEADERS
+        ]
+        await asyncio.to_thread(
+            self._cache.set,
+            url,
+            response.status_code,
+            headers,
+            body,
+            self._clock() + ttl_seconds,
+        )
+        return httpx.Response(
+            response.status_code, headers=headers, content=body, request=request
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+    def expire(self) -> int:
+        return self._cache.expire(self._clock())
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            **self._cache.get_stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bypassed": self.bypassed,
+            "refreshed": self.refreshed,
+        }
+
+
+def get_ebird_http_cache_from_env() -> SQLiteResponseCache | None:
+    """
+    EBIRD_HTTP_CACHE_PATH points every worker at one SQLite file of eBird
+    responses, so restarts and other workers reuse what's already been
+    fetched. Unset, responses are only cached in process.
+    """
+    path = os.getenv("EBIRD_HTTP_CACHE_PATH")
+    if not path:
+        return None
+    return SQLiteResponseCache(path)
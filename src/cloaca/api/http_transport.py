@@ -0,0 +1,77 @@
+import time
+from typing import Any, Callable, Dict
+
+import httpx
+
+
+class ConnectionMetricsTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps an httpx transport and counts, via httpcore's trace extension,
+    whether each request opened a new connection or reused a pooled one, and
+    how long it waited for one, ie queued for a free slot in the pool.
+    Opening the connection itself isn't counted as waiting.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self._transport = transport
+        self._clock = clock
+
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.pool_wait_seconds_total = 0.0
+        self.pool_wait_seconds_max = 0.0
+
+    def _record(self, opened_connection: bool, pool_wait_seconds: float):
+        if opened_connection:
+            self.new_connections += 1
+        else:
+            self.reused_connections += 1
+        self.pool_wait_seconds_total += pool_wait_seconds
+        self.pool_wait_seconds_max = max(self.pool_wait_seconds_max, pool_wait_seconds)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        started = self._clock()
+        outer_trace = request.extensions.get("trace")
+        recorded = False
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            nonlocal recorded
+            # the first thing a request does once it has a connection is
+            # either open it or start sending on it
+            if not recorded and event_name in (
+                "connection.connect_tcp.started",
+                "http11.send_request_headers.started",
+                "http2.send_request_headers.started",
+            ):
+                recorded = True
+                self._record(
+                    event_name == "connection.connect_tcp.started",
+                    self._clock() - started,
+                )
+            if outer_trace is not None:
+                await outer_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        connected = self.new_connections + self.reused_connections
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "reuse_rate": self.reused_connections / connected if connected else 0.0,
+            "pool_wait_seconds_avg": (
+                self.pool_wait_seconds_total / connected if connected else 0.0
+            ),
+            "pool_wait_seconds_max": self.pool_wait_seconds_max,
+        }
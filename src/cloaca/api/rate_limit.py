@@ -0,0 +1,70 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+from phoebe_bird import APIConnectionError, InternalServerError, RateLimitError
+
+T = TypeVar("T")
+
+# errors worth retrying against eBird: timeouts / dropped connections, 429s and 5xxs
+TRANSIENT_EBIRD_ERRORS: tuple[type[Exception], ...] = (
+    APIConnectionError,
+    RateLimitError,
+    InternalServerError,
+)
+
+
+class TokenBucket:
+    """Async token bucket: allows `rate_per_second` calls on average, bursting to `capacity`."""
+
+    def __init__(
+        self,
+        rate_per_second: float,
+        capacity: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity if capacity is not None else max(rate_per_second, 1)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._updated_at
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate_per_second)
+        self._updated_at = now
+
+    async def acquire(self):
+        # the lock makes waiters queue up in order instead of all waking at once
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate_per_second)
+                self._refill()
+            self._tokens -= 1
+
+
+async def retry_with_jitter(
+    fn: Callable[[], Awaitable[T]],
+    attempts: int = 3,
+    base_delay_seconds: float = 0.5,
+    max_delay_seconds: float = 8,
+    retry_on: tuple[type[Exception], ...] = TRANSIENT_EBIRD_ERRORS,
+) -> T:
+    """Call `fn` until it succeeds, sleeping with full jitter exponential backoff between attempts."""
+    for attempt in range(attempts):
+        try:
+            return await fn()
+        except retry_on as e:
+            if attempt == attempts - 1:
+                raise
+            delay = random.uniform(
+                0, min(max_delay_seconds, base_delay_seconds * 2**attempt)
+            )
+            print(f"Attempt {attempt + 1} failed ({e!r}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    raise RuntimeError("retry_with_jitter needs at least one attempt")
@@ -1,6 +1,12 @@
+import asyncio
 import os
-from typing import Dict, List
-from phoebe_bird import AsyncPhoebe
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List
+
+import httpx
+import pandas as pd
+from phoebe_bird import AsyncPhoebe, DefaultAsyncHttpxClient
 
 from dotenv import load_dotenv
 
@@ -9,15 +15,176 @@ from phoebe_bird.types.ref.taxonomy.ebird_retrieve_response import (
     EbirdRetrieveResponseItem as EbirdTaxonomyItem,
 )
 
+from cloaca.api.http_cache import (
+    CACHE_REFRESH_HEADER,
+    CachingTransport,
+    SQLiteResponseCache,
+    get_ebird_http_cache_from_env,
+)
+from cloaca.api.http_transport import ConnectionMetricsTransport
+from cloaca.single_flight import SingleFlight
+from cloaca.species_index import SpeciesIndex
+from cloaca.ttl_cache import TTLCache
+
 load_dotenv()
 
-phoebe_client = AsyncPhoebe(
-    api_key=os.environ.get("EBIRD_API_KEY"),
+
+@dataclass
+class EbirdTransportConfig:
+    # the Phoebe SDK's own defaults
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry_seconds: float = 5
+    http2: bool = False
+    timeout_seconds: float = 60
+    connect_timeout_seconds: float = 5
+    max_retries: int = 2
+
+    @classmethod
+    def from_env(cls) -> "EbirdTransportConfig":
+        defaults = cls()
+        return cls(
+            max_connections=int(
+                os.getenv("EBIRD_MAX_CONNECTIONS", defaults.max_connections)
+            ),
+            max_keepalive_connections=int(
+                os.getenv(
+                    "EBIRD_MAX_KEEPALIVE_CONNECTIONS",
+                    defaults.max_keepalive_connections,
+                )
+            ),
+            keepalive_expiry_seconds=float(
+                os.getenv(
+                    "EBIRD_KEEPALIVE_EXPIRY_SECONDS", defaults.keepalive_expiry_seconds
+                )
+            ),
+            http2=os.getenv("EBIRD_HTTP2", "false").lower() in ("1", "true"),
+            timeout_seconds=float(
+                os.getenv("EBIRD_TIMEOUT_SECONDS", defaults.timeout_seconds)
+            ),
+            connect_timeout_seconds=float(
+                os.getenv(
+                    "EBIRD_CONNECT_TIMEOUT_SECONDS", defaults.connect_timeout_seconds
+                )
+            ),
+            max_retries=int(os.getenv("EBIRD_MAX_RETRIES", defaults.max_retries)),
+        )
+
+
+def create_ebird_transport(
+    config: EbirdTransportConfig,
+) -> httpx.AsyncHTTPTransport:
+    limits = httpx.Limits(
+        max_connections=config.max_connections,
+        max_keepalive_connections=config.max_keepalive_connections,
+        keepalive_expiry=config.keepalive_expiry_seconds,
+    )
+    if config.http2:
+        try:
+            return httpx.AsyncHTTPTransport(limits=limits, http2=True)
+        except ImportError as e:
+            # http2 needs the optional h2 package (httpx[http2])
+            print(f"EBIRD_HTTP2 set but HTTP/2 isn't available, using HTTP/1.1: {e}")
+    return httpx.AsyncHTTPTransport(limits=limits)
+
+
+def create_phoebe_client(
+    config: EbirdTransportConfig,
+    http_cache: SQLiteResponseCache | None = None,
+) -> tuple[
+    AsyncPhoebe, AsyncPhoebe, ConnectionMetricsTransport, CachingTransport | None
+]:
+    """
+    Two eBird clients on one pool of keep-alive connections sized by `config`
+    and instrumented: one that always goes to eBird (bird calls, piper,
+    scripts), and one for the web API's lookups that's answered from the
+    persistent response cache when there is one.
+    """
+    metrics_transport = ConnectionMetricsTransport(create_ebird_transport(config))
+    cache_transport = (
+        CachingTransport(metrics_transport, http_cache) if http_cache else None
+    )
+
+    def client_on(transport: httpx.AsyncBaseTransport) -> AsyncPhoebe:
+        return AsyncPhoebe(
+            api_key=os.environ.get("EBIRD_API_KEY"),
+            max_retries=config.max_retries,
+            http_client=DefaultAsyncHttpxClient(
+                transport=transport,
+                timeout=httpx.Timeout(
+                    config.timeout_seconds, connect=config.connect_timeout_seconds
+                ),
+            ),
+        )
+
+    client = client_on(metrics_transport)
+    cached_client = client_on(cache_transport) if cache_transport else client
+    return client, cached_client, metrics_transport, cache_transport
+
+
+ebird_transport_config = EbirdTransportConfig.from_env()
+(
+    phoebe_client,
+    cached_phoebe_client,
+    ebird_connection_metrics,
+    # eBird responses persisted across restarts / workers, when configured
+    ebird_http_cache_transport,
+) = create_phoebe_client(ebird_transport_config, get_ebird_http_cache_from_env())
+
+# eBird's recent observations move slowly, so past the TTL an entry is still
+# served for up to the stale window while it's refreshed in the background
+nearby_observations_ttl_seconds = float(
+    os.getenv("NEARBY_OBSERVATIONS_TTL_SECONDS", str(30 * 60))
+)
+nearby_observations_stale_seconds = float(
+    os.getenv("NEARBY_OBSERVATIONS_STALE_SECONDS", str(30 * 60))
+)
+nearby_observation_cache: TTLCache[str, List[PhoebeObservation]] = TTLCache(
+    max_entries=int(os.getenv("NEARBY_OBSERVATIONS_CACHE_MAX_ENTRIES", "1024")),
+    ttl_seconds=nearby_observations_ttl_seconds,
+    stale_seconds=nearby_observations_stale_seconds,
+)
+# one entry per (species, half degree cell), so many more of them
+cached_species_obs: TTLCache[str, List[PhoebeObservation]] = TTLCache(
+    max_entries=int(os.getenv("SPECIES_OBSERVATIONS_CACHE_MAX_ENTRIES", "16384")),
+    ttl_seconds=nearby_observations_ttl_seconds,
+    stale_seconds=nearby_observations_stale_seconds,
+)
+# concurrent misses for the same key (eg several users at the same park)
+# share one eBird request
+nearby_observation_fetches: SingleFlight[str, List[PhoebeObservation]] = SingleFlight()
+species_observation_fetches: SingleFlight[str, List[PhoebeObservation]] = SingleFlight()
+# every per species response is also indexed, so get_nearby_observations can
+# answer lookups it fully covers without going back to eBird
+recent_species_index = SpeciesIndex(
+    max_age_seconds=float(os.getenv("SPECIES_INDEX_MAX_AGE_SECONDS", str(2 * 60 * 60)))
+)
+# radius of the nearby eBird queries
+NEARBY_OBSERVATIONS_DISTANCE_KM = 50
+# nearby / per species requests in flight to eBird across every user request,
+# so one user with a 300 species gap can't trip eBird's rate limits for everyone
+ebird_request_slots = asyncio.Semaphore(
+    int(os.getenv("EBIRD_MAX_CONCURRENT_REQUESTS", "16"))
 )
+# background refreshes of stale entries, kept so they aren't garbage collected
+_revalidations: set[asyncio.Task] = set()
 
-nearby_observation_cache: Dict[str, List[PhoebeObservation]] = {}
-cached_species_obs: Dict[str, List[PhoebeObservation]] = {}
-ebirdTaxonomy: Dict[str, EbirdTaxonomyItem] = {}
+
+@dataclass(slots=True, frozen=True)
+class TaxonInfo:
+    species_code: str
+    taxon_order: int | None
+    sci_name: str | None
+    com_name: str | None
+    species_group: str | None
+
+
+# species code -> TaxonInfo. loaded from the bundled snapshot at startup and
+# replaced wholesale by refresh_taxonomy_from_ebird
+taxonomy_lookup: Dict[str, TaxonInfo] = {}
+# concurrent refreshes (eg the daily one and a cold ensure_taxonomy) share
+# one download, and cold ensure_taxonomy calls share one snapshot load
+taxonomy_refreshes: SingleFlight[str, None] = SingleFlight()
 
 unwanted_scientific_names = [
     "Columba livia",  # non feral rock pigeon
@@ -28,36 +195,81 @@ def get_phoebe_client():
     return phoebe_client
 
 
-async def shared_clear_nearby_observations_cache():
-    nearby_observation_cache.clear()
-    cached_species_obs.clear()
+def get_cached_phoebe_client():
+    return cached_phoebe_client
+
+
+def get_ebird_cache_refresh_headers() -> Dict[str, str]:
+    """`extra_headers` for eBird requests that mustn't be answered from the persistent cache."""
+    if ebird_http_cache_transport is None:
+        return {}
+    return {CACHE_REFRESH_HEADER: "1"}
+
+
+def _finish_revalidation(task: asyncio.Task):
+    _revalidations.discard(task)
+    if not task.cancelled() and (error := task.exception()):
+        print("Error refreshing stale observations, keeping them:", error)
+
+
+async def _get_or_fetch_observations(
+    cache: TTLCache[str, List[PhoebeObservation]],
+    fetches: SingleFlight[str, List[PhoebeObservation]],
+    key: str,
+    # called with whether it's a revalidation, which has to get past the
+    # persistent cache to actually find anything newer
+    fetch: Callable[[bool], Awaitable[List[PhoebeObservation]]],
+) -> List[PhoebeObservation]:
+    entry = cache.get_allow_stale(key)
+    if entry is None:
+        return await fetches.run(key, lambda: fetch(False))
+
+    observations, is_stale = entry
+    if is_stale and key not in fetches:
+        print("serving stale observations, refreshing", key)
+        task = asyncio.ensure_future(fetches.run(key, lambda: fetch(True)))
+        _revalidations.add(task)
+        task.add_done_callback(_finish_revalidation)
+    else:
+        print("hit cache!")
+    return observations
 
 
 async def fetch_nearby_observations_of_species_from_ebird_with_cache(
     species: str, latitude: float, longitude: float
 ) -> List[PhoebeObservation]:
     key = f"{species}-{latitude}-{longitude}"
-    cache_result = cached_species_obs.get(key, None)
-    if cache_result:
-        print("hit cache!")
-        return cache_result
-
-    print("fetching nearby observations of species", species)
 
-    observations = await phoebe_client.data.observations.nearest.geo_species.list(
-        species_code=species,
-        lat=latitude,
-        lng=longitude,
-        dist=50,
-        include_provisional=False,
+    async def fetch(refresh: bool) -> List[PhoebeObservation]:
+        print("fetching nearby observations of species", species)
+
+        async with ebird_request_slots:
+            observations = (
+                await cached_phoebe_client.data.observations.nearest.geo_species.list(
+                    species_code=species,
+                    lat=latitude,
+                    lng=longitude,
+                    dist=NEARBY_OBSERVATIONS_DISTANCE_KM,
+                    include_provisional=False,
+                    extra_headers=get_ebird_cache_refresh_headers()
+                    if refresh
+                    else None,
+                )
+            )
+
+        print(f"Fetched this many obs of species: {species}", len(observations))
+
+        cached_species_obs.set(key, observations)
+        recent_species_index.add(
+            species, latitude, longitude, NEARBY_OBSERVATIONS_DISTANCE_KM, observations
+        )
+
+        return observations
+
+    return await _get_or_fetch_observations(
+        cached_species_obs, species_observation_fetches, key, fetch
     )
 
-    print(f"Fetched this many obs of species: {species}", len(observations))
-
-    cached_species_obs[key] = observations
-
-    return observations
-
 
 def filter_out_unwanted_observations(observations: List[PhoebeObservation]):
     for observation in observations:
@@ -71,49 +283,197 @@ async def fetch_nearby_observations_from_ebird_with_cache(
 ):
     key = f"{latitude}-{longitude}"
     print(f"fetching nearby observations for {latitude}, {longitude}")
-    cache_result = nearby_observation_cache.get(key, None)
-    if cache_result:
-        print("hit cache!")
-        return cache_result
 
-    observations = await phoebe_client.data.observations.geo.recent.list(
-        lat=latitude, lng=longitude, dist=50, cat="species", include_provisional=False
+    async def fetch(refresh: bool) -> List[PhoebeObservation]:
+        async with ebird_request_slots:
+            observations = await cached_phoebe_client.data.observations.geo.recent.list(
+                lat=latitude,
+                lng=longitude,
+                dist=NEARBY_OBSERVATIONS_DISTANCE_KM,
+                cat="species",
+                include_provisional=False,
+                extra_headers=get_ebird_cache_refresh_headers() if refresh else None,
+            )
+
+        filter_out_unwanted_observations(observations)
+
+        print("Fetched this many obs:", len(observations))
+
+        nearby_observation_cache.set(key, observations)
+
+        return observations
+
+    return await _get_or_fetch_observations(
+        nearby_observation_cache, nearby_observation_fetches, key, fetch
     )
 
-    filter_out_unwanted_observations(observations)
 
-    print("Fetched this many obs:", len(observations))
+def get_ebird_transport_stats() -> Dict[str, Any]:
+    return {
+        "config": asdict(ebird_transport_config),
+        **ebird_connection_metrics.get_stats(),
+    }
 
-    nearby_observation_cache[key] = observations
 
-    return observations
+def get_ebird_http_cache_stats() -> Dict[str, Any]:
+    if ebird_http_cache_transport is None:
+        return {"enabled": False}
+    return {"enabled": True, **ebird_http_cache_transport.get_stats()}
+
+
+def expire_ebird_http_cache() -> int:
+    if ebird_http_cache_transport is None:
+        return 0
+    return ebird_http_cache_transport.expire()
+
+
+def get_ebird_fetch_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        "nearby_observations": nearby_observation_fetches.get_stats(),
+        "species_observations": species_observation_fetches.get_stats(),
+        "taxonomy": taxonomy_refreshes.get_stats(),
+    }
+
+
+def get_nearby_observation_cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        "nearby_observations": nearby_observation_cache.get_stats(),
+        "species_observations": cached_species_obs.get_stats(),
+        "revalidating": {"in_flight": len(_revalidations)},
+        "species_index": recent_species_index.get_stats(),
+    }
 
 
 def round_to_nearest_half(num):
     return round(num * 2) / 2
 
 
-async def fetch_ebird_taxonomy_with_cache():
-    if len(ebirdTaxonomy.keys()) == 0:
-        taxonomy_items = await phoebe_client.ref.taxonomy.ebird.retrieve(fmt="json")
-
-        print(f"Fetched {len(taxonomy_items)} taxonomy items")
+async def _fetch_ebird_taxonomy() -> List[EbirdTaxonomyItem]:
+    # a refresh, the day old copy in the persistent cache is what it's replacing
+    taxonomy_items = await cached_phoebe_client.ref.taxonomy.ebird.retrieve(
+        fmt="json", extra_headers=get_ebird_cache_refresh_headers()
+    )
+    print(f"Fetched {len(taxonomy_items)} taxonomy items")
+    return taxonomy_items
+
+
+def get_taxonomy_snapshot_path() -> Path:
+    # the same eBird taxonomy CSV build_parsed_db loads into the taxonomy table
+    return Path(
+        os.getenv(
+            "EBIRD_TAXONOMY_CSV",
+            Path(__file__).parent.parent
+            / "parsing/data/ebird_taxonomy/eBird_taxonomy_v2024.csv",
+        )
+    )
 
-        # loop through each taxonomy item and set the cache to its species code
-        for taxonomy_item in taxonomy_items:
-            if taxonomy_item.species_code in ebirdTaxonomy.keys():
-                # this shouldn't happpen!
-                print("Warning, species code reported multiple times in taxonomy!")
-            else:
-                if taxonomy_item.species_code is None:
-                    print(
-                        f"Warning, species code is none for ${taxonomy_item.sci_name}"
-                    )
-                    continue
-                ebirdTaxonomy[taxonomy_item.species_code] = taxonomy_item
 
-    return ebirdTaxonomy
+def _optional_str(value) -> str | None:
+    return None if pd.isna(value) else str(value)
 
 
-async def get_taxonomy_info_for_species_code(species_code: str) -> EbirdTaxonomyItem:
-    return (await fetch_ebird_taxonomy_with_cache())[species_code]
+def load_taxonomy_snapshot(path: Path | None = None) -> Dict[str, TaxonInfo]:
+    path = path or get_taxonomy_snapshot_path()
+    df = pd.read_csv(
+        path,
+        encoding="utf-8-sig",  # the eBird download starts with a BOM
+        dtype={"TAXON_ORDER": "Int64"},
+        usecols=[
+            "TAXON_ORDER",
+            "SPECIES_CODE",
+            "PRIMARY_COM_NAME",
+            "SCI_NAME",
+            "SPECIES_GROUP",
+        ],
+    )
+    df = df[df["SPECIES_CODE"].notna()]
+    lookup = {
+        species_code: TaxonInfo(
+            species_code=species_code,
+            taxon_order=None if pd.isna(taxon_order) else int(taxon_order),
+            sci_name=_optional_str(sci_name),
+            com_name=_optional_str(com_name),
+            species_group=_optional_str(species_group),
+        )
+        for species_code, taxon_order, sci_name, com_name, species_group in zip(
+            df["SPECIES_CODE"],
+            df["TAXON_ORDER"],
+            df["SCI_NAME"],
+            df["PRIMARY_COM_NAME"],
+            df["SPECIES_GROUP"],
+        )
+    }
+    print(f"Loaded {len(lookup)} taxa from {path}")
+    return lookup
+
+
+def taxonomy_items_to_lookup(
+    taxonomy_items: List[EbirdTaxonomyItem],
+    previous: Dict[str, TaxonInfo],
+) -> Dict[str, TaxonInfo]:
+    lookup: Dict[str, TaxonInfo] = {}
+    for item in taxonomy_items:
+        if item.species_code is None:
+            continue
+        # the API doesn't return species groups, keep the snapshot's when we
+        # have one and fall back to the family name
+        known = previous.get(item.species_code)
+        lookup[item.species_code] = TaxonInfo(
+            species_code=item.species_code,
+            # the API sends whole numbers as floats (16840.0)
+            taxon_order=(None if item.taxon_order is None else int(item.taxon_order)),
+            sci_name=item.sci_name,
+            com_name=item.com_name,
+            species_group=known.species_group if known else item.family_com_name,
+        )
+    return lookup
+
+
+def load_taxonomy_from_snapshot():
+    global taxonomy_lookup
+    taxonomy_lookup = load_taxonomy_snapshot()
+
+
+async def _refresh_taxonomy_from_ebird():
+    global taxonomy_lookup
+    taxonomy_items = await _fetch_ebird_taxonomy()
+    lookup = taxonomy_items_to_lookup(taxonomy_items, taxonomy_lookup)
+    if not lookup:
+        raise ValueError("eBird returned an empty taxonomy")
+    taxonomy_lookup = lookup
+
+
+async def refresh_taxonomy_from_ebird():
+    """Replace the lookup with eBird's current taxonomy, one download at a time."""
+    await taxonomy_refreshes.run("taxonomy", _refresh_taxonomy_from_ebird)
+
+
+async def ensure_taxonomy() -> Dict[str, TaxonInfo]:
+    if not taxonomy_lookup:
+        # normally done at startup, but don't make callers that beat it (or
+        # scripts that never run it) go to the network
+        try:
+            # ~17k rows of CSV, too slow to parse on the event loop. callers
+            # that show up meanwhile share the one parse
+            await taxonomy_refreshes.run(
+                "snapshot", lambda: asyncio.to_thread(load_taxonomy_from_snapshot)
+            )
+        except Exception as e:
+            print(f"Error loading taxonomy snapshot, fetching from eBird: {e}")
+            await refresh_taxonomy_from_ebird()
+    return taxonomy_lookup
+
+
+async def get_taxonomy_info_for_species_code(species_code: str) -> TaxonInfo:
+    taxonomy = await ensure_taxonomy()
+    taxon_info = taxonomy.get(species_code)
+    if taxon_info is None:
+        # eg a split newer than our snapshot, picked up by the next refresh
+        return TaxonInfo(
+            species_code=species_code,
+            taxon_order=None,
+            sci_name=None,
+            com_name=None,
+            species_group=None,
+        )
+    return taxon_info
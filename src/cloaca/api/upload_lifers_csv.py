@@ -1,3 +1,5 @@
+import asyncio
+
 from pydantic import BaseModel
 from cloaca.parsing.parse_ebird_personal_export import parse_csv_from_file_to_lifers
 from cloaca.parsing.parsing_helpers import HomeLocation
@@ -18,8 +20,9 @@ class UploadLifersResponse(BaseModel):
 async def upload_lifers_csv(file: UploadFile):
     print("Uploading file", file.filename)
 
-    # Parse the CSV to get lifers and home location
-    lifers, home_location = parse_csv_from_file_to_lifers(file)
+    # Parse the CSV to get lifers and home location. this streams the spooled
+    # upload in chunks, so do it on a worker thread to keep the loop free
+    lifers, home_location = await asyncio.to_thread(parse_csv_from_file_to_lifers, file)
 
     uuid4_str = str(uuid4())
 
@@ -9,6 +9,7 @@ from duckdb import DuckDBPyConnection
 import duckdb
 
 from cloaca.db.db import get_db_connection_with_path, report_table_stats
+from cloaca.db.popular_hotspots import GRID_CELL_DEGREES
 
 
 load_dotenv()
@@ -274,13 +275,18 @@ def drop_hotspots_richness_table(con):
 
 
 def create_localities_hotspots_table(con):
-    """Create optimized merged table combining localities and hotspot data."""
+    """Create optimized merged table combining localities and hotspot data.
+
+    Rows are bucketed into GRID_CELL_DEGREES lat/lng tiles and sorted by
+    (month, grid_lat, grid_lng) so that the popular hotspots query can skip
+    every row group outside of its bounding box.
+    """
     start = time.time()
     spinner = Spinner("Creating localities_hotspots optimization table")
     spinner.start()
 
     try:
-        create_table_query = """
+        create_table_query = f"""
             CREATE OR REPLACE TABLE localities_hotspots AS
             SELECT
             l.locality_id,
@@ -289,6 +295,8 @@ def create_localities_hotspots_table(con):
             l.LONGITUDE as longitude,
             l.locality_type,
             l.geometry,
+            CAST(floor(l.LATITUDE / {GRID_CELL_DEGREES}) AS INTEGER) as grid_lat,
+            CAST(floor(l.LONGITUDE / {GRID_CELL_DEGREES}) AS INTEGER) as grid_lng,
             hp.month,
             hp.avg_weekly_number_of_observations,
             hr.common_species,
@@ -301,7 +309,7 @@ def create_localities_hotspots_table(con):
             LEFT JOIN hotspots_richness hr using (locality_id_int)
             WHERE
             l.locality_type = 'H'
-            order by hp.month, l.geometry
+            order by hp.month, grid_lat, grid_lng, l.geometry
         """
         con.execute(create_table_query)
 
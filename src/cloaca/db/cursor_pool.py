@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+import duckdb
+
+T = TypeVar("T")
+
+
+class DuckDBCursorPool:
+    """
+    Runs DuckDB queries on a bounded thread pool so they don't block the event loop.
+
+    Each worker thread lazily opens its own cursor (`conn.cursor()`) on the shared
+    read-only connection and reuses it for every query it runs, so concurrent
+    requests don't serialize behind a single connection handle. Cursors don't
+    inherit `USE`, so pass `database` when the tables live in an attached
+    database rather than the connection's own.
+    """
+
+    def __init__(
+        self,
+        con: duckdb.DuckDBPyConnection,
+        max_workers: int = 4,
+        database: str | None = None,
+    ):
+        self.con = con
+        self.max_workers = max_workers
+        self.database = database
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="duckdb-cursor"
+        )
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cursors: list[duckdb.DuckDBPyConnection] = []
+
+        # metrics
+        self._queued = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._total_wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._total_run_seconds = 0.0
+
+    def _get_cursor(self) -> duckdb.DuckDBPyConnection:
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self.con.cursor()
+            if self.database is not None:
+                cursor.execute(f"USE {self.database}")
+            self._local.cursor = cursor
+            with self._lock:
+                self._cursors.append(cursor)
+        return cursor
+
+    def _run_in_worker(
+        self,
+        fn: Callable[..., T],
+        submitted_at: float,
+        args: tuple,
+    ) -> T:
+        started_at = time.perf_counter()
+        wait_seconds = started_at - submitted_at
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+            self._total_wait_seconds += wait_seconds
+            self._max_wait_seconds = max(self._max_wait_seconds, wait_seconds)
+
+        failed = False
+        try:
+            return fn(self._get_cursor(), *args)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._total_run_seconds += time.perf_counter() - started_at
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Call `fn(cursor, *args)` on a worker thread and await the result."""
+        with self._lock:
+            self._queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._run_in_worker, fn, time.perf_counter(), args
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "pool_size": self.max_workers,
+                "cursors_open": len(self._cursors),
+                "queued": self._queued,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_wait_ms": (
+                    self._total_wait_seconds / finished * 1000 if finished else 0.0
+                ),
+                "max_wait_ms": self._max_wait_seconds * 1000,
+                "avg_run_ms": (
+                    self._total_run_seconds / finished * 1000 if finished else 0.0
+                ),
+            }
+
+    def close(self):
+        """Wait for in-flight queries to finish, then close every cursor."""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for cursor in self._cursors:
+                try:
+                    cursor.close()
+                except Exception as e:
+                    print("Error closing DuckDB cursor:", e)
+            self._cursors.clear()
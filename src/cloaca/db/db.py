@@ -3,16 +3,18 @@ import os
 from tabulate import tabulate
 
 
-def get_db_connection_with_env(read_only: bool = True) -> duckdb.DuckDBPyConnection:
+def get_duck_db_path_from_env() -> str:
     try:
-        duck_db_path = os.environ["DUCK_DB_PATH"]
+        return os.environ["DUCK_DB_PATH"]
     except KeyError:
         raise RuntimeError(
             "DUCK_DB_PATH environment variable is required. "
             "Please set it to the path of your spatial database file."
         )
 
-    return get_db_connection_with_path(duck_db_path, read_only=read_only)
+
+def get_db_connection_with_env(read_only: bool = True) -> duckdb.DuckDBPyConnection:
+    return get_db_connection_with_path(get_duck_db_path_from_env(), read_only=read_only)
 
 
 def report_table_stats(con: duckdb.DuckDBPyConnection):
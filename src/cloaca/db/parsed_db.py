@@ -0,0 +1,103 @@
+import os
+import time
+from dataclasses import dataclass
+
+import duckdb
+
+from cloaca.db.cursor_pool import DuckDBCursorPool
+from cloaca.db.db import report_table_stats
+
+# the parsed db is attached under this name on an in-memory connection
+PARSED_DB_ALIAS = "parsed"
+
+# (device, inode, mtime, size): changes whenever build_parsed_db rewrites the
+# file in place or a new file is moved over it
+FileIdentity = tuple[int, int, int, int]
+
+
+def get_db_file_identity(duck_db_path: str) -> FileIdentity:
+    stat = os.stat(duck_db_path)
+    return (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+@dataclass
+class ParsedDb:
+    path: str
+    file_identity: FileIdentity
+    con: duckdb.DuckDBPyConnection
+    pool: DuckDBCursorPool
+
+    def close(self):
+        """Drain in-flight queries on the pool, then close the connection."""
+        self.pool.close()
+        try:
+            self.con.close()
+        except Exception as e:
+            print("Error closing DuckDB connection:", e)
+
+
+def warm_up_connection(con: duckdb.DuckDBPyConnection):
+    # touches the spatial extension and the localities_hotspots pages the
+    # popular hotspots query reads, so the first real request isn't cold
+    con.execute(
+        """
+        SELECT count(*)
+        FROM localities_hotspots
+        WHERE ST_Distance_Sphere(geometry, ST_Point(0, 0)) >= 0
+            AND avg_weekly_number_of_observations >= 0
+        """
+    ).fetchone()
+
+
+def connect_to_parsed_db_file(duck_db_path: str) -> duckdb.DuckDBPyConnection:
+    """
+    Open the file at `duck_db_path` read only, attached as `PARSED_DB_ALIAS`.
+
+    duckdb.connect(path) hands back the database instance it already has open
+    for that path, which after a rebuilt file is moved into place is still the
+    old file. ATTACH on a fresh in-memory connection always opens the file
+    that's at the path now.
+    """
+    if not os.path.exists(duck_db_path):
+        raise FileNotFoundError(f"Parsed DuckDB file not found at {duck_db_path}. ")
+
+    print(f"Attaching DuckDB at {duck_db_path} read only")
+    con = duckdb.connect(":memory:")
+    try:
+        con.install_extension("spatial")
+        con.load_extension("spatial")
+        quoted_path = duck_db_path.replace("'", "''")
+        con.execute(f"ATTACH '{quoted_path}' AS {PARSED_DB_ALIAS} (READ_ONLY)")
+        con.execute(f"USE {PARSED_DB_ALIAS}")
+        report_table_stats(con)
+    except Exception:
+        con.close()
+        raise
+    return con
+
+
+def open_parsed_db(duck_db_path: str, pool_size: int) -> ParsedDb:
+    """Open, verify and warm up a parsed DB so it's ready to be swapped in."""
+    start = time.time()
+    file_identity = get_db_file_identity(duck_db_path)
+    con = connect_to_parsed_db_file(duck_db_path)
+    try:
+        warm_up_connection(con)
+    except Exception:
+        con.close()
+        raise
+
+    print(f"Opened and warmed up {duck_db_path} in {time.time() - start:.3f}s")
+
+    return ParsedDb(
+        path=duck_db_path,
+        file_identity=file_identity,
+        con=con,
+        pool=DuckDBCursorPool(con, max_workers=pool_size, database=PARSED_DB_ALIAS),
+    )
+
+
+def parsed_db_needs_reload(current: ParsedDb | None, duck_db_path: str) -> bool:
+    if current is None or current.path != duck_db_path:
+        return True
+    return get_db_file_identity(duck_db_path) != current.file_identity
@@ -1,8 +1,79 @@
+import math
 import time
+from dataclasses import dataclass
 from typing import List, Dict, Any
 
 import duckdb
 
+from cloaca.geo import EARTH_RADIUS_KM
+
+# size (in degrees) of the lat/lng tiles that `build_parsed_db` buckets hotspots
+# into. 0.25 degrees is ~28km north/south, so a typical 25km radius lookup
+# only touches a handful of neighbouring cells.
+GRID_CELL_DEGREES = 0.25
+
+# on the same sphere ST_Distance_Sphere measures on (~111.195km), so the box
+# is never narrower than the circle it's prefiltering for
+KM_PER_DEGREE_LATITUDE = math.radians(1) * EARTH_RADIUS_KM
+# widen the box a little more, so float rounding can't clip hotspots on the edge
+SEARCH_BOUNDS_PADDING = 1.001
+
+
+@dataclass
+class HotspotSearchBounds:
+    min_latitude: float
+    max_latitude: float
+    min_longitude: float
+    max_longitude: float
+    min_grid_lat: int
+    max_grid_lat: int
+    min_grid_lng: int
+    max_grid_lng: int
+
+
+def grid_cell_for_coordinate(degrees: float) -> int:
+    return math.floor(degrees / GRID_CELL_DEGREES)
+
+
+def get_hotspot_search_bounds(
+    latitude: float, longitude: float, radius_km: float
+) -> HotspotSearchBounds:
+    """
+    Bounding box (in degrees and in grid cells) that fully contains the search
+    circle. It's only a prefilter: ST_Distance_Sphere still does the exact check.
+    """
+    latitude_delta = radius_km / KM_PER_DEGREE_LATITUDE * SEARCH_BOUNDS_PADDING
+    min_latitude = max(latitude - latitude_delta, -90.0)
+    max_latitude = min(latitude + latitude_delta, 90.0)
+
+    # a degree of longitude shrinks towards the poles, so use the widest
+    # latitude in the box to make sure we never clip the circle
+    widest_latitude = max(abs(min_latitude), abs(max_latitude))
+    km_per_degree_longitude = KM_PER_DEGREE_LATITUDE * math.cos(
+        math.radians(widest_latitude)
+    )
+    longitude_delta = (
+        radius_km / km_per_degree_longitude * SEARCH_BOUNDS_PADDING
+        if km_per_degree_longitude > 0
+        else 360
+    )
+    min_longitude = longitude - longitude_delta
+    max_longitude = longitude + longitude_delta
+    if min_longitude < -180 or max_longitude > 180:
+        # the box wraps around the antimeridian (or a pole), don't prefilter on longitude
+        min_longitude, max_longitude = -180.0, 180.0
+
+    return HotspotSearchBounds(
+        min_latitude=min_latitude,
+        max_latitude=max_latitude,
+        min_longitude=min_longitude,
+        max_longitude=max_longitude,
+        min_grid_lat=grid_cell_for_coordinate(min_latitude),
+        max_grid_lat=grid_cell_for_coordinate(max_latitude),
+        min_grid_lng=grid_cell_for_coordinate(min_longitude),
+        max_grid_lng=grid_cell_for_coordinate(max_longitude),
+    )
+
 
 class PopularHotspotResult:
     def __init__(
@@ -44,6 +115,83 @@ class PopularHotspotResult:
         return result
 
 
+# the busiest this many hotspots are returned per lookup
+POPULAR_HOTSPOTS_LIMIT = 1000
+
+# every hotspot in the circle, busiest first
+_POPULAR_HOTSPOTS_IN_CIRCLE_QUERY = """
+SELECT
+    locality_id,
+    locality_name,
+    latitude,
+    longitude,
+    avg_weekly_number_of_observations as avg_weekly_checklists,
+    common_species as likely_common_species_count,
+    std_error as likely_common_species_std_error,
+    uncommon_species as likely_uncommon_species_count,
+    common_and_uncommon_species as likely_common_and_uncommon_species_count
+FROM localities_hotspots
+WHERE month = ?
+    -- grid cells + bounding box let DuckDB skip row groups outside the search area
+    AND grid_lat BETWEEN ? AND ?
+    AND grid_lng BETWEEN ? AND ?
+    AND latitude BETWEEN ? AND ?
+    AND longitude BETWEEN ? AND ?
+    AND ST_Distance_Sphere(geometry, ST_Point(?, ?)) <= ?  -- Great circle distance in meters
+    AND avg_weekly_number_of_observations >= 1
+-- locality_id breaks ties, so a capped result doesn't depend on scan order
+ORDER BY avg_weekly_number_of_observations DESC, locality_id
+"""
+
+POPULAR_HOTSPOTS_QUERY = f"""{_POPULAR_HOTSPOTS_IN_CIRCLE_QUERY}
+limit {POPULAR_HOTSPOTS_LIMIT}
+"""
+
+# one row per hotspot with its location, for callers that filter the rows
+# further before joining the objects into an array. not capped at
+# POPULAR_HOTSPOTS_LIMIT, since the cap has to come after that filter
+POPULAR_HOTSPOTS_JSON_ROWS_QUERY = f"""
+WITH hotspots AS ({_POPULAR_HOTSPOTS_IN_CIRCLE_QUERY})
+SELECT latitude, longitude, to_json({{
+    'locality_id': locality_id,
+    'locality_name': locality_name,
+    'latitude': latitude,
+    'longitude': longitude,
+    'avg_weekly_checklists': avg_weekly_checklists,
+    'likely_common_species_count': likely_common_species_count,
+    'likely_common_species_std_error': likely_common_species_std_error,
+    'likely_uncommon_species_count': likely_uncommon_species_count,
+    'likely_common_and_uncommon_species_count': likely_common_and_uncommon_species_count
+}})::VARCHAR
+FROM hotspots
+ORDER BY avg_weekly_checklists DESC, locality_id
+"""
+
+
+def get_popular_hotspots_query_params(
+    latitude: float, longitude: float, radius_km: float, month: int
+) -> list:
+    bounds = get_hotspot_search_bounds(latitude, longitude, radius_km)
+
+    # Convert km to meters for the query
+    radius_meters = radius_km * 1000
+    # Note: ST_Distance_Sphere expects [latitude, longitude] axis order per docs
+    return [
+        month,
+        bounds.min_grid_lat,
+        bounds.max_grid_lat,
+        bounds.min_grid_lng,
+        bounds.max_grid_lng,
+        bounds.min_latitude,
+        bounds.max_latitude,
+        bounds.min_longitude,
+        bounds.max_longitude,
+        latitude,
+        longitude,
+        radius_meters,
+    ]
+
+
 def get_popular_hotspots(
     con: duckdb.DuckDBPyConnection,
     latitude: float,
@@ -52,35 +200,15 @@ def get_popular_hotspots(
     month: int,
 ) -> List[PopularHotspotResult]:
     try:
-        query = """
-        SELECT 
-            locality_id,
-            locality_name,
-            latitude,
-            longitude,
-            avg_weekly_number_of_observations,
-            common_species as likely_common_species_count,
-            std_error as likely_common_species_std_error,
-            uncommon_species as likely_uncommon_species_count,
-            common_and_uncommon_species as likely_common_and_uncommon_species_count
-        FROM localities_hotspots
-        WHERE ST_Distance_Sphere(geometry, ST_Point(?, ?)) <= ?  -- Great circle distance in meters
-            AND month = ?
-            AND avg_weekly_number_of_observations >= 1
-        ORDER BY avg_weekly_number_of_observations DESC
-        limit 1000
-        """
-
         print(
             f"Executing optimized get_popular_hotspots with lat: {latitude}, lon: {longitude}, radius: {radius_km}km, month: {month}"
         )
 
-        # Convert km to meters for the query
-        radius_meters = radius_km * 1000
-        # Note: ST_Distance_Sphere expects [latitude, longitude] axis order per docs
-        params = [latitude, longitude, radius_meters, month]
+        params = get_popular_hotspots_query_params(
+            latitude, longitude, radius_km, month
+        )
         query_start_time = time.time()
-        result = con.execute(query, params).fetchall()
+        result = con.execute(POPULAR_HOTSPOTS_QUERY, params).fetchall()
         query_end_time = time.time()
         print(
             f"[DuckDB Spatial] Query execution took {query_end_time - query_start_time:.3f}s, returned {len(result)} rows"
@@ -110,3 +238,34 @@ def get_popular_hotspots(
         return []
 
     return hotspots
+
+
+def get_popular_hotspots_json_rows(
+    con: duckdb.DuckDBPyConnection,
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    month: int,
+) -> List[tuple[float, float, str]]:
+    """
+    Every hotspot get_popular_hotspots would consider, as (latitude, longitude,
+    JSON object) per hotspot, busiest first. DuckDB serializes each object
+    with the same keys as PopularHotspotResult.to_dict, so no python object
+    is built per row. It's up to the caller to keep the first
+    POPULAR_HOTSPOTS_LIMIT and join the objects with "," inside "[...]".
+
+    Errors aren't swallowed: callers cache the result, and an empty list
+    would stick around long after a transient failure.
+    """
+    print(
+        f"Executing get_popular_hotspots_json_rows with lat: {latitude}, lon: {longitude}, radius: {radius_km}km, month: {month}"
+    )
+
+    params = get_popular_hotspots_query_params(latitude, longitude, radius_km, month)
+    query_start_time = time.time()
+    result = con.execute(POPULAR_HOTSPOTS_JSON_ROWS_QUERY, params).fetchall()
+    print(
+        f"[DuckDB Spatial] JSON rows query execution took {time.time() - query_start_time:.3f}s, returned {len(result)} rows"
+    )
+
+    return result
@@ -0,0 +1,17 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def distance_km(
+    latitude_a: float, longitude_a: float, latitude_b: float, longitude_b: float
+) -> float:
+    """Great circle (haversine) distance between two points."""
+    lat_a, lat_b = math.radians(latitude_a), math.radians(latitude_b)
+    d_lat = lat_b - lat_a
+    d_lng = math.radians(longitude_b - longitude_a)
+    a = (
+        math.sin(d_lat / 2) ** 2
+        + math.cos(lat_a) * math.cos(lat_b) * math.sin(d_lng / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
@@ -1,33 +1,56 @@
 import asyncio
+import json
 import os
 import time
+from dataclasses import asdict
 from typing import Dict, List, Any
 
-import duckdb
-
 from cloaca.api.bird_calls.get_audio_file import get_audio_file
 from cloaca.api.bird_calls.get_bird_call import get_bird_call
 from cloaca.api.get_lifers_by_location import get_lifers_by_location
 from cloaca.api.get_nearby_observations import (
-    clear_nearby_observations_cache,
     get_nearby_observations,
+    get_nearby_species_lookup_stats,
+    stream_nearby_observations,
 )
 from cloaca.api.get_new_lifers_by_region import (
     get_filtered_lifers_for_region,
+    get_last_regional_mapping_refresh,
     get_regional_mapping,
+    load_regional_mapping_from_snapshot,
+)
+from cloaca.api.get_popular_hotspots import (
+    PopularHotspot,
+    clear_popular_hotspots_cache,
+    get_popular_hotspots_json_api,
+    popular_hotspots_cache,
 )
-from cloaca.api.get_popular_hotspots import get_popular_hotspots_api
 
+from cloaca.api.shared import (
+    expire_ebird_http_cache,
+    get_ebird_fetch_stats,
+    get_ebird_http_cache_stats,
+    get_ebird_transport_stats,
+    get_nearby_observation_cache_stats,
+    load_taxonomy_from_snapshot,
+    recent_species_index,
+    refresh_taxonomy_from_ebird,
+)
 from cloaca.api.upload_lifers_csv import UploadLifersResponse, upload_lifers_csv
 from cloaca.parsing.parsing_helpers import Lifer, LocationToLifers
+from cloaca.types import csv_upload_cache
+from cloaca.warm_up import WarmUpReport, get_warm_up_popular_hotspots_queries
 
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_utilities import repeat_every
 
 
-from fastapi import FastAPI, Request, UploadFile
+from fastapi import FastAPI, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
 
-from cloaca.db.db import get_db_connection_with_env
+from cloaca.db.cursor_pool import DuckDBCursorPool
+from cloaca.db.db import get_duck_db_path_from_env
+from cloaca.db.parsed_db import ParsedDb, open_parsed_db, parsed_db_needs_reload
 
 
 Cloaca_App = FastAPI()
@@ -48,6 +71,9 @@ if env := os.getenv("ENVIRONMENT"):
     else:
         is_dev = False
 
+# number of worker threads (each with its own cursor) serving DuckDB queries
+duck_db_pool_size = int(os.getenv("DUCK_DB_POOL_SIZE", "4"))
+
 
 @Cloaca_App.middleware("http")
 async def add_process_time_header(request: Request, call_next):
@@ -55,6 +81,7 @@ async def add_process_time_header(request: Request, call_next):
     response = await call_next(request)
     excluded_paths = [
         "/v1/health",
+        "/v1/ready",
     ]
     if request.url.path not in excluded_paths:
         print(
@@ -65,11 +92,30 @@ async def add_process_time_header(request: Request, call_next):
     return response
 
 
+# liveness: the process is up and serving
 @Cloaca_App.get("/v1/health")
 def health_check() -> Dict[str, str]:
     return {"status": "SQUAWK"}
 
 
+# readiness: warm up has finished and there's a parsed db to query, so it's
+# worth routing traffic here. 503 (with progress so far) until then
+@Cloaca_App.get("/v1/ready")
+def readiness_check(response: Response) -> Dict[str, Any]:
+    parsed_db = getattr(Cloaca_App.state, "parsed_db", None)
+    ready = (
+        _warm_up_report is not None
+        and _warm_up_report.finished
+        and parsed_db is not None
+    )
+    if not ready:
+        response.status_code = 503
+    return {
+        "status": "ready" if ready else "warming up",
+        "warm_up": asdict(_warm_up_report) if _warm_up_report else None,
+    }
+
+
 @Cloaca_App.get("/v1/nearby_observations")
 async def get_nearby_observations_api(
     latitude: float, longitude: float, file_id: str
@@ -77,6 +123,29 @@ async def get_nearby_observations_api(
     return await get_nearby_observations(latitude, longitude, file_id)
 
 
+# newline delimited JSON, one {location_id: LocationToLifers} chunk per species
+# as its lookup resolves, for clients that want to render incrementally
+@Cloaca_App.get("/v1/nearby_observations/stream")
+async def stream_nearby_observations_api(
+    latitude: float, longitude: float, file_id: str
+) -> StreamingResponse:
+    chunks = await stream_nearby_observations(latitude, longitude, file_id)
+
+    async def lines():
+        async for lifers_by_location in chunks:
+            yield (
+                json.dumps(
+                    {
+                        location_id: asdict(location_to_lifers)
+                        for location_id, location_to_lifers in lifers_by_location.items()
+                    }
+                )
+                + "\n"
+            )
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @Cloaca_App.get("/v1/lifers_by_location")
 async def get_lifers_by_location_api(
     latitude: float, longitude: float, file_id: str
@@ -103,33 +172,89 @@ async def get_bird_call_audio_file(location_code: str | None):
 
 @Cloaca_App.get("/v1/regional_new_potential_lifers")
 async def regional_lifers(
-    latitude: float, longitude: float, file_id: str
+    latitude: float, longitude: float, file_id: str, include_neighbors: bool = False
 ) -> list[Lifer]:
     if is_dev:
         print("not fetching regional lifers in dev mode")
         return []
-    regional_lifers = await get_filtered_lifers_for_region(latitude, longitude, file_id)
+    regional_lifers = await get_filtered_lifers_for_region(
+        latitude, longitude, file_id, include_neighbors
+    )
 
     print("returning", len(regional_lifers), "regional lifers")
 
     return regional_lifers
 
 
-def get_duck_db_conn_from_state() -> duckdb.DuckDBPyConnection:
-    return Cloaca_App.state.duck_db_conn
+def get_duck_db_pool_from_state() -> DuckDBCursorPool:
+    parsed_db: ParsedDb = Cloaca_App.state.parsed_db
+    return parsed_db.pool
 
 
-@Cloaca_App.get("/v1/popular_hotspots")
+# the JSON is built by DuckDB, so return it as-is instead of letting FastAPI
+# re-validate every row. response_model still documents the shape.
+@Cloaca_App.get("/v1/popular_hotspots", response_model=List[PopularHotspot])
 async def get_popular_hotspots_endpoint(
     latitude: float, longitude: float, radius_km: float, month: int
-) -> List[Dict[str, Any]]:
-    return await get_popular_hotspots_api(
-        get_duck_db_conn_from_state(), latitude, longitude, radius_km, month
+) -> Response:
+    hotspots_json = await get_popular_hotspots_json_api(
+        get_duck_db_pool_from_state(), latitude, longitude, radius_km, month
     )
+    return Response(content=hotspots_json, media_type="application/json")
+
+
+@Cloaca_App.get("/v1/metrics/duck_db_pool")
+def duck_db_pool_metrics() -> Dict[str, Any]:
+    return get_duck_db_pool_from_state().get_stats()
+
+
+@Cloaca_App.get("/v1/metrics/upload_cache")
+def upload_cache_metrics() -> Dict[str, Any]:
+    return csv_upload_cache.get_stats()
+
+
+@Cloaca_App.get("/v1/metrics/regional_mapping")
+def regional_mapping_metrics() -> Dict[str, Any]:
+    report = get_last_regional_mapping_refresh()
+    return asdict(report) if report else {}
+
+
+@Cloaca_App.get("/v1/metrics/ebird_fetches")
+def ebird_fetches_metrics() -> Dict[str, Any]:
+    return get_ebird_fetch_stats()
+
+
+@Cloaca_App.get("/v1/metrics/ebird_transport")
+def ebird_transport_metrics() -> Dict[str, Any]:
+    return get_ebird_transport_stats()
+
+
+@Cloaca_App.get("/v1/metrics/ebird_http_cache")
+def ebird_http_cache_metrics() -> Dict[str, Any]:
+    return get_ebird_http_cache_stats()
+
+
+@Cloaca_App.get("/v1/metrics/nearby_observations_cache")
+def nearby_observations_cache_metrics() -> Dict[str, Any]:
+    return get_nearby_observation_cache_stats()
+
+
+@Cloaca_App.get("/v1/metrics/nearby_species_lookups")
+def nearby_species_lookups_metrics() -> Dict[str, Any]:
+    return get_nearby_species_lookup_stats()
+
+
+@Cloaca_App.get("/v1/metrics/popular_hotspots_cache")
+def popular_hotspots_cache_metrics() -> Dict[str, Any]:
+    return popular_hotspots_cache.get_stats()
 
 
 # this is deprecated but I can't find another way to use the "repeat every" util without it
 _piper_task: asyncio.Task | None = None
+_warm_up_task: asyncio.Task | None = None
+_warm_up_report: WarmUpReport | None = None
+# the warm up and the every minute check can both try to open the db at startup
+_duck_db_reload_lock = asyncio.Lock()
 
 
 @Cloaca_App.on_event("startup")
@@ -159,6 +284,75 @@ async def start_piper():
     print("piper started")
 
 
+async def warm_up_taxonomy() -> str:
+    # from the bundled snapshot, so the first requests don't wait on eBird
+    await asyncio.to_thread(load_taxonomy_from_snapshot)
+    return "loaded bundled snapshot"
+
+
+async def warm_up_regional_mapping() -> str:
+    if is_dev:
+        return "skipped in dev mode"
+    if await load_regional_mapping_from_snapshot():
+        return "loaded snapshot"
+    # shares the refresh refresh_regional_lifers starts at startup
+    report = await get_regional_mapping()
+    return f"fetched {report.regions} regions"
+
+
+async def warm_up_duck_db_and_popular_hotspots(report: WarmUpReport):
+    await report.run_component("duck_db", reload_duck_db)
+
+    async def run_popular_hotspots_queries() -> str:
+        queries = get_warm_up_popular_hotspots_queries()
+        for query in queries:
+            await get_popular_hotspots_json_api(
+                get_duck_db_pool_from_state(),
+                query.latitude,
+                query.longitude,
+                query.radius_km,
+                query.month,
+            )
+        return f"{len(queries)} queries"
+
+    await report.run_component("popular_hotspots", run_popular_hotspots_queries)
+
+
+async def warm_up():
+    global _warm_up_report
+    report = WarmUpReport(started_at=time.time())
+    _warm_up_report = report
+
+    await report.run_component("taxonomy", warm_up_taxonomy)
+    await asyncio.gather(
+        report.run_component("regional_mapping", warm_up_regional_mapping),
+        warm_up_duck_db_and_popular_hotspots(report),
+    )
+
+    report.finish()
+    print(f"Warm up finished in {report.duration_seconds:.3f}s")
+
+
+@Cloaca_App.on_event("startup")
+async def start_warm_up():
+    # in the background, so /v1/health answers while /v1/ready waits on it
+    global _warm_up_task
+    _warm_up_task = asyncio.create_task(warm_up())
+
+
+@Cloaca_App.on_event("startup")
+@repeat_every(seconds=60 * 60 * 24, wait_first=True)  # every day
+async def refresh_taxonomy():
+    if is_dev:
+        print("not refreshing taxonomy in dev mode")
+        return
+    print("refreshing taxonomy from eBird")
+    try:
+        await refresh_taxonomy_from_ebird()
+    except Exception as e:
+        print("Error refreshing taxonomy, keeping current one:", e)
+
+
 @Cloaca_App.on_event("startup")
 @repeat_every(seconds=60 * 60 * 1)  # every hour
 async def refresh_regional_lifers():
@@ -167,33 +361,74 @@ async def refresh_regional_lifers():
         print("not refreshing regional lifers in dev mode")
         return
     print("refreshing regional lifers")
-    await get_regional_mapping()
+    await get_regional_mapping(refresh_http_cache=True)
 
 
 @Cloaca_App.on_event("startup")
 @repeat_every(seconds=60 * 30 * 1)  # every 30 minutes
-async def refresh_observations_cache():
-    print("clearing nearby observations cache")
-    await clear_nearby_observations_cache()
+async def prune_species_index():
+    pruned = recent_species_index.prune()
+    print(f"pruned {pruned} observations from the species index")
 
 
 @Cloaca_App.on_event("startup")
-@repeat_every(seconds=60 * 30 * 1)  # every 30 minutes
+@repeat_every(seconds=60 * 60 * 1)  # every hour
+async def expire_http_cache():
+    expired = await asyncio.to_thread(expire_ebird_http_cache)
+    if expired:
+        print(f"expired {expired} cached eBird responses")
+
+
+@Cloaca_App.on_event("startup")
+@repeat_every(seconds=60 * 5 * 1)  # every 5 minutes
+async def expire_upload_cache():
+    # spill idle uploads to disk even when nobody is uploading or reading.
+    # runs on the loop since the cache isn't thread safe
+    csv_upload_cache.expire()
+
+
+async def reload_duck_db() -> str:
+    """(Re)open the parsed db if the file changed since it was last opened."""
+    async with _duck_db_reload_lock:
+        current: ParsedDb | None = getattr(Cloaca_App.state, "parsed_db", None)
+        duck_db_path = get_duck_db_path_from_env()
+        if not parsed_db_needs_reload(current, duck_db_path):
+            return f"{duck_db_path} already open"
+
+        print("Parsed DuckDB file changed, opening new connection...")
+        # open + warm up off the event loop, requests keep using the current one
+        new_parsed_db = await asyncio.to_thread(
+            open_parsed_db, duck_db_path, duck_db_pool_size
+        )
+
+        Cloaca_App.state.parsed_db = new_parsed_db
+        clear_popular_hotspots_cache()
+        print("Swapped in new DuckDB connection")
+
+    if current is not None:
+        # drain queries still running on the old connection, then close it
+        await asyncio.to_thread(current.close)
+        print("Closed previous DuckDB connection")
+
+    return f"opened {duck_db_path}"
+
+
+@Cloaca_App.on_event("startup")
+@repeat_every(seconds=60)  # every minute, but only reopens when the file changes
 async def connect_to_duck_db():
-    print("Connecting to DuckDB at startup...")
-    duck_db_conn = get_db_connection_with_env()
-    print("Connected to DuckDB at startup")
-    Cloaca_App.state.duck_db_conn = duck_db_conn
+    try:
+        await reload_duck_db()
+    except Exception as e:
+        print("Error connecting to DuckDB, keeping current connection:", e)
 
 
 @Cloaca_App.on_event("shutdown")
 async def shutdown_event():
-    if Cloaca_App.state.duck_db_conn:
-        try:
-            Cloaca_App.state.duck_db_conn.close()
-            print("DuckDB connection closed.")
-        except Exception as e:
-            print("Error closing DuckDB connection:", e)
+    if _warm_up_task is not None and not _warm_up_task.done():
+        _warm_up_task.cancel()
+    if parsed_db := getattr(Cloaca_App.state, "parsed_db", None):
+        await asyncio.to_thread(parsed_db.close)
+        print("DuckDB connection closed.")
     if _piper_task is not None:
         from cloaca.piper.main import bot
         from cloaca.piper.bird_query import close_duck_conn
@@ -0,0 +1,180 @@
+import sys
+from array import array
+from dataclasses import fields
+from typing import Any, Hashable, Iterable, Iterator, Sequence
+
+from cloaca.parsing.parsing_helpers import Lifer
+
+LIFER_COLUMNS = [field.name for field in fields(Lifer)]
+FLOAT_COLUMNS = {"latitude", "longitude"}
+
+
+class StringPool:
+    """
+    Hands back one shared instance per distinct string, like sys.intern but
+    scoped to whatever holds the pool (eg a regional mapping refresh), so the
+    strings can be freed along with the data that uses them.
+    """
+
+    def __init__(self):
+        self._strings: dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+    def intern(self, value: Any) -> Any:
+        if not isinstance(value, str):
+            return value
+        return self._strings.setdefault(value, value)
+
+
+class DictionaryColumn:
+    """Each distinct value stored once, rows are 4 byte codes into `values`."""
+
+    __slots__ = ("values", "codes")
+
+    def __init__(self, column: Iterable[Hashable]):
+        self.values: list[Any] = []
+        self.codes = array("I")
+        code_by_value: dict[Hashable, int] = {}
+        for value in column:
+            code = code_by_value.get(value)
+            if code is None:
+                code = code_by_value[value] = len(self.values)
+                self.values.append(value)
+            self.codes.append(code)
+
+    def __getitem__(self, index: int) -> Any:
+        return self.values[self.codes[index]]
+
+    def to_list(self) -> list[Any]:
+        values = self.values
+        return [values[code] for code in self.codes]
+
+    def size_bytes(self) -> int:
+        return (
+            sys.getsizeof(self.codes)
+            + sys.getsizeof(self.values)
+            + sum(sys.getsizeof(value) for value in self.values)
+        )
+
+
+class FloatColumn:
+    __slots__ = ("values",)
+
+    def __init__(self, column: Iterable[float]):
+        self.values = array("d", column)
+
+    def __getitem__(self, index: int) -> float:
+        return self.values[index]
+
+    def to_list(self) -> list[float]:
+        return self.values.tolist()
+
+    def size_bytes(self) -> int:
+        return sys.getsizeof(self.values)
+
+
+class LiferRow:
+    """Read-only view of one row of a LiferTable, with the same attributes as a Lifer."""
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table: "LiferTable", index: int):
+        self._table = table
+        self._index = index
+
+    def to_lifer(self) -> Lifer:
+        values: list[Any] = [
+            self._table._columns[column][self._index] for column in LIFER_COLUMNS
+        ]
+        return Lifer(*values)
+
+    def __repr__(self) -> str:
+        return f"LiferRow({self.to_lifer()!r})"
+
+
+def _column_property(column: str) -> property:
+    def get(row: LiferRow) -> Any:
+        return row._table._columns[column][row._index]
+
+    return property(get)
+
+
+for _column in LIFER_COLUMNS:
+    setattr(LiferRow, _column, _column_property(_column))
+
+
+class LiferTable:
+    """
+    Column oriented list of lifers. Strings (and taxonomic orders) are
+    dictionary encoded, so the same location / date / species repeated across
+    thousands of rows costs a 4 byte code per row instead of a pointer to its
+    own string, and coordinates sit in flat float arrays.
+
+    Index or iterate it for LiferRow views, or call to_lifers() for real
+    Lifer objects (eg to return from an endpoint).
+    """
+
+    __slots__ = ("_columns", "_length")
+
+    def __init__(self, columns: dict[str, Sequence[Any]]):
+        lengths = {len(columns[column]) for column in LIFER_COLUMNS}
+        if len(lengths) > 1:
+            raise ValueError(f"LiferTable columns have different lengths: {lengths}")
+        self._length = lengths.pop()
+        self._columns: dict[str, DictionaryColumn | FloatColumn] = {
+            column: FloatColumn(columns[column])
+            if column in FLOAT_COLUMNS
+            else DictionaryColumn(columns[column])
+            for column in LIFER_COLUMNS
+        }
+
+    @classmethod
+    def from_lifers(cls, lifers: Sequence[Lifer]) -> "LiferTable":
+        return cls(
+            {
+                column: [getattr(lifer, column) for lifer in lifers]
+                for column in LIFER_COLUMNS
+            }
+        )
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Sequence[Any]]) -> "LiferTable":
+        """Rows of values in LIFER_COLUMNS order, eg straight from a query."""
+        return cls(
+            {column: [row[i] for row in rows] for i, column in enumerate(LIFER_COLUMNS)}
+        )
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> LiferRow:
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("LiferTable index out of range")
+        return LiferRow(self, index)
+
+    def __iter__(self) -> Iterator[LiferRow]:
+        for index in range(self._length):
+            yield LiferRow(self, index)
+
+    def column(self, column: str) -> list[Any]:
+        return self._columns[column].to_list()
+
+    def distinct(self, column: str) -> list[Any]:
+        """Distinct values of a dictionary encoded column, without decoding every row."""
+        encoded = self._columns[column]
+        if isinstance(encoded, FloatColumn):
+            return list(dict.fromkeys(encoded.values))
+        return list(encoded.values)
+
+    def to_lifers(self) -> list[Lifer]:
+        return [Lifer(*row) for row in zip(*(self.column(c) for c in LIFER_COLUMNS))]
+
+    def size_bytes(self) -> int:
+        """Rough resident size of the table's columns and distinct values."""
+        return sys.getsizeof(self) + sum(
+            column.size_bytes() for column in self._columns.values()
+        )
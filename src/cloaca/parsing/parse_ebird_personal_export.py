@@ -1,13 +1,13 @@
+from typing import BinaryIO, Hashable
+
 from fastapi import UploadFile
+import numpy as np
 import pandas as pd
 
 from cloaca.parsing.parsing_helpers import (
     HomeLocation,
     Lifer,
     Observation,
-    get_lifers,
-    observations_to_lifers,
-    calculate_home_location,
 )
 
 # Define the CSV headers
@@ -47,51 +47,266 @@ def parse_csv_from_file(file: UploadFile) -> list[Observation]:
 def parse_csv_from_file_to_lifers(
     file: UploadFile,
 ) -> tuple[list[Lifer], HomeLocation | None]:
-    df = pd.read_csv(file.file)
+    return stream_csv_to_lifers(file.file)
 
-    observations = parse_csv_data_frame(df)
 
-    lifers = get_lifers(observations)
-    home_location = calculate_home_location(observations)
+# the only columns lifers and the home location need. repetitive strings are
+# read as categoricals, Date / Time stay strings since we sort on them
+LIFER_EXPORT_DTYPES: dict[Hashable, str] = {
+    "Submission ID": "string",
+    "Common Name": "category",
+    "Scientific Name": "category",
+    "Taxonomic Order": "Int64",
+    "Location ID": "category",
+    "Location": "category",
+    "Latitude": "float64",
+    "Longitude": "float64",
+    "Date": "string",
+    "Time": "string",
+}
 
-    return observations_to_lifers(lifers), home_location
+EXPORT_CHUNK_ROWS = 100_000
 
 
-def parse_csv_data_frame(data_frame: pd.DataFrame) -> list[Observation]:
-    # Check that the headers match the expected headers
+def keep_earliest_rows(
+    earliest: pd.DataFrame | None, rows: pd.DataFrame, subset: str
+) -> pd.DataFrame:
+    """The earliest row for each `subset` value across `earliest` and `rows`."""
+    merged = pd.concat([rows] if earliest is None else [earliest, rows])
+    # concat falls back to object when chunks saw different categories
+    merged[subset] = merged[subset].astype("object")
+    return merged.sort_values(by=["Date", "Time", "Row"]).drop_duplicates(
+        subset=subset, keep="first"
+    )
+
+
+class LiferExportAggregator:
+    """
+    Lifers and checklists per location in one pass over an export, added a
+    chunk of rows at a time in file order. Only what a later chunk could still
+    change is kept: the earliest sighting of each species, the earliest row at
+    each location, and the checklists counted so far.
+
+    Spuhs, slashes and hybrids are classified once per unique scientific name
+    across the whole export, and removed rows are counted rather than logged.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.removed_observations = 0
+        self._classified_species: set[str] = set()
+        self._unwanted_species: set[str] = set()
+        self._first_sightings: pd.DataFrame | None = None
+        self._first_location_rows: pd.DataFrame | None = None
+        # a checklist is at exactly one location, so counting each new
+        # submission id against its location gives distinct checklists
+        self._submission_ids: set[str] = set()
+        self._checklist_counts: dict[str, int] = {}
+
+    def add(self, chunk: pd.DataFrame):
+        # the file position breaks date/time ties, same as the stable sort of
+        # the whole export would
+        chunk = chunk.assign(Row=np.arange(self.rows, self.rows + len(chunk)))
+        self.rows += len(chunk)
+        chunk = chunk.sort_values(by=["Date", "Time", "Row"])
+
+        singular = self._get_singular_species_mask(chunk)
+        self.removed_observations += int((~singular).sum())
+        self._first_sightings = keep_earliest_rows(
+            self._first_sightings,
+            chunk.loc[singular].drop_duplicates(subset="Scientific Name"),
+            "Scientific Name",
+        )
+        self._first_location_rows = keep_earliest_rows(
+            self._first_location_rows,
+            chunk.drop_duplicates(subset="Location ID"),
+            "Location ID",
+        )
+
+        checklists = chunk.drop_duplicates(subset="Submission ID")
+        new_checklists = checklists.loc[
+            ~checklists["Submission ID"].isin(self._submission_ids)
+        ]
+        self._submission_ids.update(new_checklists["Submission ID"].tolist())
+        for location_id in new_checklists["Location ID"].tolist():
+            self._checklist_counts[location_id] = (
+                self._checklist_counts.get(location_id, 0) + 1
+            )
+
+    def _get_singular_species_mask(self, chunk: pd.DataFrame) -> pd.Series:
+        species = chunk.drop_duplicates(subset="Scientific Name")
+        new_species = species.loc[
+            ~species["Scientific Name"].isin(self._classified_species)
+        ]
+        if not new_species.empty:
+            self._classified_species.update(new_species["Scientific Name"].tolist())
+            self._unwanted_species.update(
+                new_species.loc[
+                    ~get_singular_species_mask(new_species), "Scientific Name"
+                ].tolist()
+            )
+        return ~chunk["Scientific Name"].isin(self._unwanted_species)
+
+    def get_lifers(self) -> list[Lifer]:
+        if self._first_sightings is None:
+            return []
+        return rows_to_lifers(self._first_sightings)
+
+    def get_home_location(self) -> HomeLocation | None:
+        if self._first_location_rows is None:
+            return None
+        return pick_home_location(
+            self._first_location_rows, pd.Series(self._checklist_counts, dtype="int64")
+        )
+
+
+def stream_csv_to_lifers(
+    file: BinaryIO, chunk_rows: int = EXPORT_CHUNK_ROWS
+) -> tuple[list[Lifer], HomeLocation | None]:
+    """
+    Same result as parse_csv_data_frame_to_lifers, but reads the export
+    `chunk_rows` at a time through a LiferExportAggregator. Blocking, so run
+    it off the event loop.
+    """
+    validate_headers(pd.read_csv(file, nrows=0))
+    file.seek(0)
+
+    aggregator = LiferExportAggregator()
+    for chunk in pd.read_csv(
+        file,
+        usecols=list(LIFER_EXPORT_DTYPES),
+        dtype=LIFER_EXPORT_DTYPES,
+        chunksize=chunk_rows,
+    ):
+        aggregator.add(chunk)
+
+    if aggregator.removed_observations:
+        print(
+            f"removed {aggregator.removed_observations} spuh, slash and hybrid "
+            "observations"
+        )
+    return aggregator.get_lifers(), aggregator.get_home_location()
+
+
+def validate_headers(data_frame: pd.DataFrame):
     if list(data_frame.columns) != expected_headers:
         raise ValueError("The CSV headers do not match the expected headers.")
 
-    # Sort the dataframe by Date and Time columns
-    data_frame = data_frame.sort_values(by=["Date", "Time"])
-
-    # Convert each row into an Observation data class
-    observations = [
-        Observation(
-            submission_id=row["Submission ID"],
-            common_name=row["Common Name"],
-            scientific_name=row["Scientific Name"],
-            taxonomic_order=row["Taxonomic Order"],
-            count=row["Count"],
-            state_province=row["State/Province"],
-            county=row["County"],
-            location_id=row["Location ID"],
-            location=row["Location"],
-            latitude=row["Latitude"],
-            longitude=row["Longitude"],
-            date=row["Date"],
-            time=row["Time"],
-            protocol=row["Protocol"],
-            duration_min=row["Duration (Min)"],
-            all_obs_reported=row["All Obs Reported"],
-            distance_traveled_km=row["Distance Traveled (km)"],
-            area_covered_ha=row["Area Covered (ha)"],
-            number_of_observers=row["Number of Observers"],
-            breeding_code=row["Breeding Code"],
-            observation_details=row["Observation Details"],
-            checklist_comments=row["Checklist Comments"],
-            ml_catalog_numbers=row["ML Catalog Numbers"],
-        )
-        for _, row in data_frame.iterrows()
+
+def sort_by_date_and_time(data_frame: pd.DataFrame) -> pd.DataFrame:
+    return data_frame.sort_values(by=["Date", "Time"])
+
+
+def get_singular_species_mask(data_frame: pd.DataFrame) -> pd.Series:
+    """
+    Vectorized is_singular_bird_species: False for spuhs, slashes and hybrids.
+    Only the unique names get scanned, rows are matched against them with isin.
+    """
+    masks = []
+    for column in ["Scientific Name", "Common Name"]:
+        names = pd.Series(data_frame[column].dropna().unique(), dtype="object")
+        unwanted = names.loc[
+            names.str.contains("sp.", regex=False)
+            | names.str.contains("/", regex=False)
+            | names.str.contains(" x ", regex=False)
+        ]
+        masks.append(data_frame[column].isin(unwanted))
+    return ~(masks[0] | masks[1])
+
+
+def first_observation_per_species(sorted_data_frame: pd.DataFrame) -> pd.DataFrame:
+    """First observation of each singular species, in the order they were seen."""
+    singular = sorted_data_frame.loc[get_singular_species_mask(sorted_data_frame)]
+    return singular.drop_duplicates(subset="Scientific Name", keep="first")
+
+
+def rows_to_lifers(data_frame: pd.DataFrame) -> list[Lifer]:
+    if data_frame["Taxonomic Order"].hasnans:
+        # LIFER_EXPORT_DTYPES reads a blank order as pd.NA, make it NaN like a
+        # plain read_csv (and so the per row parser) always has
+        data_frame = data_frame.astype({"Taxonomic Order": "float64"})
+    columns = [
+        data_frame[column].tolist()
+        for column in [
+            "Common Name",
+            "Latitude",
+            "Longitude",
+            "Date",
+            "Taxonomic Order",
+            "Location",
+            "Location ID",
+            "Scientific Name",
+        ]
     ]
-    return observations
+    return [Lifer(*values) for values in zip(*columns)]
+
+
+def get_lifers_from_data_frame(sorted_data_frame: pd.DataFrame) -> list[Lifer]:
+    first_seen = first_observation_per_species(sorted_data_frame)
+    return rows_to_lifers(first_seen)
+
+
+def pick_home_location(
+    first_row_per_location: pd.DataFrame, checklist_counts: pd.Series
+) -> HomeLocation | None:
+    """
+    Hotspot with the most checklists, the earliest visited one wins ties.
+
+    `first_row_per_location` is the first observation at each location, in
+    the order they were first visited. `checklist_counts` is the number of
+    distinct checklists by Location ID.
+    """
+    if first_row_per_location.empty:
+        return None
+
+    checklist_counts = checklist_counts.reindex(first_row_per_location["Location ID"])
+    # argmax returns the first of any ties, ie the earliest visited location
+    home = int(checklist_counts.to_numpy().argmax())
+    first_row = first_row_per_location.iloc[home]
+
+    return HomeLocation(
+        location_id=first_row["Location ID"],
+        location_name=first_row["Location"],
+        latitude=float(first_row["Latitude"]),
+        longitude=float(first_row["Longitude"]),
+        checklist_count=int(checklist_counts.iloc[home]),
+    )
+
+
+def get_home_location_from_data_frame(
+    sorted_data_frame: pd.DataFrame,
+) -> HomeLocation | None:
+    checklists = sorted_data_frame.loc[
+        :, ["Location ID", "Submission ID"]
+    ].drop_duplicates()
+    return pick_home_location(
+        sorted_data_frame.drop_duplicates(subset="Location ID", keep="first"),
+        checklists.groupby(
+            "Location ID", sort=False, dropna=False, observed=True
+        ).size(),
+    )
+
+
+def parse_csv_data_frame_to_lifers(
+    data_frame: pd.DataFrame,
+) -> tuple[list[Lifer], HomeLocation | None]:
+    """
+    Lifers and home location straight from the export's columns, without
+    building an Observation per row.
+    """
+    validate_headers(data_frame)
+    data_frame = sort_by_date_and_time(data_frame)
+
+    return get_lifers_from_data_frame(data_frame), get_home_location_from_data_frame(
+        data_frame
+    )
+
+
+def parse_csv_data_frame(data_frame: pd.DataFrame) -> list[Observation]:
+    validate_headers(data_frame)
+    data_frame = sort_by_date_and_time(data_frame)
+
+    # Observation's fields are in the same order as the export's columns, so
+    # zip the columns together instead of going through iterrows
+    columns = [data_frame[column].tolist() for column in expected_headers]
+    return [Observation(*values) for values in zip(*columns)]
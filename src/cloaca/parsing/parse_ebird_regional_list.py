@@ -23,10 +23,15 @@ def parse_subnational1_file() -> List[SubnationalRegion]:
 
     return [
         SubnationalRegion(
-            country_code=row["country_code"],
-            country_name=row["country_name"],
-            subnational1_code=row["subnational1_code"],
-            subnational1_name=row["subnational1_name"],
+            country_code=country_code,
+            country_name=country_name,
+            subnational1_code=subnational1_code,
+            subnational1_name=subnational1_name,
+        )
+        for country_code, country_name, subnational1_code, subnational1_name in zip(
+            df["country_code"].tolist(),
+            df["country_name"].tolist(),
+            df["subnational1_code"].tolist(),
+            df["subnational1_name"].tolist(),
         )
-        for _, row in df.iterrows()
     ]
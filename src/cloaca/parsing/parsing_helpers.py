@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class Observation:
     submission_id: str
     common_name: str
@@ -63,7 +63,7 @@ def get_lifers(observations):
     return list(lifers.values())
 
 
-@dataclass
+@dataclass(slots=True)
 class Lifer:
     common_name: str
     latitude: float
@@ -76,7 +76,7 @@ class Lifer:
     species_code: str | None = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Location:
     location_name: str
     latitude: float
@@ -84,7 +84,7 @@ class Location:
     location_id: str
 
 
-@dataclass
+@dataclass(slots=True)
 class LocationToLifers:
     location: Location
     lifers: list[Lifer]
@@ -106,7 +106,7 @@ def observations_to_lifers(observations: list[Observation]) -> list[Lifer]:
     ]
 
 
-@dataclass
+@dataclass(slots=True)
 class HomeLocation:
     location_id: str
     location_name: str
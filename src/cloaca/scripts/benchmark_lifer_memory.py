@@ -0,0 +1,115 @@
+# measure resident memory (via tracemalloc) of the ways we can hold lifers:
+# plain dataclasses, slotted dataclasses, slotted + pooled strings and a LiferTable
+#
+# usage: python -m cloaca.scripts.benchmark_lifer_memory --rows 20000
+
+import argparse
+import random
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from cloaca.parsing.lifer_table import LiferTable, StringPool
+from cloaca.parsing.parsing_helpers import Lifer
+
+
+@dataclass
+class DictLifer:
+    # what Lifer looked like before it had slots
+    common_name: str
+    latitude: float
+    longitude: float
+    date: str
+    taxonomic_order: int
+    location: str
+    location_id: str
+    scientific_name: str
+    species_code: str | None = None
+
+
+def generate_rows(
+    rows: int, species: int, locations: int, seed: int = 42
+) -> list[tuple[Any, ...]]:
+    rng = random.Random(seed)
+    generated = []
+    for _ in range(rows):
+        species_index = rng.randrange(species)
+        location_index = rng.randrange(locations)
+        day = rng.randrange(30)
+        # f-strings build a new string object every row, like parsing JSON /
+        # CSV does, so repeated values aren't accidentally shared up front
+        generated.append(
+            (
+                f"Common Name {species_index}",
+                40 + location_index / locations,
+                -74 - location_index / locations,
+                f"2024-05-{day + 1:02d} 07:30",
+                species_index,
+                f"Some Hotspot Name {location_index}",
+                f"L{location_index}",
+                f"Genus species{species_index}",
+                f"spec{species_index}",
+            )
+        )
+    return generated
+
+
+def pooled_lifers(rows: list[tuple[Any, ...]]) -> list[Lifer]:
+    strings = StringPool()
+    return [Lifer(*(strings.intern(value) for value in row)) for row in rows]
+
+
+def traced_size(build: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        built = build()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del built
+    return after - before
+
+
+def run_benchmark(rows: int, species: int, locations: int):
+    print(f"{rows} rows, {species} species, {locations} locations")
+
+    # every variant builds from fresh copies of the rows, so their own
+    # strings are counted against them
+    variants: dict[str, Callable[[], Any]] = {
+        "dataclass": lambda: [
+            DictLifer(*row) for row in generate_rows(rows, species, locations)
+        ],
+        "slotted dataclass": lambda: [
+            Lifer(*row) for row in generate_rows(rows, species, locations)
+        ],
+        "slotted + string pool": lambda: pooled_lifers(
+            generate_rows(rows, species, locations)
+        ),
+        "LiferTable": lambda: LiferTable.from_rows(
+            generate_rows(rows, species, locations)
+        ),
+    }
+
+    baseline = None
+    for name, build in variants.items():
+        size = traced_size(build)
+        baseline = baseline or size
+        print(
+            f"  {name:22} {size / 1024 / 1024:8.2f}MB  {size / rows:8.1f} bytes/row"
+            f"  ({size / baseline:.0%})"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark memory used by lifer representations",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    # ~a regional snapshot: 50 states x 400 recent observations
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--species", type=int, default=700)
+    parser.add_argument("--locations", type=int, default=3_000)
+
+    args = parser.parse_args()
+    run_benchmark(args.rows, args.species, args.locations)
@@ -0,0 +1,154 @@
+# benchmark turning an eBird personal export into lifers + home location:
+# the old per-row Observation path vs the vectorized and streamed ones, on a
+# generated export
+#
+# usage: python -m cloaca.scripts.benchmark_personal_export_parsing --rows 500000
+
+import argparse
+import contextlib
+import io
+import time
+
+import numpy as np
+import pandas as pd
+
+from cloaca.parsing.parse_ebird_personal_export import (
+    expected_headers,
+    parse_csv_data_frame,
+    parse_csv_data_frame_to_lifers,
+    stream_csv_to_lifers,
+)
+from cloaca.parsing.parsing_helpers import (
+    Observation,
+    calculate_home_location,
+    get_lifers,
+    observations_to_lifers,
+)
+
+
+def create_synthetic_export(
+    rows: int, species: int = 1_500, locations: int = 5_000, seed: int = 42
+) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+
+    species_index = rng.integers(0, species, rows)
+    # roughly the share of spuhs / slashes / hybrids in a real export
+    common_names = np.array([f"Common Name {i}" for i in range(species)], dtype=object)
+    scientific_names = np.array(
+        [f"Genus species{i}" for i in range(species)], dtype=object
+    )
+    for i in range(0, species, 50):
+        common_names[i] = f"genus sp. {i}"
+        scientific_names[i] = f"Genus sp. {i}"
+    for i in range(25, species, 50):
+        common_names[i] = f"Common Name {i}/Common Name {i + 1}"
+        scientific_names[i] = f"Genus species{i}/species{i + 1}"
+
+    # ~8 observations per checklist, each checklist at one location on one day
+    checklists = max(rows // 8, 1)
+    checklist_index = np.sort(rng.integers(0, checklists, rows))
+    checklist_location = rng.zipf(1.5, checklists) % locations
+    checklist_day = rng.integers(0, 365 * 15, checklists)
+    location_index = checklist_location[checklist_index]
+
+    dates = pd.Timestamp("2010-01-01") + pd.to_timedelta(
+        checklist_day[checklist_index], unit="D"
+    )
+    minutes = (checklist_index * 7) % (24 * 60)
+
+    return pd.DataFrame(
+        {
+            "Submission ID": [f"S{i}" for i in checklist_index],
+            "Common Name": common_names[species_index],
+            "Scientific Name": scientific_names[species_index],
+            "Taxonomic Order": species_index,
+            "Count": rng.integers(1, 20, rows),
+            "State/Province": "US-NY",
+            "County": "Kings",
+            "Location ID": [f"L{i}" for i in location_index],
+            "Location": [f"Location {i}" for i in location_index],
+            "Latitude": 40 + location_index / locations,
+            "Longitude": -74 + location_index / locations,
+            "Date": dates.strftime("%Y-%m-%d"),
+            "Time": [f"{m // 60:02d}:{m % 60:02d} AM" for m in minutes],
+            "Protocol": "eBird - Traveling Count",
+            "Duration (Min)": 60,
+            "All Obs Reported": 1,
+            "Distance Traveled (km)": 1.5,
+            "Area Covered (ha)": np.nan,
+            "Number of Observers": 1,
+            "Breeding Code": np.nan,
+            "Observation Details": np.nan,
+            "Checklist Comments": np.nan,
+            "ML Catalog Numbers": np.nan,
+        },
+        columns=expected_headers,
+    )
+
+
+def legacy_parse_csv_data_frame(data_frame: pd.DataFrame) -> list[Observation]:
+    # what parse_csv_data_frame used to do: an Observation per iterrows() row
+    data_frame = data_frame.sort_values(by=["Date", "Time"])
+    return [
+        Observation(*(row[column] for column in expected_headers))
+        for _, row in data_frame.iterrows()
+    ]
+
+
+def time_it(fn, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = fn(*args)
+        return time.perf_counter() - start, result
+
+
+def run_benchmark(rows: int, skip_iterrows: bool):
+    data_frame = create_synthetic_export(rows)
+    print(f"{len(data_frame)} rows")
+
+    def via_observations(parse):
+        def run(df):
+            observations = parse(df)
+            return (
+                observations_to_lifers(get_lifers(observations)),
+                calculate_home_location(observations),
+            )
+
+        return run
+
+    results = {}
+    if not skip_iterrows:
+        results["iterrows observations"] = time_it(
+            via_observations(legacy_parse_csv_data_frame), data_frame
+        )
+    results["zipped observations"] = time_it(
+        via_observations(parse_csv_data_frame), data_frame
+    )
+    results["vectorized"] = time_it(parse_csv_data_frame_to_lifers, data_frame)
+    # what an upload runs, from the export's bytes
+    export = io.BytesIO(data_frame.to_csv(index=False).encode())
+    results["streamed"] = time_it(stream_csv_to_lifers, export)
+
+    expected = results["vectorized"][1]
+    for name, (elapsed, (lifers, home_location)) in results.items():
+        assert (lifers, home_location) == expected, f"{name} disagrees"
+        print(
+            f"  {name:22} {elapsed:8.2f}s  {rows / elapsed:12,.0f} rows/sec"
+            f"  {len(lifers)} lifers, home {home_location.location_id}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark parsing eBird personal exports",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument(
+        "--skip-iterrows",
+        action="store_true",
+        help="skip the (slow) original iterrows path",
+    )
+
+    args = parser.parse_args()
+    run_benchmark(args.rows, args.skip_iterrows)
@@ -0,0 +1,153 @@
+# compare the gridded popular hotspots query against the old full scan
+# on a synthetic, nationwide sized localities_hotspots table
+#
+# usage: python -m cloaca.scripts.benchmark_popular_hotspots --hotspots 100000
+
+import argparse
+import contextlib
+import io
+import random
+import statistics
+import time
+
+import duckdb
+
+from cloaca.db.popular_hotspots import GRID_CELL_DEGREES, get_popular_hotspots
+
+# the query before localities_hotspots had grid columns
+LEGACY_QUERY = """
+SELECT
+    locality_id,
+    locality_name,
+    latitude,
+    longitude,
+    avg_weekly_number_of_observations,
+    common_species as likely_common_species_count,
+    std_error as likely_common_species_std_error,
+    uncommon_species as likely_uncommon_species_count,
+    common_and_uncommon_species as likely_common_and_uncommon_species_count
+FROM localities_hotspots
+WHERE ST_Distance_Sphere(geometry, ST_Point(?, ?)) <= ?
+    AND month = ?
+    AND avg_weekly_number_of_observations >= 1
+ORDER BY avg_weekly_number_of_observations DESC
+limit 1000
+"""
+
+# rough bounding box of the contiguous US
+US_LATITUDE_RANGE = (24.5, 49.0)
+US_LONGITUDE_RANGE = (-124.7, -67.0)
+
+
+def create_synthetic_localities_hotspots(
+    con: duckdb.DuckDBPyConnection, number_of_hotspots: int, seed: int
+):
+    con.execute("SELECT setseed(?)", [seed / 1_000_000])
+    con.execute(
+        f"""
+        CREATE OR REPLACE TABLE localities_hotspots AS
+        WITH localities AS (
+            SELECT
+                'L' || i AS locality_id,
+                'Hotspot ' || i AS locality_name,
+                {US_LATITUDE_RANGE[0]} + random() * {US_LATITUDE_RANGE[1] - US_LATITUDE_RANGE[0]} AS latitude,
+                {US_LONGITUDE_RANGE[0]} + random() * {US_LONGITUDE_RANGE[1] - US_LONGITUDE_RANGE[0]} AS longitude
+            FROM range(?) t(i)
+        )
+        SELECT
+            locality_id,
+            locality_name,
+            latitude,
+            longitude,
+            'H' AS locality_type,
+            ST_Point(latitude, longitude) AS geometry,
+            CAST(floor(latitude / {GRID_CELL_DEGREES}) AS INTEGER) AS grid_lat,
+            CAST(floor(longitude / {GRID_CELL_DEGREES}) AS INTEGER) AS grid_lng,
+            m.month,
+            random() * 20 AS avg_weekly_number_of_observations,
+            CAST(random() * 100 AS INTEGER) AS common_species,
+            CAST(random() * 50 AS INTEGER) AS uncommon_species,
+            CAST(random() * 150 AS INTEGER) AS common_and_uncommon_species,
+            random() AS std_error
+        FROM localities
+        CROSS JOIN range(1, 13) m(month)
+        ORDER BY m.month, grid_lat, grid_lng, geometry
+        """,
+        [number_of_hotspots],
+    )
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(name: str, samples: list[float]):
+    print(
+        f"{name:>8}: p50 {percentile(samples, 50) * 1000:8.2f}ms"
+        f"  p99 {percentile(samples, 99) * 1000:8.2f}ms"
+        f"  mean {statistics.mean(samples) * 1000:8.2f}ms"
+    )
+
+
+def run_benchmark(number_of_hotspots: int, queries: int, radius_km: float, seed: int):
+    con = duckdb.connect()
+    con.install_extension("spatial")
+    con.load_extension("spatial")
+
+    print(f"Creating synthetic table with {number_of_hotspots} hotspots x 12 months")
+    create_synthetic_localities_hotspots(con, number_of_hotspots, seed)
+
+    rng = random.Random(seed)
+    lookups = [
+        (
+            rng.uniform(*US_LATITUDE_RANGE),
+            rng.uniform(*US_LONGITUDE_RANGE),
+            rng.randint(1, 12),
+        )
+        for _ in range(queries)
+    ]
+
+    legacy_samples: list[float] = []
+    gridded_samples: list[float] = []
+    for latitude, longitude, month in lookups:
+        start = time.perf_counter()
+        legacy_rows = con.execute(
+            LEGACY_QUERY, [latitude, longitude, radius_km * 1000, month]
+        ).fetchall()
+        legacy_samples.append(time.perf_counter() - start)
+
+        # get_popular_hotspots logs every call, keep that out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            gridded_rows = get_popular_hotspots(
+                con, latitude, longitude, radius_km, month
+            )
+            gridded_samples.append(time.perf_counter() - start)
+
+        if len(legacy_rows) != len(gridded_rows):
+            raise RuntimeError(
+                f"Result mismatch at ({latitude}, {longitude}, month {month}): "
+                f"{len(legacy_rows)} legacy rows vs {len(gridded_rows)} gridded rows"
+            )
+
+    print(f"\n{queries} lookups with a {radius_km}km radius:")
+    report("legacy", legacy_samples)
+    report("gridded", gridded_samples)
+
+    con.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the popular hotspots query on synthetic data",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--hotspots", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--radius-km", type=float, default=25)
+    parser.add_argument("--seed", type=int, default=42)
+
+    args = parser.parse_args()
+    run_benchmark(args.hotspots, args.queries, args.radius_km, args.seed)
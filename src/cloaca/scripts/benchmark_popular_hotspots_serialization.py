@@ -0,0 +1,104 @@
+# compare rows/sec of the popular hotspots response paths:
+# - objects: fetchall -> PopularHotspotResult -> to_dict -> pydantic validation -> json
+# - json: what /v1/popular_hotspots runs on a cache miss, DuckDB serializes
+#   each row and the API cuts them down to the circle and joins them
+# - cached: /v1/popular_hotspots answering from its cache, ie another lookup
+#   that snaps to the same entry
+#
+# usage: python -m cloaca.scripts.benchmark_popular_hotspots_serialization
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import time
+
+import duckdb
+from pydantic import TypeAdapter
+
+from cloaca.api.get_popular_hotspots import (
+    PopularHotspot,
+    clear_popular_hotspots_cache,
+    get_popular_hotspots_json_api,
+)
+from cloaca.db.cursor_pool import DuckDBCursorPool
+from cloaca.db.popular_hotspots import get_popular_hotspots
+from cloaca.scripts.benchmark_popular_hotspots import (
+    create_synthetic_localities_hotspots,
+)
+
+response_adapter = TypeAdapter(list[PopularHotspot])
+
+
+def objects_path(con: duckdb.DuckDBPyConnection, lookup: tuple) -> bytes:
+    hotspots = get_popular_hotspots(con, *lookup)
+    # roughly what FastAPI does with a List[Dict[str, Any]] return value
+    validated = response_adapter.validate_python(
+        [hotspot.to_dict() for hotspot in hotspots]
+    )
+    return response_adapter.dump_json(validated)
+
+
+async def run_benchmark(
+    number_of_hotspots: int, radius_km: float, iterations: int, seed: int
+):
+    con = duckdb.connect()
+    con.install_extension("spatial")
+    con.load_extension("spatial")
+    create_synthetic_localities_hotspots(con, number_of_hotspots, seed)
+    # both paths query on the pool's worker thread, like the endpoint does
+    pool = DuckDBCursorPool(con, max_workers=1)
+
+    async def objects(lookup: tuple) -> bytes:
+        return await pool.run(objects_path, lookup)
+
+    async def cached(lookup: tuple) -> bytes:
+        return (await get_popular_hotspots_json_api(pool, *lookup)).encode()
+
+    async def json_rows(lookup: tuple) -> bytes:
+        clear_popular_hotspots_cache()
+        return await cached(lookup)
+
+    # around the middle of the US. the padded search a cache miss runs isn't
+    # capped, so with a big radius (eg 2000km) it's slower than objects
+    lookup = (39.0, -98.0, radius_km, 6)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        rows = len(json.loads(await json_rows(lookup)))
+
+    print(f"{iterations} iterations of {rows} rows each:")
+    for name, path in [
+        ("objects", objects),
+        ("json", json_rows),
+        ("cached", cached),
+    ]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                await path(lookup)
+            elapsed = time.perf_counter() - start
+        print(
+            f"{name:>8}: {elapsed / iterations * 1000:8.2f}ms/request"
+            f"  {rows * iterations / elapsed:12,.0f} rows/sec"
+        )
+
+    pool.close()
+    con.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark popular hotspots result serialization",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    # small table so the query itself doesn't drown out serialization cost
+    parser.add_argument("--hotspots", type=int, default=10_000)
+    parser.add_argument("--radius-km", type=float, default=300)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+
+    args = parser.parse_args()
+    asyncio.run(
+        run_benchmark(args.hotspots, args.radius_km, args.iterations, args.seed)
+    )
@@ -0,0 +1,157 @@
+# benchmark /v1/regional_new_potential_lifers filtering at realistic sizes:
+# a ~700 species life list against ~50 states worth of regional observations
+#
+# usage: python -m cloaca.scripts.benchmark_regional_lifers
+
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import time
+
+from cloaca.api.get_new_lifers_by_region import (
+    RegionBounds,
+    SubRegionAndObservations,
+    filtered_regional_lifers_cache,
+    get_filtered_lifers_for_region,
+    regional_mapping,
+)
+from cloaca.parsing.parse_ebird_regional_list import SubnationalRegion
+from cloaca.parsing.parsing_helpers import Lifer
+from cloaca.types import set_lifers_to_cache
+
+
+def region_center(region_index: int) -> tuple[float, float]:
+    # lay the synthetic regions out on a 5 degree grid across the US
+    return 25 + (region_index // 12) * 5, -125 + (region_index % 12) * 5
+
+
+def make_lifer(
+    species_index: int, location_index: int, latitude: float, longitude: float
+) -> Lifer:
+    return Lifer(
+        common_name=f"Common Name {species_index}",
+        latitude=latitude,
+        longitude=longitude,
+        date="2024-05-01",
+        taxonomic_order=species_index,
+        location=f"Location {location_index}",
+        location_id=f"L{location_index}",
+        scientific_name=f"Genus species{species_index}",
+        species_code=f"spec{species_index}",
+    )
+
+
+def populate_regional_mapping(
+    rng: random.Random, regions: int, observations_per_region: int, species: int
+):
+    regional_mapping.clear()
+    for region_index in range(regions):
+        code = f"US-{region_index:02d}"
+        latitude, longitude = region_center(region_index)
+        observations = [
+            make_lifer(
+                rng.randrange(species),
+                region_index * 10_000 + i,
+                latitude + rng.uniform(0, 4.9),
+                longitude + rng.uniform(0, 4.9),
+            )
+            for i in range(observations_per_region)
+        ]
+        regional_mapping[code] = SubRegionAndObservations(
+            subnational_region=SubnationalRegion(
+                country_code="US",
+                country_name="United States",
+                subnational1_code=code,
+                subnational1_name=f"State {region_index}",
+            ),
+            observations=observations,
+            bounds=RegionBounds.from_lifers(observations),
+        )
+
+
+def legacy_filter(observations: list[Lifer], lifers: list[Lifer]) -> list[Lifer]:
+    # what filter_lifers_from_observations used to do: list membership per observation
+    lifer_sci_names = [lifer.scientific_name for lifer in lifers]
+    return [
+        observation
+        for observation in observations
+        if observation.scientific_name not in lifer_sci_names
+    ]
+
+
+async def run_benchmark(
+    regions: int, observations_per_region: int, life_list: int, iterations: int
+):
+    rng = random.Random(42)
+    species = 1_000
+    populate_regional_mapping(rng, regions, observations_per_region, species)
+    lifers = [make_lifer(i, 0, 40, -74) for i in rng.sample(range(species), life_list)]
+    set_lifers_to_cache("benchmark", lifers)
+
+    all_observations = [
+        lifer for region in regional_mapping.values() for lifer in region.observations
+    ]
+    print(
+        f"{len(all_observations)} regional observations, {len(lifers)} lifers, "
+        f"{iterations} iterations"
+    )
+
+    legacy_result: list[Lifer] = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        legacy_result = legacy_filter(all_observations, lifers)
+    legacy_elapsed = (time.perf_counter() - start) / iterations
+
+    async def time_endpoint(latitude: float, longitude: float) -> tuple[float, int]:
+        result: list[Lifer] = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                # measure the filtering itself, not the per-upload memo
+                filtered_regional_lifers_cache.clear()
+                result = await get_filtered_lifers_for_region(
+                    latitude, longitude, "benchmark"
+                )
+            return (time.perf_counter() - start) / iterations, len(result)
+
+    # outside every region, so this filters the whole country
+    everywhere_elapsed, everywhere_rows = await time_endpoint(0, 0)
+    assert everywhere_rows == len(legacy_result)
+
+    center_latitude, center_longitude = region_center(regions // 2)
+    nearby_elapsed, nearby_rows = await time_endpoint(
+        center_latitude + 2.5, center_longitude + 2.5
+    )
+
+    print(
+        f"  legacy list filter:      {legacy_elapsed * 1000:8.2f}ms/request"
+        f"  {len(legacy_result)} rows"
+    )
+    print(
+        f"  all regions (sets):      {everywhere_elapsed * 1000:8.2f}ms/request"
+        f"  {everywhere_rows} rows"
+    )
+    print(
+        f"  caller's region (sets):  {nearby_elapsed * 1000:8.2f}ms/request"
+        f"  {nearby_rows} rows"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark regional lifer filtering",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--regions", type=int, default=51)
+    parser.add_argument("--observations-per-region", type=int, default=300)
+    parser.add_argument("--life-list", type=int, default=700)
+    parser.add_argument("--iterations", type=int, default=10)
+
+    args = parser.parse_args()
+    asyncio.run(
+        run_benchmark(
+            args.regions, args.observations_per_region, args.life_list, args.iterations
+        )
+    )
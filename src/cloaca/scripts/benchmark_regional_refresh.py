@@ -0,0 +1,137 @@
+# benchmark the CPU side of the hourly regional refresh: turning every state's
+# recent eBird observations into Lifers, with eBird itself stubbed out
+#
+# usage: python -m cloaca.scripts.benchmark_regional_refresh
+
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import time
+
+from cloaca.api import get_new_lifers_by_region
+from cloaca.api.shared import (
+    ensure_taxonomy,
+    get_taxonomy_info_for_species_code,
+)
+from cloaca.parsing.parsing_helpers import Lifer
+from cloaca.types import phoebe_observations_to_lifers
+from phoebe_bird.types.data.observation import Observation as PhoebeObservation
+
+
+def generate_observations(
+    rng: random.Random, species_codes: list[str], count: int, region_index: int
+) -> list[PhoebeObservation]:
+    observations = []
+    for i in range(count):
+        species_code = rng.choice(species_codes)
+        location_index = rng.randrange(200)
+        observations.append(
+            PhoebeObservation.model_validate(
+                {
+                    "speciesCode": species_code,
+                    "comName": f"Common Name {species_code}",
+                    "sciName": f"Scientific name {species_code}",
+                    "locId": f"L{region_index}{location_index}",
+                    "locName": f"Hotspot {region_index}-{location_index}",
+                    "obsDt": f"2024-05-{rng.randrange(1, 31):02d} 07:30",
+                    "lat": 25 + region_index / 3 + rng.random(),
+                    "lng": -120 + region_index + rng.random(),
+                    "howMany": 1,
+                }
+            )
+        )
+    return observations
+
+
+async def legacy_observations_to_lifers(
+    observations: list[PhoebeObservation],
+) -> list[Lifer]:
+    # what the refresh used to do: await a taxonomy lookup per observation
+    lifers = []
+    for observation in observations:
+        taxon_info = await get_taxonomy_info_for_species_code(
+            observation.species_code or ""
+        )
+        lifers.append(
+            Lifer(
+                common_name=observation.com_name or "",
+                latitude=observation.lat or 0,
+                longitude=observation.lng or 0,
+                date=observation.obs_dt or "",
+                taxonomic_order=taxon_info.taxon_order or 0,
+                location=observation.loc_name or "",
+                location_id=observation.loc_id or "",
+                scientific_name=observation.sci_name or "",
+                species_code=observation.species_code,
+            )
+        )
+    return lifers
+
+
+async def run_benchmark(regions: int, observations_per_region: int):
+    rng = random.Random(42)
+    with contextlib.redirect_stdout(io.StringIO()):
+        taxonomy = await ensure_taxonomy()
+    species_codes = rng.sample(sorted(taxonomy), 1_500)
+    by_region = [
+        generate_observations(rng, species_codes, observations_per_region, i)
+        for i in range(regions)
+    ]
+    total = regions * observations_per_region
+    print(f"{regions} regions x {observations_per_region} observations = {total}")
+
+    legacy: list[list[Lifer]] = []
+    start = time.process_time()
+    for observations in by_region:
+        legacy.append(await legacy_observations_to_lifers(observations))
+    legacy_cpu = time.process_time() - start
+
+    batch: list[list[Lifer]] = []
+    start = time.process_time()
+    for observations in by_region:
+        batch.append(phoebe_observations_to_lifers(observations, taxonomy))
+    batch_cpu = time.process_time() - start
+    # every region, not just the last one
+    assert batch == legacy
+
+    print(f"  per observation await:  {legacy_cpu * 1000:8.1f}ms cpu")
+    print(f"  batch conversion:       {batch_cpu * 1000:8.1f}ms cpu")
+
+    # the whole refresh, with eBird replaced by the generated observations
+    observations_by_code: dict[str, list[PhoebeObservation]] = {}
+
+    async def fake_fetch(
+        subnational_code: str, refresh_http_cache: bool = False
+    ) -> list[PhoebeObservation]:
+        if subnational_code not in observations_by_code:
+            observations_by_code[subnational_code] = by_region[
+                len(observations_by_code) % regions
+            ]
+        return observations_by_code[subnational_code]
+
+    get_new_lifers_by_region.fetch_observations_for_regions_from_phoebe = fake_fetch
+    get_new_lifers_by_region.regional_refresh_requests_per_second = 1_000_000
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.process_time()
+        report = await get_new_lifers_by_region.get_regional_mapping()
+        refresh_cpu = time.process_time() - start
+
+    print(
+        f"  full refresh:           {refresh_cpu * 1000:8.1f}ms cpu"
+        f"  ({report.regions} regions, {report.observations} observations)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the CPU time of the regional refresh",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--regions", type=int, default=51)
+    parser.add_argument("--observations-per-region", type=int, default=400)
+
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.regions, args.observations_per_region))
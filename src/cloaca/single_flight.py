@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class SingleFlight(Generic[K, V]):
+    """
+    Table of in-flight calls by key: callers that ask for a key while a call
+    for it is already running await that call instead of issuing their own.
+
+    The call runs as its own task, so a caller going away (eg a client
+    disconnecting) doesn't cancel it for everyone else waiting on it.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[K, asyncio.Task[V]] = {}
+        self.issued = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._in_flight
+
+    def _forget(self, key: K, task: asyncio.Task[V]):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # every waiter may have been cancelled, don't warn about an
+        # exception nobody was left to retrieve
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, key: K, fn: Callable[[], Awaitable[V]]) -> V:
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.issued += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> Dict[str, Any]:
+        requests = self.issued + self.coalesced
+        return {
+            "in_flight": len(self._in_flight),
+            "issued": self.issued,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / requests if requests else 0.0,
+        }
@@ -0,0 +1,210 @@
+import math
+import time
+from typing import Any, Callable, Dict, Iterable
+
+from phoebe_bird.types.data.observation import Observation as PhoebeObservation
+
+from cloaca.db.popular_hotspots import KM_PER_DEGREE_LATITUDE
+from cloaca.geo import distance_km
+
+CELL_DEGREES = 0.5
+
+Cell = tuple[float, float]
+
+
+def cell_for(latitude: float, longitude: float) -> Cell:
+    # same grid as round_to_nearest_half, which the eBird cache keys use
+    return (
+        round(latitude / CELL_DEGREES) * CELL_DEGREES,
+        round(longitude / CELL_DEGREES) * CELL_DEGREES,
+    )
+
+
+# (indexed at, latitude, longitude, radius km) of a per species response
+Coverage = tuple[float, float, float, float]
+
+
+class SpeciesIndex:
+    """
+    Most recent eBird observation of each species at each hotspot, bucketed
+    by half degree cell, built from the per species (geo_species) responses
+    we've already fetched.
+
+    Each of those lists every hotspot the species was seen at within its
+    radius, so a lookup is only answered when one response's circle contains
+    the lookup's whole circle. Anything else is a miss and goes to eBird:
+    nearby (geo.recent) and regional responses only have the latest sighting
+    of each species, answering from them would silently drop hotspots.
+
+    An observation is only served for `max_age_seconds` after the response it
+    came in was indexed; `prune()` drops the older ones.
+    """
+
+    def __init__(
+        self,
+        max_age_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_age_seconds = max_age_seconds
+        self._clock = clock
+        # cell -> species code -> location id -> (indexed at, observation)
+        self._cells: Dict[
+            Cell, Dict[str, Dict[str, tuple[float, PhoebeObservation]]]
+        ] = {}
+        # species code -> the circles its indexed responses cover
+        self._coverage: Dict[str, list[Coverage]] = {}
+
+        self.lookups = 0
+        self.answered = 0
+
+    def __len__(self) -> int:
+        return sum(
+            len(locations)
+            for species in self._cells.values()
+            for locations in species.values()
+        )
+
+    def add(
+        self,
+        species_code: str,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        observations: Iterable[PhoebeObservation],
+    ) -> int:
+        """Index a geo_species response for `species_code` around a point."""
+        now = self._clock()
+        # a refetch of the same circle replaces its coverage
+        self._coverage[species_code] = [
+            coverage
+            for coverage in self._coverage.get(species_code, [])
+            if coverage[1:] != (latitude, longitude, radius_km)
+        ] + [(now, latitude, longitude, radius_km)]
+
+        added = 0
+        for observation in observations:
+            location_id = observation.loc_id
+            if (
+                observation.species_code != species_code
+                or not location_id
+                or observation.lat is None
+                or observation.lng is None
+            ):
+                continue
+
+            locations = self._cells.setdefault(
+                cell_for(observation.lat, observation.lng), {}
+            ).setdefault(species_code, {})
+            known = locations.get(location_id)
+            # obs_dt is "YYYY-MM-DD HH:MM", so strings compare chronologically
+            if known is not None and (known[1].obs_dt or "") > (
+                observation.obs_dt or ""
+            ):
+                observation = known[1]
+            locations[location_id] = (now, observation)
+            added += 1
+        return added
+
+    def _cells_within(self, latitude: float, longitude: float, radius_km: float):
+        # the point and an observation can each be up to half a cell from
+        # their cell's center, so look one cell further than the radius
+        center_latitude, center_longitude = cell_for(latitude, longitude)
+        latitude_steps = math.ceil(
+            radius_km / KM_PER_DEGREE_LATITUDE / CELL_DEGREES + 1
+        )
+        # a degree of longitude shrinks towards the poles
+        km_per_degree_longitude = KM_PER_DEGREE_LATITUDE * max(
+            math.cos(math.radians(latitude)), 0.1
+        )
+        longitude_steps = math.ceil(
+            radius_km / km_per_degree_longitude / CELL_DEGREES + 1
+        )
+        for latitude_step in range(-latitude_steps, latitude_steps + 1):
+            for longitude_step in range(-longitude_steps, longitude_steps + 1):
+                yield (
+                    center_latitude + latitude_step * CELL_DEGREES,
+                    center_longitude + longitude_step * CELL_DEGREES,
+                )
+
+    def covers(
+        self, species_code: str, latitude: float, longitude: float, radius_km: float
+    ) -> bool:
+        oldest = self._clock() - self.max_age_seconds
+        return any(
+            indexed_at >= oldest
+            and distance_km(latitude, longitude, covered_latitude, covered_longitude)
+            + radius_km
+            <= covered_radius_km
+            for indexed_at, covered_latitude, covered_longitude, covered_radius_km in (
+                self._coverage.get(species_code, [])
+            )
+        )
+
+    def lookup(
+        self, species_code: str, latitude: float, longitude: float, radius_km: float
+    ) -> list[PhoebeObservation] | None:
+        """
+        Indexed observations of a species within `radius_km`, nearest first,
+        or None when no indexed response covers the whole circle.
+        """
+        self.lookups += 1
+        if not self.covers(species_code, latitude, longitude, radius_km):
+            return None
+        self.answered += 1
+        oldest = self._clock() - self.max_age_seconds
+
+        found: list[tuple[float, PhoebeObservation]] = []
+        for cell in self._cells_within(latitude, longitude, radius_km):
+            locations = self._cells.get(cell, {}).get(species_code)
+            if not locations:
+                continue
+            for indexed_at, observation in locations.values():
+                if indexed_at < oldest:
+                    continue
+                distance = distance_km(
+                    latitude, longitude, observation.lat or 0, observation.lng or 0
+                )
+                if distance <= radius_km:
+                    found.append((distance, observation))
+
+        found.sort(key=lambda found_observation: found_observation[0])
+        return [observation for _, observation in found]
+
+    def prune(self) -> int:
+        oldest = self._clock() - self.max_age_seconds
+        for species_code in list(self._coverage):
+            fresh = [
+                coverage
+                for coverage in self._coverage[species_code]
+                if coverage[0] >= oldest
+            ]
+            if fresh:
+                self._coverage[species_code] = fresh
+            else:
+                del self._coverage[species_code]
+
+        pruned = 0
+        for cell in list(self._cells):
+            species = self._cells[cell]
+            for species_code in list(species):
+                locations = species[species_code]
+                for location_id in list(locations):
+                    if locations[location_id][0] < oldest:
+                        del locations[location_id]
+                        pruned += 1
+                if not locations:
+                    del species[species_code]
+            if not species:
+                del self._cells[cell]
+        return pruned
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "cells": len(self._cells),
+            "species": len(self._coverage),
+            "observations": len(self),
+            "max_age_seconds": self.max_age_seconds,
+            "lookups": self.lookups,
+            "answered": self.answered,
+            "answered_rate": self.answered / self.lookups if self.lookups else 0.0,
+        }
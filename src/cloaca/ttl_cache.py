@@ -0,0 +1,108 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    In-process LRU cache where every entry expires `ttl_seconds` after it was set.
+
+    `clear()` bumps `generation`, and `set()` drops values computed against an
+    older generation, so a slow request that started before an invalidation
+    can't put a stale result back in the cache.
+
+    With `stale_seconds`, an entry is kept that much longer past its TTL and
+    `get_allow_stale()` still returns it (flagged as stale), so callers can
+    serve it while they refresh it. `get()` only ever returns fresh entries.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+        stale_seconds: float = 0,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.generation = 0
+        self._clock = clock
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_allow_stale(self, key: K) -> tuple[V, bool] | None:
+        """Return `(value, is_stale)`, or None if there's nothing servable."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        now = self._clock()
+        if expires_at + self.stale_seconds <= now:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        if expires_at <= now:
+            self.stale_hits += 1
+            return value, True
+        self.hits += 1
+        return value, False
+
+    def get(self, key: K) -> V | None:
+        entry = self.get_allow_stale(key)
+        if entry is None:
+            return None
+        value, is_stale = entry
+        if is_stale:
+            # counted as a miss by anyone who can't use stale values
+            self.stale_hits -= 1
+            self.misses += 1
+            return None
+        return value
+
+    def set(self, key: K, value: V, generation: int | None = None):
+        if generation is not None and generation != self.generation:
+            return
+
+        self._entries[key] = (self._clock() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.generation += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "stale_seconds": self.stale_seconds,
+            "generation": self.generation,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            # stale hits were still served from the cache
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -1,36 +1,53 @@
-from typing import Dict
-from cloaca.api.shared import get_taxonomy_info_for_species_code
+import os
+from typing import Dict, Iterable
+from cloaca.api.shared import TaxonInfo, ensure_taxonomy
+from cloaca.parsing.lifer_table import StringPool
 from cloaca.parsing.parsing_helpers import Lifer, Location, LocationToLifers
+from cloaca.upload_cache import (
+    UploadCache,
+    UploadedLifers,
+    get_upload_store_from_env,
+)
 from phoebe_bird.types.data.observation import Observation as PhoebeObservation
 from phoebe_bird.types.data.observations.geo.recent_list_response import (
     RecentListResponse,
 )
 
-csv_upload_cache: Dict[str, list[Lifer]] = {}
+
+csv_upload_cache = UploadCache(
+    store=get_upload_store_from_env(),
+    max_hot_entries=int(os.getenv("UPLOAD_CACHE_MAX_HOT_ENTRIES", "64")),
+    max_hot_bytes=int(os.getenv("UPLOAD_CACHE_MAX_HOT_MB", "256")) * 1024 * 1024,
+    hot_ttl_seconds=float(os.getenv("UPLOAD_CACHE_HOT_TTL_SECONDS", str(60 * 60))),
+    disk_ttl_seconds=float(
+        os.getenv("UPLOAD_CACHE_DISK_TTL_SECONDS", str(7 * 24 * 60 * 60))
+    ),
+)
 
 
 def set_lifers_to_cache(key: str, lifers: list[Lifer]):
-    csv_upload_cache[key] = lifers
+    csv_upload_cache.set(key, UploadedLifers.from_lifers(lifers))
 
 
-def get_lifers_from_cache(key: str) -> list[Lifer]:
-    observations = csv_upload_cache.get(key, None)
+def get_uploaded_lifers_from_cache(key: str) -> UploadedLifers:
+    uploaded = csv_upload_cache.get(key)
 
-    if not observations:
+    if not uploaded or not len(uploaded.table):
         raise Exception("No observations found for key", key)
 
-    return observations
+    return uploaded
+
+
+def get_lifers_from_cache(key: str) -> list[Lifer]:
+    return get_uploaded_lifers_from_cache(key).lifers
 
 
 def filter_lifers_from_observations(
-    observations: list[Lifer], lifers: list[Lifer]
+    observations: list[Lifer], lifers: UploadedLifers
 ) -> list[Lifer]:
-    print(f"Filtering obs: {len(observations)}. Lifers: {len(lifers)}")
+    print(f"Filtering obs: {len(observations)}. Lifers: {len(lifers.table)}")
 
-    lifer_sci_names = [lifer.scientific_name for lifer in lifers]
-
-    print(f"sample lifer: {lifers[0]}")
-    print(f"sample obs: {observations[0]}")
+    lifer_sci_names = lifers.scientific_names
 
     unseen_observations: list[Lifer] = list()
     already_seen_observations: list[Lifer] = list()
@@ -48,15 +65,13 @@ def filter_lifers_from_observations(
 
 
 async def filter_lifers_from_nearby_observations(
-    nearby_observations: RecentListResponse, lifers: list[Lifer]
+    nearby_observations: RecentListResponse, lifers: UploadedLifers
 ) -> list[Lifer]:
     # map through response and convert to lifers
-    nearby_observations_to_lifers: list[Lifer] = list()
-    for observation in nearby_observations:
-        nearby_observations_to_lifers.append(
-            await phoebe_observation_to_lifer(observation)
-        )
-    lifer_commons_names = [lifer.common_name for lifer in lifers]
+    nearby_observations_to_lifers = phoebe_observations_to_lifers(
+        nearby_observations, await ensure_taxonomy()
+    )
+    lifer_commons_names = lifers.common_names
 
     unseen_observations: list[Lifer] = list()
     already_seen_observations: list[Lifer] = list()
@@ -72,41 +87,113 @@ async def filter_lifers_from_nearby_observations(
     return unseen_observations
 
 
-async def phoebe_observation_to_lifer(
-    ebird_observation: PhoebeObservation,
-) -> Lifer:
-    taxon_info = await get_taxonomy_info_for_species_code(
-        ebird_observation.species_code or ""
-    )
-    if taxon_info.taxon_order is None:
-        print(f"Warning: taxon order missing for {taxon_info.species_code}")
-
-    return Lifer(
-        common_name=ebird_observation.com_name or "",
-        latitude=ebird_observation.lat or 0,
-        longitude=ebird_observation.lng or 0,
-        date=ebird_observation.obs_dt or "",
-        taxonomic_order=taxon_info.taxon_order or 0,
-        location=ebird_observation.loc_name or "",
-        location_id=ebird_observation.loc_id or "",
-        scientific_name=ebird_observation.sci_name or "",
-        species_code=ebird_observation.species_code,
-    )
-
+def phoebe_observations_to_lifers(
+    ebird_observations: Iterable[PhoebeObservation],
+    taxonomy: Dict[str, TaxonInfo],
+    strings: StringPool | None = None,
+) -> list[Lifer]:
+    """
+    Convert a batch of eBird observations in one synchronous pass, against a
+    taxonomy the caller resolved once (eg `await ensure_taxonomy()`).
+    """
+    missing_taxon_order: set[str] = set()
+
+    lifers: list[Lifer] = []
+    append = lifers.append
+    for ebird_observation in ebird_observations:
+        species_code = ebird_observation.species_code
+        taxon_info = taxonomy.get(species_code or "")
+        taxon_order = taxon_info.taxon_order if taxon_info is not None else None
+        if taxon_order is None:
+            missing_taxon_order.add(species_code or "")
+
+        append(
+            Lifer(
+                ebird_observation.com_name or "",
+                ebird_observation.lat or 0,
+                ebird_observation.lng or 0,
+                ebird_observation.obs_dt or "",
+                taxon_order or 0,
+                ebird_observation.loc_name or "",
+                ebird_observation.loc_id or "",
+                ebird_observation.sci_name or "",
+                species_code,
+            )
+        )
 
-def group_lifers_by_location(lifers: list[Lifer]) -> Dict[str, LocationToLifers]:
-    lifers_by_location: Dict[str, LocationToLifers] = {}
-    lifers.reverse()  # reverse to make sure we use the most recent location details!
-    for lifer in lifers:
-        key = lifer.location_id
-        if key not in lifers_by_location:
-            lifers_by_location[key] = LocationToLifers(
-                location=Location(
-                    lifer.location, lifer.latitude, lifer.longitude, lifer.location_id
-                ),
-                lifers=[lifer],
+    if strings is not None:
+        # every observation at a hotspot / of a species parses its own copy
+        # of the same strings, share one instead
+        intern = strings.intern
+        for lifer in lifers:
+            lifer.common_name = intern(lifer.common_name)
+            lifer.date = intern(lifer.date)
+            lifer.location = intern(lifer.location)
+            lifer.location_id = intern(lifer.location_id)
+            lifer.scientific_name = intern(lifer.scientific_name)
+            lifer.species_code = intern(lifer.species_code)
+
+    if missing_taxon_order:
+        print(f"Warning: taxon order missing for {sorted(missing_taxon_order)}")
+
+    return lifers
+
+
+class LocationGrouper:
+    """
+    Groups lifers by location id as they're added, so callers can feed it
+    each batch as it arrives instead of collecting everything first.
+
+    A location's details come from its most recent lifer by date, and its
+    lifers are listed most recent first, whatever order they were added in.
+    """
+
+    def __init__(self):
+        self._lifers_by_location: Dict[str, LocationToLifers] = {}
+        self._latest_dates: Dict[str, str] = {}
+        # locations where a lifer arrived more recent than the one before it
+        self._unsorted: set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._lifers_by_location)
+
+    def add(self, lifers: Iterable[Lifer]):
+        lifers_by_location = self._lifers_by_location
+        latest_dates = self._latest_dates
+        for lifer in lifers:
+            key = lifer.location_id
+            group = lifers_by_location.get(key)
+            if group is None:
+                lifers_by_location[key] = LocationToLifers(
+                    location=Location(
+                        lifer.location, lifer.latitude, lifer.longitude, key
+                    ),
+                    lifers=[lifer],
+                )
+                latest_dates[key] = lifer.date
+                continue
+
+            if lifer.date > group.lifers[-1].date:
+                self._unsorted.add(key)
+            group.lifers.append(lifer)
+
+            if lifer.date >= latest_dates[key]:
+                latest_dates[key] = lifer.date
+                group.location = Location(
+                    lifer.location, lifer.latitude, lifer.longitude, key
+                )
+
+    def result(self) -> Dict[str, LocationToLifers]:
+        for key in self._unsorted:
+            # stable, so lifers from the same date keep the order they came in
+            self._lifers_by_location[key].lifers.sort(
+                key=lambda lifer: lifer.date, reverse=True
             )
-        else:
-            lifers_by_location[key].lifers.append(lifer)
+        self._unsorted.clear()
+        return self._lifers_by_location
+
 
-    return lifers_by_location
+def group_lifers_by_location(lifers: Iterable[Lifer]) -> Dict[str, LocationToLifers]:
+    grouper = LocationGrouper()
+    grouper.add(lifers)
+    return grouper.result()
@@ -0,0 +1,243 @@
+import asyncio
+import os
+import resource
+import tempfile
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+
+from cloaca.parsing.lifer_table import LiferTable
+from cloaca.parsing.parsing_helpers import Lifer
+from cloaca.upload_store import (
+    ParquetUploadStore,
+    SQLiteUploadStore,
+    UploadStore,
+    is_valid_upload_key,
+    validate_upload_key,
+)
+
+
+@dataclass
+class UploadedLifers:
+    table: LiferTable
+    # precomputed once per upload so filtering is an O(1) membership test
+    scientific_names: frozenset[str]
+    common_names: frozenset[str]
+
+    @classmethod
+    def from_table(cls, table: LiferTable) -> "UploadedLifers":
+        return cls(
+            table=table,
+            scientific_names=frozenset(table.distinct("scientific_name")),
+            common_names=frozenset(table.distinct("common_name")),
+        )
+
+    @classmethod
+    def from_lifers(cls, lifers: list[Lifer]) -> "UploadedLifers":
+        return cls.from_table(LiferTable.from_lifers(lifers))
+
+    @property
+    def lifers(self) -> list[Lifer]:
+        """A fresh list every time, so callers are free to sort / reverse it."""
+        return self.table.to_lifers()
+
+
+class UploadCache:
+    """
+    LRU of parsed uploads that keeps hot entries in memory and everything else
+    in an UploadStore (parquet files under `spill_dir` by default).
+
+    An entry leaves memory when it's been idle for `hot_ttl_seconds` or when
+    the in-memory entries go over `max_hot_entries` / `max_hot_bytes`. Evicted
+    entries are reloaded from the store on the next `get`, and deleted from it
+    once they haven't been written or reloaded for `disk_ttl_seconds`.
+
+    With a shared store every `set` is written through straight away, so other
+    worker processes can `get` the upload too. Otherwise entries are written to
+    the store when they're spilled, on a worker thread when there's a running
+    event loop, and served from memory until that's done.
+    """
+
+    def __init__(
+        self,
+        spill_dir: str | None = None,
+        max_hot_entries: int = 64,
+        max_hot_bytes: int = 256 * 1024 * 1024,
+        hot_ttl_seconds: float = 60 * 60,
+        disk_ttl_seconds: float = 7 * 24 * 60 * 60,
+        clock: Callable[[], float] = time.time,
+        store: UploadStore | None = None,
+    ):
+        if store is None:
+            if spill_dir is None:
+                raise ValueError("UploadCache needs either a spill_dir or a store")
+            store = ParquetUploadStore(spill_dir)
+        self.store = store
+        self.max_hot_entries = max_hot_entries
+        self.max_hot_bytes = max_hot_bytes
+        self.hot_ttl_seconds = hot_ttl_seconds
+        self.disk_ttl_seconds = disk_ttl_seconds
+        self._clock = clock
+
+        # key -> (last access time, estimated bytes, lifers)
+        self._hot: OrderedDict[str, tuple[float, int, UploadedLifers]] = OrderedDict()
+        self._hot_bytes = 0
+        # spilled out of memory, but not written to the store yet
+        self._spilling: Dict[str, UploadedLifers] = {}
+        self._spill_writer: asyncio.Task | None = None
+
+        self.spills = 0
+        self.reloads = 0
+        self.disk_expirations = 0
+
+    def _remove_hot(self, key: str) -> UploadedLifers:
+        _, size, uploaded = self._hot.pop(key)
+        self._hot_bytes -= size
+        return uploaded
+
+    def _spill(self, key: str):
+        uploaded = self._remove_hot(key)
+        self.spills += 1
+        if self.store.shared:
+            # already written through in set()
+            return
+        self._spilling[key] = uploaded
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # scripts / tests using the cache without an event loop
+            self._write_spill(key, uploaded)
+            self._finish_spill(key, uploaded)
+            return
+        if self._spill_writer is None or self._spill_writer.done():
+            self._spill_writer = loop.create_task(self._write_spills())
+
+    def _write_spill(self, key: str, uploaded: UploadedLifers):
+        try:
+            self.store.write(key, uploaded.table, self._clock())
+        except Exception as e:
+            print(f"Error spilling upload {key} to disk, dropping it: {e}")
+
+    def _finish_spill(self, key: str, uploaded: UploadedLifers):
+        # unless a get() took it back in the meantime
+        if self._spilling.get(key) is uploaded:
+            del self._spilling[key]
+
+    async def _write_spills(self):
+        # parquet writes are blocking file IO, keep them off the loop. only
+        # the store is touched on the worker thread, the cache isn't thread safe
+        while self._spilling:
+            key, uploaded = next(iter(self._spilling.items()))
+            await asyncio.to_thread(self._write_spill, key, uploaded)
+            self._finish_spill(key, uploaded)
+
+    def _spill_idle(self):
+        now = self._clock()
+        # oldest first, so stop at the first entry that's still fresh
+        while self._hot:
+            key, (last_access, _, _) = next(iter(self._hot.items()))
+            if now - last_access < self.hot_ttl_seconds:
+                break
+            self._spill(key)
+
+    def _enforce_bounds(self):
+        self._spill_idle()
+
+        while self._hot and (
+            len(self._hot) > self.max_hot_entries
+            or self._hot_bytes > self.max_hot_bytes
+        ):
+            # always keep the most recent entry in memory
+            if len(self._hot) == 1:
+                break
+            self._spill(next(iter(self._hot)))
+
+    def _set_hot(self, key: str, uploaded: UploadedLifers):
+        if key in self._hot:
+            self._remove_hot(key)
+        size = uploaded.table.size_bytes()
+        self._hot[key] = (self._clock(), size, uploaded)
+        self._hot_bytes += size
+        self._enforce_bounds()
+
+    def set(self, key: str, uploaded: UploadedLifers):
+        validate_upload_key(key)
+        if self.store.shared:
+            # fail the upload rather than hand out a file_id other workers can't see
+            self.store.write(key, uploaded.table, self._clock())
+        self._set_hot(key, uploaded)
+
+    def get(self, key: str) -> UploadedLifers | None:
+        if key in self._hot:
+            _, size, uploaded = self._hot[key]
+            self._hot[key] = (self._clock(), size, uploaded)
+            self._hot.move_to_end(key)
+            self._enforce_bounds()
+            return uploaded
+
+        uploaded = self._spilling.pop(key, None)
+        if uploaded is not None:
+            self._set_hot(key, uploaded)
+            return uploaded
+
+        if not is_valid_upload_key(key):
+            return None
+
+        table = self.store.read(key, self.disk_ttl_seconds, self._clock())
+        if table is None:
+            return None
+
+        print(f"Reloaded stored upload {key} with {len(table)} lifers")
+        uploaded = UploadedLifers.from_table(table)
+        self.reloads += 1
+        self._set_hot(key, uploaded)
+        return uploaded
+
+    def expire(self):
+        """Spill idle entries and delete stored uploads past their TTL. Run periodically."""
+        self._spill_idle()
+        self.disk_expirations += self.store.expire(self.disk_ttl_seconds, self._clock())
+
+    def get_stats(self) -> Dict[str, Any]:
+        store_stats = self.store.get_stats()
+        return {
+            "hot_entries": len(self._hot),
+            "max_hot_entries": self.max_hot_entries,
+            "hot_bytes_estimate": self._hot_bytes,
+            "max_hot_bytes": self.max_hot_bytes,
+            "spilling_entries": len(self._spilling),
+            "store_backend": store_stats.pop("backend"),
+            "spilled_entries": store_stats.pop("stored_entries"),
+            "spilled_bytes": store_stats.pop("stored_bytes"),
+            **store_stats,
+            "spills": self.spills,
+            "reloads": self.reloads,
+            "disk_expirations": self.disk_expirations,
+            # peak resident set size of the whole process (KB on linux)
+            "process_max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+
+def get_upload_cache_dir() -> str:
+    return os.getenv(
+        "UPLOAD_CACHE_DIR", os.path.join(tempfile.gettempdir(), "cloaca_uploads")
+    )
+
+
+def get_upload_store_from_env() -> UploadStore:
+    """
+    UPLOAD_STORE=sqlite shares uploads between worker processes through a
+    SQLite file (UPLOAD_STORE_PATH), needed when running more than one uvicorn
+    worker. The default keeps them per process, spilling to parquet files.
+    """
+    backend = os.getenv("UPLOAD_STORE", "parquet")
+    if backend == "sqlite":
+        return SQLiteUploadStore(
+            os.getenv(
+                "UPLOAD_STORE_PATH", os.path.join(get_upload_cache_dir(), "uploads.db")
+            )
+        )
+    if backend == "parquet":
+        return ParquetUploadStore(get_upload_cache_dir())
+    raise ValueError(f"Unknown UPLOAD_STORE {backend!r}, expected sqlite or parquet")
@@ -0,0 +1,235 @@
+import json
+import os
+import re
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Protocol
+
+import duckdb
+import pandas as pd
+
+from cloaca.parsing.lifer_table import LIFER_COLUMNS, LiferTable
+
+# upload keys are uuid4s we hand out, but they come back in from query params
+# so make sure they can't be used to escape a store's directory
+_VALID_KEY = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def validate_upload_key(key: str) -> str:
+    if not _VALID_KEY.match(key):
+        raise ValueError(f"Invalid upload key: {key!r}")
+    return key
+
+
+def is_valid_upload_key(key: str) -> bool:
+    return bool(_VALID_KEY.match(key))
+
+
+def encode_lifers(table: LiferTable) -> bytes:
+    """
+    Columnar encoding of a list of lifers: one JSON array per column, zlib
+    compressed. Uploads repeat the same locations / dates / names a lot, so
+    this ends up a fraction of the size of a row per lifer.
+    """
+    columns = {column: table.column(column) for column in LIFER_COLUMNS}
+    return zlib.compress(json.dumps(columns, separators=(",", ":")).encode())
+
+
+def decode_lifers(payload: bytes) -> LiferTable:
+    return LiferTable(json.loads(zlib.decompress(payload)))
+
+
+class UploadStore(Protocol):
+    """
+    Durable backing store for parsed uploads, sitting behind UploadCache.
+
+    `shared` stores are visible to every worker process, so the cache writes
+    uploads through to them as soon as they're set. Non-shared stores only
+    get written when the cache spills an entry out of memory.
+    """
+
+    shared: bool
+
+    def write(self, key: str, table: LiferTable, now: float): ...
+
+    def read(self, key: str, max_age_seconds: float, now: float) -> LiferTable | None:
+        """
+        The stored table, or None if missing or not written / read in the
+        last `max_age_seconds`. Reading it restarts its age.
+        """
+        ...
+
+    def expire(self, max_age_seconds: float, now: float) -> int:
+        """Delete everything not written / read in `max_age_seconds`, returns how many were deleted."""
+        ...
+
+    def get_stats(self) -> Dict[str, Any]: ...
+
+
+class ParquetUploadStore:
+    """One parquet file per upload under `directory`. Only this process reads it."""
+
+    shared = False
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self._con: duckdb.DuckDBPyConnection | None = None
+
+    def _get_con(self) -> duckdb.DuckDBPyConnection:
+        if self._con is None:
+            self._con = duckdb.connect()
+        return self._con
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{validate_upload_key(key)}.parquet"
+
+    def write(self, key: str, table: LiferTable, now: float):
+        # age comes from the file's mtime, so `now` isn't needed here
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_suffix(".parquet.tmp")
+        df = pd.DataFrame(
+            {column: table.column(column) for column in LIFER_COLUMNS},
+            columns=LIFER_COLUMNS,
+        )
+        # its own cursor, UploadCache runs writes on a worker thread. the
+        # relation API takes the path as an argument, no SQL to quote it into
+        with self._get_con().cursor() as con:
+            con.from_df(df).write_parquet(str(tmp_path))
+        os.replace(tmp_path, path)
+
+    def read(self, key: str, max_age_seconds: float, now: float) -> LiferTable | None:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        if now - path.stat().st_mtime > max_age_seconds:
+            path.unlink(missing_ok=True)
+            return None
+        # age comes from the mtime, so bump it like a write would
+        os.utime(path, (now, now))
+
+        rows = (
+            self._get_con()
+            .execute(
+                f"SELECT {', '.join(LIFER_COLUMNS)} FROM read_parquet(?)", [str(path)]
+            )
+            .fetchall()
+        )
+        return LiferTable.from_rows(rows)
+
+    def expire(self, max_age_seconds: float, now: float) -> int:
+        if not self.directory.exists():
+            return 0
+        expired = 0
+        for path in self.directory.glob("*.parquet"):
+            if now - path.stat().st_mtime > max_age_seconds:
+                path.unlink(missing_ok=True)
+                expired += 1
+        return expired
+
+    def get_stats(self) -> Dict[str, Any]:
+        stored = (
+            list(self.directory.glob("*.parquet")) if self.directory.exists() else []
+        )
+        return {
+            "backend": "parquet",
+            "stored_entries": len(stored),
+            "stored_bytes": sum(path.stat().st_size for path in stored),
+        }
+
+
+class SQLiteUploadStore:
+    """
+    Every upload as one row in a SQLite file that all uvicorn workers on the
+    host open, so a file_id handed out by one worker works on the others.
+
+    WAL mode lets workers read while another one writes. Uploads are never
+    modified after they're written (every upload gets a new uuid), so workers
+    can keep their own in-memory copies without any invalidation.
+
+    `accessed_at` is bumped by every read, so an upload only expires once no
+    worker has loaded it for the max age.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, busy_timeout_seconds: float = 5):
+        self.path = Path(path)
+        self.busy_timeout_seconds = busy_timeout_seconds
+        self._con: sqlite3.Connection | None = None
+
+    def _get_con(self) -> sqlite3.Connection:
+        if self._con is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            con = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout_seconds,
+                isolation_level=None,  # autocommit, every statement is its own txn
+                check_same_thread=False,
+            )
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS uploads (
+                    key TEXT PRIMARY KEY,
+                    accessed_at REAL NOT NULL,
+                    lifer_count INTEGER NOT NULL,
+                    payload BLOB NOT NULL
+                )
+                """
+            )
+            con.execute(
+                "CREATE INDEX IF NOT EXISTS uploads_accessed_at ON uploads (accessed_at)"
+            )
+            self._con = con
+        return self._con
+
+    def write(self, key: str, table: LiferTable, now: float):
+        validate_upload_key(key)
+        self._get_con().execute(
+            "INSERT OR REPLACE INTO uploads (key, accessed_at, lifer_count, payload) "
+            "VALUES (?, ?, ?, ?)",
+            (key, now, len(table), encode_lifers(table)),
+        )
+
+    def read(self, key: str, max_age_seconds: float, now: float) -> LiferTable | None:
+        # fetchall steps the update to completion, so it's committed (and the
+        # write lock released) before we decode
+        rows = (
+            self._get_con()
+            .execute(
+                "UPDATE uploads SET accessed_at = ? "
+                "WHERE key = ? AND accessed_at >= ? RETURNING payload",
+                (now, validate_upload_key(key), now - max_age_seconds),
+            )
+            .fetchall()
+        )
+        if not rows:
+            return None
+        return decode_lifers(rows[0][0])
+
+    def expire(self, max_age_seconds: float, now: float) -> int:
+        cursor = self._get_con().execute(
+            "DELETE FROM uploads WHERE accessed_at < ?", (now - max_age_seconds,)
+        )
+        return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, Any]:
+        entries, payload_bytes = (
+            self._get_con()
+            .execute("SELECT count(*), coalesce(sum(length(payload)), 0) FROM uploads")
+            .fetchone()
+        )
+        return {
+            "backend": "sqlite",
+            "path": str(self.path),
+            "stored_entries": entries,
+            "stored_bytes": payload_bytes,
+        }
+
+    def close(self):
+        if self._con is not None:
+            self._con.close()
+            self._con = None
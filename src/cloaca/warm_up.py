@@ -0,0 +1,74 @@
+import datetime
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict
+
+
+@dataclass
+class ComponentWarmUp:
+    duration_seconds: float
+    detail: str | None = None
+    # set when the component failed, it'll be loaded lazily on first use instead
+    error: str | None = None
+
+
+@dataclass
+class WarmUpReport:
+    started_at: float
+    finished: bool = False
+    duration_seconds: float | None = None
+    components: Dict[str, ComponentWarmUp] = field(default_factory=dict)
+
+    async def run_component(
+        self, name: str, warm_up: Callable[[], Awaitable[str | None]]
+    ):
+        start = time.perf_counter()
+        try:
+            detail = await warm_up()
+            component = ComponentWarmUp(
+                duration_seconds=time.perf_counter() - start, detail=detail
+            )
+        except Exception as e:
+            print(f"Error warming up {name}:", e)
+            component = ComponentWarmUp(
+                duration_seconds=time.perf_counter() - start, error=repr(e)
+            )
+        self.components[name] = component
+        print(
+            f"Warmed up {name} in {component.duration_seconds:.3f}s"
+            f" ({component.error or component.detail})"
+        )
+
+    def finish(self):
+        self.finished = True
+        self.duration_seconds = time.time() - self.started_at
+
+
+# (latitude, longitude, radius_km) run against the parsed db during warm up,
+# to fault in the pages busy areas read
+DEFAULT_WARM_UP_POPULAR_HOTSPOTS = (
+    "40.7128,-74.0060,25;37.7749,-122.4194,25;41.8781,-87.6298,25"
+)
+
+
+@dataclass
+class PopularHotspotsQuery:
+    latitude: float
+    longitude: float
+    radius_km: float
+    month: int
+
+
+def get_warm_up_popular_hotspots_queries() -> list[PopularHotspotsQuery]:
+    """WARM_UP_POPULAR_HOTSPOTS="lat,lng,radius_km;...", run for the current month."""
+    month = datetime.date.today().month
+    queries = []
+    for query in os.getenv(
+        "WARM_UP_POPULAR_HOTSPOTS", DEFAULT_WARM_UP_POPULAR_HOTSPOTS
+    ).split(";"):
+        if not query.strip():
+            continue
+        latitude, longitude, radius_km = (float(value) for value in query.split(","))
+        queries.append(PopularHotspotsQuery(latitude, longitude, radius_km, month))
+    return queries
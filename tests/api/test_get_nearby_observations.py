@@ -1,7 +1,21 @@
+import asyncio
+
 import pytest
-from cloaca.api.get_nearby_observations import get_nearby_observations
+from phoebe_bird.types.data.observation import Observation as PhoebeObservation
+
+from cloaca.api import get_nearby_observations as get_nearby_observations_module
+from cloaca.api.get_nearby_observations import (
+    get_nearby_observations,
+    get_unseen_species_codes,
+    lookup_species_near,
+    lookup_unseen_species,
+    stream_nearby_observations,
+)
+from cloaca.api.shared import NEARBY_OBSERVATIONS_DISTANCE_KM
 from cloaca.parsing.parsing_helpers import Lifer, Location
+from cloaca.species_index import SpeciesIndex
 from cloaca.types import set_lifers_to_cache
+from cloaca.upload_cache import UploadedLifers
 
 DEFAULT_LONGITUDE = -74.0242
 DEFAULT_LATITUDE = 40.6941
@@ -72,3 +86,199 @@ async def test_get_nearby_observations():
     )
 
     assert example_house_sparrow == expected_observation
+
+
+def species_observations(species_code: str) -> list[PhoebeObservation]:
+    return [
+        PhoebeObservation.model_validate(
+            {
+                "speciesCode": species_code,
+                "comName": species_code,
+                "sciName": species_code,
+                "locId": "L191106",
+                "locName": "Central Park",
+                "lat": 40.7715482,
+                "lng": -73.9724819,
+                "obsDt": "2024-05-01 08:00",
+            }
+        )
+    ]
+
+
+@pytest.mark.asyncio
+async def test_index_lookups_match_what_ebird_returned(monkeypatch):
+    index = SpeciesIndex(max_age_seconds=60)
+    fetched: list[tuple[str, float, float]] = []
+
+    async def fake_fetch(species_code, latitude, longitude):
+        # what fetch_nearby_observations_of_species_from_ebird_with_cache does
+        fetched.append((species_code, latitude, longitude))
+        observations = species_observations(species_code)
+        index.add(
+            species_code,
+            latitude,
+            longitude,
+            NEARBY_OBSERVATIONS_DISTANCE_KM,
+            observations,
+        )
+        return observations
+
+    monkeypatch.setattr(
+        get_nearby_observations_module, "nearby_species_lookup", "index"
+    )
+    monkeypatch.setattr(get_nearby_observations_module, "recent_species_index", index)
+    monkeypatch.setattr(
+        get_nearby_observations_module,
+        "fetch_nearby_observations_of_species_from_ebird_with_cache",
+        fake_fetch,
+    )
+
+    from_ebird = await lookup_species_near("easpho", 40.5, -74.0)
+    from_index = await lookup_species_near("easpho", 40.5, -74.0)
+    assert from_index == from_ebird
+    # the next cell over isn't covered by the first response
+    await lookup_species_near("easpho", 41.0, -74.0)
+
+    assert fetched == [("easpho", 40.5, -74.0), ("easpho", 41.0, -74.0)]
+
+
+@pytest.mark.asyncio
+async def test_unseen_species_codes_skip_observations_without_one(monkeypatch):
+    async def fake_nearby(latitude, longitude):
+        without_code = species_observations("")[0].model_copy(
+            update={"species_code": None, "com_name": "Bird sp."}
+        )
+        return [
+            *species_observations("easpho"),
+            *species_observations("easpho"),
+            without_code,
+        ]
+
+    monkeypatch.setattr(
+        get_nearby_observations_module,
+        "fetch_nearby_observations_from_ebird_with_cache",
+        fake_nearby,
+    )
+
+    assert await get_unseen_species_codes(
+        40.5, -74.0, UploadedLifers.from_lifers([])
+    ) == ["easpho"]
+
+
+@pytest.mark.asyncio
+async def test_species_lookups_are_bounded_and_skip_failures(monkeypatch):
+    in_flight = 0
+    most_in_flight = 0
+
+    async def fake_lookup(species_code, latitude, longitude):
+        nonlocal in_flight, most_in_flight
+        in_flight += 1
+        most_in_flight = max(most_in_flight, in_flight)
+        try:
+            if species_code == "slow":
+                await asyncio.sleep(1)
+            await asyncio.sleep(0.01)
+            if species_code == "broken":
+                raise RuntimeError("eBird is down")
+            return species_observations(species_code)
+        finally:
+            in_flight -= 1
+
+    monkeypatch.setattr(
+        get_nearby_observations_module, "lookup_species_near", fake_lookup
+    )
+    monkeypatch.setattr(get_nearby_observations_module, "nearby_species_workers", 3)
+    monkeypatch.setattr(
+        get_nearby_observations_module, "nearby_species_timeout_seconds", 0.1
+    )
+
+    codes = [f"spec{i}" for i in range(10)] + ["slow", "broken"]
+    resolved = [
+        observations async for observations in lookup_unseen_species(codes, 40.5, -74.0)
+    ]
+
+    assert most_in_flight == 3
+    assert len(resolved) == len(codes)
+    assert sorted(
+        observations[0].species_code for observations in resolved if observations
+    ) == sorted(f"spec{i}" for i in range(10))
+
+
+@pytest.mark.asyncio
+async def test_species_lookups_return_what_resolved_by_the_deadline(monkeypatch):
+    async def fake_lookup(species_code, latitude, longitude):
+        if species_code == "slow":
+            await asyncio.sleep(1)
+        return species_observations(species_code)
+
+    monkeypatch.setattr(
+        get_nearby_observations_module, "lookup_species_near", fake_lookup
+    )
+    monkeypatch.setattr(
+        get_nearby_observations_module, "nearby_observations_deadline_seconds", 0.1
+    )
+    stats = dict.fromkeys(get_nearby_observations_module.nearby_species_lookup_stats, 0)
+    monkeypatch.setattr(
+        get_nearby_observations_module, "nearby_species_lookup_stats", stats
+    )
+
+    resolved = [
+        observations
+        async for observations in lookup_unseen_species(
+            ["easpho", "slow", "houspa"], 40.5, -74.0
+        )
+    ]
+
+    assert sorted(observations[0].species_code for observations in resolved) == [
+        "easpho",
+        "houspa",
+    ]
+    assert stats["species_looked_up"] == 2
+    assert stats["species_past_deadline"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_nearby_observations_yields_a_chunk_per_species(monkeypatch):
+    async def fake_unseen_species_codes(latitude, longitude, lifers_from_csv):
+        return ["easpho", "houspa"]
+
+    async def fake_lookup(species_code, latitude, longitude):
+        return species_observations(species_code)
+
+    monkeypatch.setattr(
+        get_nearby_observations_module,
+        "get_unseen_species_codes",
+        fake_unseen_species_codes,
+    )
+    monkeypatch.setattr(
+        get_nearby_observations_module, "lookup_species_near", fake_lookup
+    )
+    set_lifers_to_cache(
+        "stream-key",
+        [
+            Lifer(
+                common_name="Northern Harrier",
+                latitude=29.819019,
+                longitude=-89.61216,
+                date="2022-11-21",
+                taxonomic_order=8228,
+                location="Hopedale",
+                location_id="L21909958",
+                scientific_name="Circus hudsonius",
+                species_code="norhar2",
+            )
+        ],
+    )
+
+    chunks = [
+        chunk
+        async for chunk in await stream_nearby_observations(
+            40.6941, -74.0242, "stream-key"
+        )
+    ]
+
+    assert len(chunks) == 2
+    assert sorted(chunk["L191106"].lifers[0].species_code for chunk in chunks) == [
+        "easpho",
+        "houspa",
+    ]
@@ -1,17 +1,31 @@
+import httpx
 import pytest
+from phoebe_bird import AsyncPhoebe, DefaultAsyncHttpxClient, InternalServerError
+from cloaca.api import get_new_lifers_by_region
 from cloaca.api.get_new_lifers_by_region import (
+    RegionBounds,
+    SubRegionAndObservations,
     fetch_observations_for_regions_from_phoebe,
+    filtered_regional_lifers_cache,
+    find_region_codes_near,
     get_filtered_lifers_for_region,
     get_lifers_for_region,
     get_regional_mapping,
+    load_regional_mapping_from_snapshot,
+    save_regional_mapping_snapshot,
 )
+from cloaca.parsing.parse_ebird_regional_list import SubnationalRegion
 from cloaca.parsing.parsing_helpers import Lifer
 from cloaca.types import set_lifers_to_cache
 
 
 @pytest.mark.asyncio
 @pytest.mark.vcr
-async def test_get_regional_mapping():
+async def test_get_regional_mapping(monkeypatch):
+    # the cassette answers instantly, don't wait on eBird's rate limit
+    monkeypatch.setattr(
+        get_new_lifers_by_region, "regional_refresh_requests_per_second", 1000
+    )
     await get_regional_mapping()
 
     ny_obs = get_lifers_for_region("US-NY")
@@ -29,6 +43,29 @@ async def test_fetch_observations_for_regions_from_phoebe():
     assert first_obs.species_code == "bkcchi"
 
 
+@pytest.mark.asyncio
+async def test_regional_fetches_leave_retries_to_the_refresh(monkeypatch):
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(500, json={})
+
+    client = AsyncPhoebe(
+        api_key="test",
+        max_retries=2,
+        http_client=DefaultAsyncHttpxClient(transport=httpx.MockTransport(handler)),
+    )
+    monkeypatch.setattr(
+        get_new_lifers_by_region, "get_cached_phoebe_client", lambda: client
+    )
+
+    with pytest.raises(InternalServerError):
+        await fetch_observations_for_regions_from_phoebe("US-NY")
+
+    assert len(requests) == 1
+
+
 @pytest.mark.asyncio
 @pytest.mark.vcr
 async def test_regional_lifers():
@@ -55,3 +92,234 @@ async def test_regional_lifers():
 
     # make sure the lifer is not in the list
     assert all(lifer.species_code != "norhar2" for lifer in lifers)
+
+
+@pytest.mark.asyncio
+async def test_filtered_regional_lifers_are_memoized(monkeypatch, make_lifer):
+    mapping = {
+        "US-NY": SubRegionAndObservations(
+            subnational_region=SubnationalRegion(
+                country_code="US",
+                country_name="United States",
+                subnational1_code="US-NY",
+                subnational1_name="New York",
+            ),
+            observations=[
+                make_lifer("House Sparrow", "Passer domesticus"),
+                make_lifer("Eastern Phoebe", "Sayornis phoebe"),
+            ],
+        )
+    }
+    monkeypatch.setattr(get_new_lifers_by_region, "regional_mapping", mapping)
+    filtered_regional_lifers_cache.clear()
+    set_lifers_to_cache("memo-key", [make_lifer("House Sparrow", "Passer domesticus")])
+
+    first = await get_filtered_lifers_for_region(40.6941, -74.0242, "memo-key")
+    second = await get_filtered_lifers_for_region(40.6941, -74.0242, "memo-key")
+
+    assert [lifer.common_name for lifer in first] == ["Eastern Phoebe"]
+    assert second is first
+
+    # a refreshed regional mapping invalidates the memo
+    filtered_regional_lifers_cache.clear()
+    third = await get_filtered_lifers_for_region(40.6941, -74.0242, "memo-key")
+    assert third is not first
+    assert third == first
+
+
+@pytest.mark.asyncio
+async def test_regional_mapping_refresh_keeps_failed_regions(monkeypatch):
+    previous_ny = SubRegionAndObservations(
+        subnational_region=SubnationalRegion(
+            country_code="US",
+            country_name="United States",
+            subnational1_code="US-NY",
+            subnational1_name="New York",
+        ),
+        observations=[],
+    )
+    monkeypatch.setattr(
+        get_new_lifers_by_region, "regional_mapping", {"US-NY": previous_ny}
+    )
+
+    async def fake_fetch(subnational_code: str, refresh_http_cache: bool = False):
+        if subnational_code == "US-NY":
+            raise ValueError("eBird is down")
+        return []
+
+    monkeypatch.setattr(
+        get_new_lifers_by_region,
+        "fetch_observations_for_regions_from_phoebe",
+        fake_fetch,
+    )
+    monkeypatch.setattr(
+        get_new_lifers_by_region, "regional_refresh_requests_per_second", 1000
+    )
+
+    report = await get_regional_mapping()
+
+    assert report.failed_regions.keys() == {"US-NY"}
+    assert get_new_lifers_by_region.regional_mapping["US-NY"] is previous_ny
+    assert get_lifers_for_region("US-CA") == []
+    assert report.regions > 50
+
+
+def region_with_hotspots(make_lifer, code: str, *hotspots: tuple[float, float]):
+    observations = [
+        make_lifer(latitude=latitude, longitude=longitude)
+        for latitude, longitude in hotspots
+    ]
+    return SubRegionAndObservations(
+        subnational_region=SubnationalRegion(
+            country_code="US",
+            country_name="United States",
+            subnational1_code=code,
+            subnational1_name=code,
+        ),
+        observations=observations,
+        bounds=RegionBounds.from_lifers(observations),
+    )
+
+
+def test_find_region_codes_near(monkeypatch, make_lifer):
+    monkeypatch.setattr(
+        get_new_lifers_by_region,
+        "regional_mapping",
+        {
+            "US-NY": region_with_hotspots(
+                make_lifer,
+                "US-NY",
+                (40.55, -74.13),  # Great Kills Park, Staten Island
+                (40.77, -73.97),  # Central Park
+                (42.9, -78.8),  # Buffalo
+                (41.07, -71.86),  # Montauk
+            ),
+            "US-NJ": region_with_hotspots(
+                make_lifer,
+                "US-NJ",
+                (38.93, -74.9),  # Cape May
+                (40.7, -74.05),  # Liberty State Park
+                (40.43, -73.99),  # Sandy Hook
+            ),
+            "US-CA": region_with_hotspots(
+                make_lifer, "US-CA", (32.5, -117.1), (42.0, -124.4)
+            ),
+        },
+    )
+
+    # both are inside the NY and NJ boxes, the closest hotspot decides
+    assert find_region_codes_near(40.58, -74.12) == ["US-NY"]
+    assert find_region_codes_near(40.68, -74.1) == ["US-NJ"]
+    # containing regions rank ahead of the ones the point is only near
+    assert find_region_codes_near(40.58, -74.12, include_neighbors=True) == [
+        "US-NY",
+        "US-NJ",
+    ]
+    # just offshore of long island, fall back to the closest region
+    assert find_region_codes_near(40.3, -71.5) == ["US-NY"]
+    assert find_region_codes_near(40.3, -71.5, include_neighbors=True) == ["US-NY"]
+    # nowhere near the US: everything
+    assert find_region_codes_near(72, 71) == ["US-CA", "US-NJ", "US-NY"]
+
+
+def test_find_region_codes_near_across_the_antimeridian(monkeypatch, make_lifer):
+    monkeypatch.setattr(
+        get_new_lifers_by_region,
+        "regional_mapping",
+        {
+            "US-AK": region_with_hotspots(
+                make_lifer,
+                "US-AK",
+                (61.2, -149.9),  # Anchorage
+                (58.3, -134.4),  # Juneau
+                (51.88, -176.65),  # Adak
+                (52.9, 173.2),  # Attu
+            ),
+            "US-HI": region_with_hotspots(
+                make_lifer, "US-HI", (21.3, -157.85), (19.7, -155.1)
+            ),
+        },
+    )
+
+    # in the Aleutians, west of the antimeridian
+    assert find_region_codes_near(52.5, 178.0) == ["US-AK"]
+    # Edmonton is inside a box from Attu east to Juneau the long way round
+    assert find_region_codes_near(53.5, -113.5) == ["US-AK", "US-HI"]
+    assert find_region_codes_near(21.3, -157.8, include_neighbors=True) == ["US-HI"]
+
+
+def test_region_bounds_from_lifers(make_lifer):
+    bounds = RegionBounds.from_lifers(
+        [
+            make_lifer(latitude=40.7, longitude=-74.0),
+            make_lifer(latitude=42.6, longitude=-73.7),
+            make_lifer(latitude=0, longitude=0),
+        ]
+    )
+
+    assert bounds == RegionBounds(
+        40.7, 42.6, -74.0, -73.7, hotspots=((40.7, -74.0), (42.6, -73.7))
+    )
+    assert RegionBounds.from_lifers([]) is None
+
+
+def test_region_bounds_wrap_around_the_antimeridian(make_lifer):
+    bounds = RegionBounds.from_lifers(
+        [
+            make_lifer(latitude=61.2, longitude=-149.9),
+            make_lifer(latitude=51.88, longitude=-176.65),
+            make_lifer(latitude=52.9, longitude=173.2),
+        ]
+    )
+
+    assert (bounds.min_longitude, bounds.max_longitude) == (173.2, -149.9)
+    assert bounds.distance_km(52.0, 179.9) == 0
+    assert bounds.distance_km(52.0, -179.9) == 0
+    # west of Attu is closer to its edge than to Anchorage's the other way
+    assert bounds.distance_km(52.9, 170.0) == pytest.approx(214, abs=1)
+    assert bounds.distance_km(55.0, -120.0) > 1000
+
+
+@pytest.mark.asyncio
+async def test_regional_mapping_snapshot_is_loaded_at_startup(monkeypatch, tmp_path):
+    lifer = Lifer(
+        common_name="Eastern Phoebe",
+        latitude=40.6602,
+        longitude=-73.969,
+        date="2024-05-01 07:30",
+        taxonomic_order=16840,
+        location="Prospect Park",
+        location_id="L109516",
+        scientific_name="Sayornis phoebe",
+        species_code="easpho",
+    )
+    region = SubnationalRegion(
+        country_code="US",
+        country_name="United States",
+        subnational1_code="US-NY",
+        subnational1_name="New York",
+    )
+    path = str(tmp_path / "regional_mapping.json.gz")
+    save_regional_mapping_snapshot(
+        {"US-NY": SubRegionAndObservations(region, [lifer])}, path
+    )
+
+    monkeypatch.setattr(get_new_lifers_by_region, "regional_mapping", {})
+    monkeypatch.setattr(
+        get_new_lifers_by_region, "regional_mapping_snapshot_path", path
+    )
+
+    assert await load_regional_mapping_from_snapshot()
+    loaded = get_new_lifers_by_region.regional_mapping["US-NY"]
+    assert loaded.subnational_region == region
+    assert loaded.observations == [lifer]
+    assert loaded.bounds == RegionBounds.from_lifers([lifer])
+
+    # never replaces a mapping that's already there (eg a finished refresh)
+    assert not await load_regional_mapping_from_snapshot()
+    # and old snapshots are ignored
+    monkeypatch.setattr(get_new_lifers_by_region, "regional_mapping", {})
+    monkeypatch.setattr(
+        get_new_lifers_by_region, "regional_mapping_snapshot_max_age_seconds", -1
+    )
+    assert not await load_regional_mapping_from_snapshot()
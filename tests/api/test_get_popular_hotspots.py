@@ -0,0 +1,118 @@
+import json
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from cloaca.api import get_popular_hotspots as popular_hotspots_api
+from cloaca.api.get_popular_hotspots import (
+    clear_popular_hotspots_cache,
+    get_popular_hotspots_cache_key,
+    get_popular_hotspots_json_api,
+    popular_hotspots_cache,
+)
+from cloaca.db.cursor_pool import DuckDBCursorPool
+from cloaca.db.db import get_db_connection_with_path
+from cloaca.db.popular_hotspots import get_popular_hotspots
+
+
+@pytest.fixture
+def duck_db_con():
+    con = get_db_connection_with_path(
+        str(Path(__file__).parent.parent / "data" / "test_parsed.db"),
+        read_only=True,
+        verify_tables_exist=False,
+    )
+    yield con
+    con.close()
+
+
+def query_directly(con, lookup):
+    return [hotspot.to_dict() for hotspot in get_popular_hotspots(con, *lookup)]
+
+
+@pytest.fixture
+def duck_db_pool(duck_db_con):
+    pool = DuckDBCursorPool(duck_db_con, max_workers=1)
+    clear_popular_hotspots_cache()
+    yield pool
+    pool.close()
+
+
+def test_cache_key_is_quantized():
+    assert get_popular_hotspots_cache_key(
+        40.69412, -74.02418, 24.2, 5
+    ) == get_popular_hotspots_cache_key(40.6938, -74.0239, 25, 5)
+
+    assert get_popular_hotspots_cache_key(
+        40.69412, -74.02418, 25, 5
+    ) != get_popular_hotspots_cache_key(40.69412, -74.02418, 25, 6)
+
+
+@pytest.mark.asyncio
+async def test_popular_hotspots_are_cached(duck_db_pool):
+    first = await get_popular_hotspots_json_api(duck_db_pool, 33, -87, 1000, 3)
+    # a slightly different location in the same grid cell
+    second = await get_popular_hotspots_json_api(duck_db_pool, 33.001, -87, 1000, 3)
+
+    assert len(json.loads(first)) == 7
+    assert first == second
+    assert duck_db_pool.get_stats()["completed"] == 1
+
+    stats = popular_hotspots_cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+    clear_popular_hotspots_cache()
+    await get_popular_hotspots_json_api(duck_db_pool, 33, -87, 1000, 3)
+    assert duck_db_pool.get_stats()["completed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_lookups_match_querying_the_exact_circle(
+    duck_db_con, duck_db_pool
+):
+    # all snap to the same cache entry, but reach a different set of hotspots
+    lookups = [(33, -87, 55.5, 3), (33.004, -87.004, 55.5, 3), (33, -87, 55.05, 3)]
+    counts = []
+    for lookup in lookups:
+        hotspots = json.loads(
+            await get_popular_hotspots_json_api(duck_db_pool, *lookup)
+        )
+        assert hotspots == query_directly(duck_db_con, lookup)
+        counts.append(len(hotspots))
+
+    assert counts == [2, 3, 1]
+    assert duck_db_pool.get_stats()["completed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_lookups_are_capped_after_the_circle(
+    duck_db_con, duck_db_pool, monkeypatch
+):
+    monkeypatch.setattr(popular_hotspots_api, "POPULAR_HOTSPOTS_LIMIT", 1)
+    # the padded search's busiest hotspot is just outside this circle, so
+    # capping before cutting down to it would leave nothing
+    lookup = (33, -87, 55.05, 3)
+
+    hotspots = json.loads(await get_popular_hotspots_json_api(duck_db_pool, *lookup))
+
+    assert hotspots == query_directly(duck_db_con, lookup)[:1]
+    assert hotspots[0]["locality_name"] == "University of Alabama Arboretum"
+
+
+@pytest.mark.asyncio
+async def test_failed_lookups_arent_cached(duck_db_pool):
+    # eg a parsed db that hasn't been rebuilt with the grid columns yet
+    con = duckdb.connect(":memory:")
+    broken_pool = DuckDBCursorPool(con, max_workers=1)
+    try:
+        with pytest.raises(duckdb.CatalogException):
+            await get_popular_hotspots_json_api(broken_pool, 33, -87, 1000, 3)
+    finally:
+        broken_pool.close()
+        con.close()
+
+    assert popular_hotspots_cache.get_stats()["entries"] == 0
+    hotspots_json = await get_popular_hotspots_json_api(duck_db_pool, 33, -87, 1000, 3)
+    assert len(json.loads(hotspots_json)) == 7
@@ -0,0 +1,143 @@
+import datetime
+import gzip
+import json
+
+import httpx
+import pytest
+from phoebe_bird import AsyncPhoebe, DefaultAsyncHttpxClient
+
+from cloaca.api.http_cache import (
+    CACHE_REFRESH_HEADER,
+    CachingTransport,
+    SQLiteResponseCache,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_upstream(requests: list[str]) -> httpx.MockTransport:
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert CACHE_REFRESH_HEADER not in request.headers
+        requests.append(request.url.path)
+        body = json.dumps(
+            [{"speciesCode": f"spec{len(requests)}", "locId": "L191106"}]
+        ).encode()
+        # compressed like eBird's responses, the cache stores it decoded
+        return httpx.Response(
+            200,
+            headers={"content-type": "application/json", "content-encoding": "gzip"},
+            content=gzip.compress(body),
+        )
+
+    return httpx.MockTransport(handler)
+
+
+def make_client(transport: CachingTransport) -> AsyncPhoebe:
+    return AsyncPhoebe(
+        api_key="test", http_client=DefaultAsyncHttpxClient(transport=transport)
+    )
+
+
+@pytest.mark.asyncio
+async def test_responses_are_reused_across_clients_until_they_expire(tmp_path):
+    requests: list[str] = []
+    clock = FakeClock()
+    path = str(tmp_path / "ebird.db")
+
+    first = CachingTransport(
+        make_upstream(requests), SQLiteResponseCache(path), clock=clock
+    )
+    observations = await make_client(first).data.observations.geo.recent.list(
+        lat=40.5, lng=-74.0
+    )
+    assert observations[0].species_code == "spec1"
+
+    # eg after a restart, or another worker
+    second = CachingTransport(
+        make_upstream(requests), SQLiteResponseCache(path), clock=clock
+    )
+    client = make_client(second)
+    observations = await client.data.observations.geo.recent.list(lat=40.5, lng=-74.0)
+    assert observations[0].species_code == "spec1"
+    assert requests == ["/v2/data/obs/geo/recent"]
+    assert second.get_stats()["hits"] == 1
+
+    # a different query is a different entry
+    await client.data.observations.geo.recent.list(lat=41.0, lng=-74.0)
+    assert len(requests) == 2
+
+    clock.now += 30 * 60
+    observations = await client.data.observations.geo.recent.list(lat=40.5, lng=-74.0)
+    assert observations[0].species_code == "spec3"
+    # the 41.0 entry expired with it and was never refreshed
+    assert second.expire() == 1
+
+
+@pytest.mark.asyncio
+async def test_uncached_endpoints_go_straight_upstream(tmp_path):
+    requests: list[str] = []
+    transport = CachingTransport(
+        make_upstream(requests), SQLiteResponseCache(str(tmp_path / "ebird.db"))
+    )
+    client = make_client(transport)
+
+    for _ in range(2):
+        await client.ref.hotspot.info.retrieve("L191106")
+
+    assert len(requests) == 2
+    stats = transport.get_stats()
+    assert stats["bypassed"] == 2
+    assert stats["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_refreshes_skip_the_cache_and_store_what_they_fetch(tmp_path):
+    requests: list[str] = []
+    transport = CachingTransport(
+        make_upstream(requests), SQLiteResponseCache(str(tmp_path / "ebird.db"))
+    )
+    client = make_client(transport)
+
+    await client.data.observations.geo.recent.list(lat=40.5, lng=-74.0)
+    refreshed = await client.data.observations.geo.recent.list(
+        lat=40.5, lng=-74.0, extra_headers={CACHE_REFRESH_HEADER: "1"}
+    )
+    assert refreshed[0].species_code == "spec2"
+    assert len(requests) == 2
+
+    # the refreshed response replaced the cached one
+    observations = await client.data.observations.geo.recent.list(lat=40.5, lng=-74.0)
+    assert observations[0].species_code == "spec2"
+    assert len(requests) == 2
+    stats = transport.get_stats()
+    assert (stats["hits"], stats["misses"], stats["refreshed"]) == (1, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_recent_historic_days_arent_cached(tmp_path):
+    requests: list[str] = []
+    clock = FakeClock()
+    clock.now = datetime.datetime(
+        2024, 5, 10, 12, tzinfo=datetime.timezone.utc
+    ).timestamp()
+    transport = CachingTransport(
+        make_upstream(requests),
+        SQLiteResponseCache(str(tmp_path / "ebird.db")),
+        clock=clock,
+    )
+    client = make_client(transport)
+
+    # today's and yesterday's checklists are still coming in, May 1st isn't
+    for day in (10, 10, 9, 9, 1, 1):
+        await client.data.observations.recent.historic.list(
+            region_code="US-NY", y=2024, m=5, d=day
+        )
+
+    assert len(requests) == 5
+    assert transport.get_stats()["hits"] == 1
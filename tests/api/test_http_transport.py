@@ -0,0 +1,74 @@
+import asyncio
+
+import httpx
+import pytest
+
+from cloaca.api.http_cache import SQLiteResponseCache
+from cloaca.api.http_transport import ConnectionMetricsTransport
+from cloaca.api.shared import EbirdTransportConfig, create_phoebe_client
+
+
+async def serve_keep_alive(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    # just enough HTTP/1.1 to answer GETs on a kept-alive connection
+    while await reader.readuntil(b"\r\n\r\n"):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"content-type: application/json\r\n"
+            b"content-length: 2\r\n\r\n[]"
+        )
+        await writer.drain()
+
+
+@pytest.mark.asyncio
+async def test_connection_reuse_is_counted():
+    server = await asyncio.start_server(serve_keep_alive, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    transport = ConnectionMetricsTransport(httpx.AsyncHTTPTransport())
+
+    async with server, httpx.AsyncClient(transport=transport) as client:
+        for _ in range(3):
+            response = await client.get(f"http://127.0.0.1:{port}/")
+            assert response.json() == []
+
+    stats = transport.get_stats()
+    assert stats["requests"] == 3
+    assert stats["new_connections"] == 1
+    assert stats["reused_connections"] == 2
+
+
+def test_phoebe_client_uses_the_configured_pool():
+    config = EbirdTransportConfig(max_connections=4, timeout_seconds=3, max_retries=0)
+
+    client, cached_client, metrics_transport, cache_transport = create_phoebe_client(
+        config
+    )
+
+    assert cache_transport is None
+    assert cached_client is client
+    assert client.max_retries == 0
+    assert client._client._transport is metrics_transport
+    assert client._client.timeout.read == 3
+
+
+@pytest.mark.asyncio
+async def test_only_the_web_api_client_reads_the_cache(tmp_path):
+    requests: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        return httpx.Response(200, json=[])
+
+    client, cached_client, metrics_transport, cache_transport = create_phoebe_client(
+        EbirdTransportConfig(), SQLiteResponseCache(str(tmp_path / "ebird.db"))
+    )
+    metrics_transport._transport = httpx.MockTransport(handler)
+
+    for _ in range(2):
+        await cached_client.data.observations.geo.recent.list(lat=40.5, lng=-74.0)
+        await client.data.observations.geo.recent.list(lat=40.5, lng=-74.0)
+
+    # the uncached client went to eBird every time, on the same pool
+    assert len(requests) == 3
+    assert metrics_transport.get_stats()["requests"] == 3
+    assert cache_transport is not None
+    assert cache_transport.get_stats()["hits"] == 1
@@ -0,0 +1,63 @@
+import time
+
+import httpx
+import pytest
+from phoebe_bird import APIConnectionError
+
+from cloaca.api.rate_limit import TokenBucket, retry_with_jitter
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate_per_second=50, capacity=1)
+
+    start = time.monotonic()
+    for _ in range(6):
+        await bucket.acquire()
+    elapsed = time.monotonic() - start
+
+    # first token is free, the next 5 need 1/50s each
+    assert elapsed >= 5 / 50 * 0.9
+
+
+@pytest.mark.asyncio
+async def test_retry_with_jitter_retries_transient_errors():
+    calls = 0
+
+    async def flaky():
+        nonlocal calls
+        calls += 1
+        if calls < 3:
+            raise APIConnectionError(request=httpx.Request("GET", "https://ebird"))
+        return "ok"
+
+    assert await retry_with_jitter(flaky, attempts=3, base_delay_seconds=0) == "ok"
+    assert calls == 3
+
+
+@pytest.mark.asyncio
+async def test_retry_with_jitter_gives_up():
+    calls = 0
+
+    async def broken():
+        nonlocal calls
+        calls += 1
+        raise APIConnectionError(request=httpx.Request("GET", "https://ebird"))
+
+    with pytest.raises(APIConnectionError):
+        await retry_with_jitter(broken, attempts=2, base_delay_seconds=0)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_retry_with_jitter_does_not_retry_other_errors():
+    calls = 0
+
+    async def bad_request():
+        nonlocal calls
+        calls += 1
+        raise ValueError("nope")
+
+    with pytest.raises(ValueError):
+        await retry_with_jitter(bad_request, attempts=3, base_delay_seconds=0)
+    assert calls == 1
@@ -1,21 +1,126 @@
+import asyncio
+import threading
+
 import pytest
-from cloaca.api.shared import fetch_ebird_taxonomy_with_cache
+from phoebe_bird.types.data.observation import Observation as PhoebeObservation
+
+from cloaca.api import shared
+from cloaca.api.shared import (
+    ensure_taxonomy,
+    fetch_nearby_observations_from_ebird_with_cache,
+)
+from cloaca.single_flight import SingleFlight
+from cloaca.ttl_cache import TTLCache
 
 
 @pytest.mark.asyncio
-@pytest.mark.vcr
-async def test_fetch_ebird_taxonomy_with_cache():
-    taxonomy = await fetch_ebird_taxonomy_with_cache()
+async def test_ensure_taxonomy(monkeypatch):
+    monkeypatch.setattr(shared, "taxonomy_lookup", {})
+
+    taxonomy = await ensure_taxonomy()
 
     eastern_phoebe = taxonomy["easpho"]
+    assert eastern_phoebe is shared.taxonomy_lookup["easpho"]
+    assert eastern_phoebe.com_name == "Eastern Phoebe"
+    assert eastern_phoebe.sci_name == "Sayornis phoebe"
+    assert eastern_phoebe.taxon_order == 16840
+    assert eastern_phoebe.species_group == (
+        "Tyrant Flycatchers: Pewees, Kingbirds, and Allies"
+    )
 
-    # {\"sciName\":\"Sayornis
-    # phoebe\",\"comName\":\"Eastern Phoebe\",\"speciesCode\":\"easpho\",\"category\":\"species\",\"taxonOrder\":16840.0,\"bandingCodes\":[\"EAPH\"],\"comNameCodes\":[],\"sciNameCodes\":[\"SAPH\"],\"order\":\"Passeriformes\",\"familyCode\":\"tyrann2\",\"familyComName\":\"Tyrant
-    # Flycatchers\",\"familySciName\":\"Tyrannidae\"}
-    assert eastern_phoebe is not None
 
-    assert eastern_phoebe.banding_codes == ["EAPH"]
-    assert eastern_phoebe.com_name == "Eastern Phoebe"
-    assert eastern_phoebe.order == "Passeriformes"
-    assert eastern_phoebe.family_com_name == "Tyrant Flycatchers"
-    assert eastern_phoebe.family_sci_name == "Tyrannidae"
+@pytest.mark.asyncio
+async def test_cold_ensure_taxonomy_loads_the_snapshot_once_off_the_loop(
+    monkeypatch,
+):
+    loaded_on: list[int] = []
+    snapshot = shared.load_taxonomy_snapshot()
+
+    def fake_load_taxonomy_snapshot():
+        loaded_on.append(threading.get_ident())
+        return snapshot
+
+    monkeypatch.setattr(shared, "taxonomy_lookup", {})
+    monkeypatch.setattr(shared, "load_taxonomy_snapshot", fake_load_taxonomy_snapshot)
+    monkeypatch.setattr(shared, "taxonomy_refreshes", SingleFlight())
+
+    taxonomies = await asyncio.gather(*[ensure_taxonomy() for _ in range(3)])
+
+    assert all(taxonomy is snapshot for taxonomy in taxonomies)
+    assert len(loaded_on) == 1
+    assert loaded_on[0] != threading.get_ident()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_nearby_fetches_share_one_request(monkeypatch):
+    calls = 0
+
+    async def fake_list(**kwargs):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [
+            PhoebeObservation.model_validate(
+                {"speciesCode": "easpho", "sciName": "Sayornis phoebe"}
+            )
+        ]
+
+    monkeypatch.setattr(
+        shared.cached_phoebe_client.data.observations.geo.recent, "list", fake_list
+    )
+    monkeypatch.setattr(
+        shared, "nearby_observation_cache", TTLCache(max_entries=8, ttl_seconds=60)
+    )
+    monkeypatch.setattr(shared, "nearby_observation_fetches", SingleFlight())
+
+    results = await asyncio.gather(
+        *[
+            fetch_nearby_observations_from_ebird_with_cache(40.5, -74.0)
+            for _ in range(4)
+        ]
+    )
+
+    assert calls == 1
+    assert all(result == results[0] for result in results)
+    stats = shared.get_ebird_fetch_stats()["nearby_observations"]
+    assert stats["issued"] == 1
+    assert stats["coalesced"] == 3
+
+
+@pytest.mark.asyncio
+async def test_stale_nearby_observations_are_served_while_refreshing(monkeypatch):
+    now = 0.0
+    fetched: list[str] = []
+
+    async def fake_list(**kwargs):
+        species_code = f"spec{len(fetched)}"
+        fetched.append(species_code)
+        await asyncio.sleep(0.01)
+        return [PhoebeObservation.model_validate({"speciesCode": species_code})]
+
+    monkeypatch.setattr(
+        shared.cached_phoebe_client.data.observations.geo.recent, "list", fake_list
+    )
+    monkeypatch.setattr(
+        shared,
+        "nearby_observation_cache",
+        TTLCache(max_entries=8, ttl_seconds=10, stale_seconds=10, clock=lambda: now),
+    )
+    monkeypatch.setattr(shared, "nearby_observation_fetches", SingleFlight())
+
+    first = await fetch_nearby_observations_from_ebird_with_cache(40.5, -74.0)
+    assert first[0].species_code == "spec0"
+
+    now = 15
+    # stale: answered straight from the cache, one refresh kicked off
+    stale = await asyncio.gather(
+        fetch_nearby_observations_from_ebird_with_cache(40.5, -74.0),
+        fetch_nearby_observations_from_ebird_with_cache(40.5, -74.0),
+    )
+    assert [result[0].species_code for result in stale] == ["spec0", "spec0"]
+
+    await asyncio.gather(*shared._revalidations)
+    assert fetched == ["spec0", "spec1"]
+
+    refreshed = await fetch_nearby_observations_from_ebird_with_cache(40.5, -74.0)
+    assert refreshed[0].species_code == "spec1"
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from cloaca.api import shared
+from cloaca.api.shared import (
+    TaxonInfo,
+    get_taxonomy_info_for_species_code,
+    load_taxonomy_snapshot,
+    refresh_taxonomy_from_ebird,
+)
+
+
+def test_load_taxonomy_snapshot():
+    taxonomy = load_taxonomy_snapshot()
+
+    assert taxonomy["easpho"] == TaxonInfo(
+        species_code="easpho",
+        taxon_order=16840,
+        sci_name="Sayornis phoebe",
+        com_name="Eastern Phoebe",
+        species_group="Tyrant Flycatchers: Pewees, Kingbirds, and Allies",
+    )
+    assert len(taxonomy) > 17_000
+
+
+@pytest.mark.asyncio
+async def test_lookups_use_the_snapshot_and_tolerate_unknown_codes(monkeypatch):
+    monkeypatch.setattr(shared, "taxonomy_lookup", {})
+
+    async def no_network():
+        raise AssertionError("should not fetch the taxonomy from eBird")
+
+    monkeypatch.setattr(shared, "_fetch_ebird_taxonomy", no_network)
+
+    eastern_phoebe = await get_taxonomy_info_for_species_code("easpho")
+    assert eastern_phoebe.taxon_order == 16840
+    assert isinstance(eastern_phoebe.taxon_order, int)
+
+    unknown = await get_taxonomy_info_for_species_code("notabird")
+    assert unknown.taxon_order is None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_refreshes_share_one_download(monkeypatch):
+    calls = 0
+
+    async def fake_fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [
+            shared.EbirdTaxonomyItem.model_validate(
+                {
+                    "speciesCode": "easpho",
+                    "sciName": "Sayornis phoebe",
+                    "comName": "Eastern Phoebe",
+                    "taxonOrder": 16841.0,
+                    "familyComName": "Tyrant Flycatchers",
+                }
+            )
+        ]
+
+    monkeypatch.setattr(shared, "_fetch_ebird_taxonomy", fake_fetch)
+    monkeypatch.setattr(shared, "taxonomy_lookup", load_taxonomy_snapshot())
+
+    await asyncio.gather(*[refresh_taxonomy_from_ebird() for _ in range(5)])
+
+    assert calls == 1
+    refreshed = shared.taxonomy_lookup["easpho"]
+    assert refreshed.taxon_order == 16841
+    assert isinstance(refreshed.taxon_order, int)
+    # the api doesn't return species groups, so the snapshot's is kept
+    assert refreshed.species_group == (
+        "Tyrant Flycatchers: Pewees, Kingbirds, and Allies"
+    )
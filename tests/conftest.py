@@ -0,0 +1,32 @@
+from typing import Any, Callable
+
+import pytest
+
+from cloaca.parsing.parsing_helpers import Lifer
+
+
+def _make_lifer(
+    common_name: str = "House Sparrow",
+    scientific_name: str = "Passer domesticus",
+    **fields: Any,
+) -> Lifer:
+    return Lifer(
+        **{
+            "common_name": common_name,
+            "latitude": 40.6941,
+            "longitude": -74.0242,
+            "date": "2024-05-01",
+            "taxonomic_order": 1,
+            "location": "Prospect Park",
+            "location_id": "L109516",
+            "scientific_name": scientific_name,
+            "species_code": None,
+            **fields,
+        }
+    )
+
+
+@pytest.fixture
+def make_lifer() -> Callable[..., Lifer]:
+    """Builds a Lifer at Prospect Park, pass any field to override it."""
+    return _make_lifer
@@ -16,6 +16,7 @@ from cloaca.db.build_parsed_db import (
     create_hotspots_richness_table,
     create_localities_hotspots_table,
 )
+from cloaca.api.shared import get_taxonomy_snapshot_path
 from cloaca.db.db import get_db_connection_with_path
 
 
@@ -53,8 +54,8 @@ class TestBuildParsedDb:
 
     @pytest.fixture
     def taxonomy_csv(self):
-        """Path to the eBird taxonomy CSV file."""
-        return Path(__file__).parent.parent / "data" / "eBird_taxonomy_v2024.csv"
+        """Path to the eBird taxonomy CSV file bundled with the package."""
+        return get_taxonomy_snapshot_path()
 
     @pytest.fixture
     def test_output_parsed_db(self):
@@ -219,6 +220,8 @@ class TestBuildParsedDb:
                     "longitude",
                     "locality_type",
                     "geometry",
+                    "grid_lat",
+                    "grid_lng",
                     "month",
                     "avg_weekly_number_of_observations",
                 ],
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+from pathlib import Path
+
+import pytest
+
+from cloaca.db.cursor_pool import DuckDBCursorPool
+from cloaca.db.db import get_db_connection_with_path
+from cloaca.db.popular_hotspots import get_popular_hotspots
+
+
+@pytest.fixture
+def parsed_db_conn():
+    con = get_db_connection_with_path(
+        str(Path(__file__).parent.parent / "data" / "test_parsed.db"),
+        read_only=True,
+        verify_tables_exist=False,
+    )
+    yield con
+    con.close()
+
+
+@pytest.mark.asyncio
+async def test_cursor_pool_runs_queries_off_the_event_loop(parsed_db_conn):
+    pool = DuckDBCursorPool(parsed_db_conn, max_workers=2)
+    loop_thread = threading.get_ident()
+
+    def query(cursor, latitude, longitude):
+        assert threading.get_ident() != loop_thread
+        return get_popular_hotspots(cursor, latitude, longitude, 1000, 3)
+
+    try:
+        results = await asyncio.gather(*[pool.run(query, 33, -87) for _ in range(8)])
+    finally:
+        pool.close()
+
+    assert all(len(result) == 7 for result in results)
+
+    stats = pool.get_stats()
+    assert stats["pool_size"] == 2
+    assert stats["completed"] == 8
+    assert stats["failed"] == 0
+    assert stats["queued"] == 0
+    assert stats["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cursor_pool_reuses_one_cursor_per_thread(parsed_db_conn):
+    pool = DuckDBCursorPool(parsed_db_conn, max_workers=1)
+
+    def cursor_id(cursor):
+        return id(cursor)
+
+    try:
+        first = await pool.run(cursor_id)
+        second = await pool.run(cursor_id)
+    finally:
+        pool.close()
+
+    assert first == second
+    assert pool.get_stats()["cursors_open"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cursor_pool_counts_failures(parsed_db_conn):
+    pool = DuckDBCursorPool(parsed_db_conn, max_workers=1)
+
+    def bad_query(cursor):
+        return cursor.execute("select * from not_a_table").fetchall()
+
+    try:
+        with pytest.raises(Exception):
+            await pool.run(bad_query)
+    finally:
+        pool.close()
+
+    assert pool.get_stats()["failed"] == 1
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from cloaca import main
+from cloaca.db.db import get_db_connection_with_path
+from cloaca.db.parsed_db import open_parsed_db, parsed_db_needs_reload
+
+
+@pytest.fixture
+def parsed_db_path(tmp_path):
+    path = tmp_path / "parsed.db"
+    shutil.copy(Path(__file__).parent.parent / "data" / "test_parsed.db", path)
+    return str(path)
+
+
+def test_open_parsed_db(parsed_db_path):
+    parsed_db = open_parsed_db(parsed_db_path, pool_size=2)
+    try:
+        assert parsed_db.pool.max_workers == 2
+        assert not parsed_db_needs_reload(parsed_db, parsed_db_path)
+    finally:
+        parsed_db.close()
+
+
+def test_needs_reload_when_file_changes(parsed_db_path, tmp_path):
+    parsed_db = open_parsed_db(parsed_db_path, pool_size=1)
+    try:
+        assert parsed_db_needs_reload(None, parsed_db_path)
+
+        # simulate a rebuilt db being moved over the old one (new inode)
+        rebuilt = tmp_path / "rebuilt.db"
+        shutil.copy(parsed_db_path, rebuilt)
+        os.replace(rebuilt, parsed_db_path)
+
+        assert parsed_db_needs_reload(parsed_db, parsed_db_path)
+    finally:
+        parsed_db.close()
+
+
+@pytest.mark.asyncio
+async def test_close_drains_in_flight_queries(parsed_db_path):
+    parsed_db = open_parsed_db(parsed_db_path, pool_size=1)
+
+    def slow_count(cursor):
+        return cursor.execute(
+            "SELECT count(*) FROM localities_hotspots, range(100000)"
+        ).fetchone()[0]
+
+    pending = asyncio.create_task(parsed_db.pool.run(slow_count))
+    await asyncio.sleep(0)  # let the query get submitted to the pool
+    await asyncio.to_thread(parsed_db.close)
+
+    assert await pending > 0
+
+
+def count_hotspots(cursor):
+    return cursor.execute("SELECT count(*) FROM localities_hotspots").fetchone()[0]
+
+
+@pytest.mark.asyncio
+async def test_reload_serves_the_rebuilt_file(parsed_db_path, tmp_path, monkeypatch):
+    monkeypatch.setenv("DUCK_DB_PATH", parsed_db_path)
+    monkeypatch.setattr(main.Cloaca_App.state, "parsed_db", None, raising=False)
+
+    await main.reload_duck_db()
+    before = await main.get_duck_db_pool_from_state().run(count_hotspots)
+
+    rebuilt = tmp_path / "rebuilt.db"
+    shutil.copy(parsed_db_path, rebuilt)
+    con = get_db_connection_with_path(
+        str(rebuilt), read_only=False, verify_tables_exist=False
+    )
+    con.execute(
+        "CREATE OR REPLACE TABLE localities_hotspots AS "
+        "SELECT * FROM localities_hotspots LIMIT 1"
+    )
+    con.close()
+    os.replace(rebuilt, parsed_db_path)
+
+    try:
+        assert await main.reload_duck_db() == f"opened {parsed_db_path}"
+        after = await main.get_duck_db_pool_from_state().run(count_hotspots)
+        assert before > 1
+        assert after == 1
+    finally:
+        await asyncio.to_thread(main.Cloaca_App.state.parsed_db.close)
@@ -0,0 +1,84 @@
+import duckdb
+
+from cloaca.db.popular_hotspots import (
+    GRID_CELL_DEGREES,
+    get_hotspot_search_bounds,
+    grid_cell_for_coordinate,
+)
+
+
+def sphere_distance_m(
+    con: duckdb.DuckDBPyConnection,
+    latitude_a: float,
+    longitude_a: float,
+    latitude_b: float,
+    longitude_b: float,
+) -> float:
+    # what the popular hotspots query measures with, in [latitude, longitude] order
+    return con.execute(
+        "SELECT ST_Distance_Sphere(ST_Point(?, ?), ST_Point(?, ?))",
+        [latitude_a, longitude_a, latitude_b, longitude_b],
+    ).fetchone()[0]
+
+
+def test_grid_cell_for_coordinate():
+    assert grid_cell_for_coordinate(0) == 0
+    assert grid_cell_for_coordinate(GRID_CELL_DEGREES - 0.0001) == 0
+    assert grid_cell_for_coordinate(GRID_CELL_DEGREES) == 1
+    # negative coordinates floor away from zero so cells don't double up at 0
+    assert grid_cell_for_coordinate(-0.0001) == -1
+
+
+def test_search_bounds_contain_radius():
+    # prospect park, 25km
+    bounds = get_hotspot_search_bounds(40.6602841, -73.9689534, 25)
+
+    assert bounds.max_latitude - 40.6602841 > 25 / 111.2
+    assert bounds.min_longitude < -73.9689534 - 25 / 111.2
+    assert bounds.max_longitude > -73.9689534 + 25 / 111.2
+
+    # a 25km search should only span a handful of cells
+    lat_cells = bounds.max_grid_lat - bounds.min_grid_lat + 1
+    lng_cells = bounds.max_grid_lng - bounds.min_grid_lng + 1
+    assert lat_cells * lng_cells <= 12
+
+
+def test_search_bounds_across_antimeridian():
+    bounds = get_hotspot_search_bounds(52, 179.9, 50)
+
+    assert bounds.min_longitude == -180
+    assert bounds.max_longitude == 180
+
+
+def test_search_bounds_near_pole():
+    bounds = get_hotspot_search_bounds(89.9, 10, 50)
+
+    assert bounds.max_latitude == 90
+    assert bounds.min_longitude == -180
+    assert bounds.max_longitude == 180
+
+
+def test_search_bounds_keep_hotspots_just_inside_the_radius():
+    con = duckdb.connect()
+    con.execute("INSTALL spatial; LOAD spatial;")
+    latitude, longitude = 40.6602841, -73.9689534
+    bounds = get_hotspot_search_bounds(latitude, longitude, 25)
+
+    # ~15m inside the radius, due north / south / east / west
+    for hotspot_latitude, hotspot_longitude in [
+        (latitude + 0.2247, longitude),
+        (latitude - 0.2247, longitude),
+        (latitude, longitude + 0.2962),
+        (latitude, longitude - 0.2962),
+    ]:
+        distance = sphere_distance_m(
+            con, latitude, longitude, hotspot_latitude, hotspot_longitude
+        )
+        assert distance < 25_000
+        assert bounds.min_latitude <= hotspot_latitude <= bounds.max_latitude
+        assert bounds.min_longitude <= hotspot_longitude <= bounds.max_longitude
+        assert (
+            bounds.min_grid_lat
+            <= grid_cell_for_coordinate(hotspot_latitude)
+            <= bounds.max_grid_lat
+        )
@@ -1,3 +1,4 @@
+import json
 import pytest
 from pathlib import Path
 import sys
@@ -6,7 +7,10 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent.parent.parent / "src"))
 
 from cloaca.db.db import get_db_connection_with_path
-from cloaca.db.popular_hotspots import get_popular_hotspots
+from cloaca.db.popular_hotspots import (
+    get_popular_hotspots,
+    get_popular_hotspots_json_rows,
+)
 
 
 class TestPopularHotspotsIntegration:
@@ -70,3 +74,26 @@ class TestPopularHotspotsIntegration:
 
         finally:
             con.close()
+
+    def test_popular_hotspots_json_rows_match_objects(self, test_output_parsed_db):
+        """The DuckDB-serialized JSON should match the object path row for row."""
+        con = get_db_connection_with_path(
+            test_output_parsed_db, read_only=True, verify_tables_exist=False
+        )
+
+        try:
+            results = get_popular_hotspots(con, 33, -87, 1000, 3)
+            rows = get_popular_hotspots_json_rows(con, 33, -87, 1000, 3)
+
+            assert [json.loads(hotspot_json) for _, _, hotspot_json in rows] == [
+                result.to_dict() for result in results
+            ]
+            assert [(latitude, longitude) for latitude, longitude, _ in rows] == [
+                (result.latitude, result.longitude) for result in results
+            ]
+
+            # nothing nearby
+            assert get_popular_hotspots_json_rows(con, 0, 0, 1, 3) == []
+
+        finally:
+            con.close()
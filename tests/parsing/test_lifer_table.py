@@ -0,0 +1,56 @@
+from dataclasses import asdict
+
+import pytest
+
+from cloaca.parsing.lifer_table import LIFER_COLUMNS, LiferTable, StringPool
+
+
+def test_table_round_trips_lifers(make_lifer):
+    lifers = [
+        make_lifer("House Sparrow", "Passer domesticus", species_code="houspa"),
+        make_lifer("Eastern Phoebe", "Sayornis phoebe"),
+        make_lifer("House Sparrow", "Passer domesticus", species_code="houspa"),
+    ]
+    table = LiferTable.from_lifers(lifers)
+
+    assert len(table) == 3
+    assert table.to_lifers() == lifers
+    assert table.distinct("scientific_name") == ["Passer domesticus", "Sayornis phoebe"]
+    assert table.distinct("location") == ["Prospect Park"]
+
+
+def test_rows_are_views_with_lifer_attributes(make_lifer):
+    lifer = make_lifer("Eastern Phoebe", "Sayornis phoebe")
+    table = LiferTable.from_lifers([make_lifer("House Sparrow", "Passer"), lifer])
+
+    row = table[-1]
+    assert row.common_name == "Eastern Phoebe"
+    assert row.latitude == lifer.latitude
+    assert row.species_code is None
+    assert asdict(row.to_lifer()) == asdict(lifer)
+    assert [row.scientific_name for row in table] == ["Passer", "Sayornis phoebe"]
+
+    with pytest.raises(IndexError):
+        table[2]
+
+
+def test_mismatched_columns_are_rejected():
+    columns = {
+        column: table_column
+        for column, table_column in zip(
+            LIFER_COLUMNS,
+            [["a"], [1.0], [2.0], ["d"], [1], ["l"], ["L1"], ["s"], []],
+        )
+    }
+    with pytest.raises(ValueError):
+        LiferTable(columns)
+
+
+def test_string_pool_shares_equal_strings():
+    strings = StringPool()
+    first = strings.intern("".join(["Prospect", " Park"]))
+    second = strings.intern("".join(["Prospect ", "Park"]))
+
+    assert first is second
+    assert strings.intern(None) is None
+    assert len(strings) == 1
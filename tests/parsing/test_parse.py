@@ -1,7 +1,21 @@
+import math
+import time
+import tracemalloc
+
 from fastapi.testclient import TestClient
 import pandas as pd
-from cloaca.parsing.parse_ebird_personal_export import parse_csv_data_frame
-from cloaca.parsing.parsing_helpers import Lifer, get_lifers, calculate_home_location
+from cloaca.parsing.parse_ebird_personal_export import (
+    parse_csv_data_frame,
+    parse_csv_data_frame_to_lifers,
+    stream_csv_to_lifers,
+)
+from cloaca.parsing.parsing_helpers import (
+    Lifer,
+    calculate_home_location,
+    get_lifers,
+    observations_to_lifers,
+)
+from cloaca.parsing import parse_ebird_personal_export
 from cloaca.types import get_lifers_from_cache
 from cloaca.main import Cloaca_App
 
@@ -132,3 +146,105 @@ def test_calculate_home_location():
     )
 
     assert home_location == expected_home_location
+
+
+def test_vectorized_parse_matches_observation_path():
+    df = pd.read_csv("tests/test_data/MyEBirdData.csv")
+
+    lifers, home_location = parse_csv_data_frame_to_lifers(df)
+
+    all_observations = parse_csv_data_frame(df)
+    assert lifers == observations_to_lifers(get_lifers(all_observations))
+    assert home_location == calculate_home_location(all_observations)
+    assert len(lifers) == expected_singular_results
+
+
+def write_large_export(path, copies: int):
+    # repeat the test export's rows to make a bigger one
+    with open("tests/test_data/MyEBirdData.csv") as f:
+        header, body = f.read().split("\n", 1)
+    if not body.endswith("\n"):
+        body += "\n"
+    with open(path, "w") as f:
+        f.write(header + "\n")
+        for _ in range(copies):
+            f.write(body)
+
+
+def test_streaming_parse_of_large_export(tmp_path):
+    # ~75k rows in 8k row chunks: the same spread across several chunks as a
+    # big export in EXPORT_CHUNK_ROWS chunks, without writing 100MB
+    path = tmp_path / "MyEBirdData.csv"
+    write_large_export(path, copies=16)
+    file_bytes = path.stat().st_size
+    chunk_rows = 8_000
+
+    with open(path, "rb") as f:
+        start = time.perf_counter()
+        lifers, home_location = stream_csv_to_lifers(f, chunk_rows=chunk_rows)
+        elapsed = time.perf_counter() - start
+
+    with open(path, "rb") as f:
+        tracemalloc.start()
+        try:
+            stream_csv_to_lifers(f, chunk_rows=chunk_rows)
+            _, peak_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    print(
+        f"streamed {file_bytes / 1024 / 1024:.0f}MB export in {elapsed:.2f}s, "
+        f"peak traced memory {peak_bytes / 1024 / 1024:.0f}MB"
+    )
+
+    assert (lifers, home_location) == parse_csv_data_frame_to_lifers(pd.read_csv(path))
+    # only a few chunks' worth of columns are ever held at once
+    assert peak_bytes < file_bytes / 2
+
+
+def test_streaming_parse_of_blank_taxonomic_order(tmp_path):
+    with open("tests/test_data/MyEBirdData.csv") as f:
+        df = pd.read_csv(f, nrows=50)
+    df["Taxonomic Order"] = df["Taxonomic Order"].astype("float64")
+    df.loc[0, "Taxonomic Order"] = None
+    path = tmp_path / "MyEBirdData.csv"
+    df.to_csv(path, index=False)
+
+    with open(path, "rb") as f:
+        lifers, _ = stream_csv_to_lifers(f)
+    expected, _ = parse_csv_data_frame_to_lifers(pd.read_csv(path))
+
+    blank = next(lifer for lifer in lifers if lifer.common_name == df["Common Name"][0])
+    assert isinstance(blank.taxonomic_order, float)
+    assert math.isnan(blank.taxonomic_order)
+    assert [lifer.common_name for lifer in lifers] == [
+        lifer.common_name for lifer in expected
+    ]
+    assert [lifer.taxonomic_order for lifer in lifers if lifer is not blank] == [
+        lifer.taxonomic_order
+        for lifer in expected
+        if lifer.common_name != blank.common_name
+    ]
+
+
+def test_streaming_classifies_each_species_once_across_chunks(monkeypatch):
+    df = pd.read_csv("tests/test_data/MyEBirdData.csv")
+    expected = parse_csv_data_frame_to_lifers(df)
+
+    classified: list[str] = []
+    original = parse_ebird_personal_export.get_singular_species_mask
+
+    def counting_mask(data_frame):
+        classified.extend(data_frame["Scientific Name"].tolist())
+        return original(data_frame)
+
+    monkeypatch.setattr(
+        parse_ebird_personal_export, "get_singular_species_mask", counting_mask
+    )
+
+    with open("tests/test_data/MyEBirdData.csv", "rb") as f:
+        lifers, home_location = stream_csv_to_lifers(f, chunk_rows=500)
+
+    assert (lifers, home_location) == expected
+    assert len(lifers) == expected_singular_results
+    assert sorted(classified) == sorted(df["Scientific Name"].unique())
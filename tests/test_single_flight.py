@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from cloaca.single_flight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_for_a_key_share_one_call():
+    flights: SingleFlight[str, int] = SingleFlight()
+    calls = 0
+
+    async def fetch() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*[flights.run("a", fetch) for _ in range(5)])
+    other = await flights.run("b", fetch)
+
+    assert results == [1] * 5
+    assert other == 2
+    assert flights.get_stats() == {
+        "in_flight": 0,
+        "issued": 2,
+        "coalesced": 4,
+        "coalesced_rate": 4 / 6,
+    }
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller_and_are_not_kept():
+    flights: SingleFlight[str, int] = SingleFlight()
+
+    async def fail() -> int:
+        await asyncio.sleep(0.01)
+        raise ValueError("eBird is down")
+
+    results = await asyncio.gather(
+        *[flights.run("a", fail) for _ in range(3)], return_exceptions=True
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+
+    async def succeed() -> int:
+        return 1
+
+    assert await flights.run("a", succeed) == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_call():
+    flights: SingleFlight[str, int] = SingleFlight()
+
+    async def fetch() -> int:
+        await asyncio.sleep(0.01)
+        return 1
+
+    impatient = asyncio.create_task(flights.run("a", fetch))
+    patient = asyncio.create_task(flights.run("a", fetch))
+    await asyncio.sleep(0)
+    impatient.cancel()
+
+    assert await patient == 1
+    assert len(flights) == 0
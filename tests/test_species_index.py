@@ -0,0 +1,118 @@
+from phoebe_bird.types.data.observation import Observation as PhoebeObservation
+
+from cloaca.species_index import SpeciesIndex
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def observation(
+    species_code: str, location_id: str, lat: float, lng: float, obs_dt: str
+) -> PhoebeObservation:
+    return PhoebeObservation.model_validate(
+        {
+            "speciesCode": species_code,
+            "locId": location_id,
+            "lat": lat,
+            "lng": lng,
+            "obsDt": obs_dt,
+        }
+    )
+
+
+def test_lookup_returns_nearby_observations_nearest_first():
+    index = SpeciesIndex(max_age_seconds=60)
+    index.add(
+        "easpho",
+        40.5,
+        -74.0,
+        50,
+        [
+            # Prospect Park, then Central Park, then across a cell boundary
+            observation("easpho", "L109516", 40.66, -73.97, "2024-05-01 07:00"),
+            observation("easpho", "L191106", 40.77, -73.97, "2024-05-01 08:00"),
+            observation("easpho", "L99", 40.9, -73.95, "2024-05-01 09:00"),
+        ],
+    )
+
+    found = index.lookup("easpho", 40.5, -74.0, radius_km=40)
+
+    assert [found_observation.loc_id for found_observation in found] == [
+        "L109516",
+        "L191106",
+    ]
+    assert index.get_stats()["answered"] == 1
+
+
+def test_only_circles_a_response_covers_are_answered():
+    index = SpeciesIndex(max_age_seconds=60)
+    index.add(
+        "easpho",
+        40.5,
+        -74.0,
+        50,
+        [observation("easpho", "L191106", 40.77, -73.97, "2024-05-01 08:00")],
+    )
+    # eBird had nothing on this one nearby, which is an answer too
+    index.add("norhar2", 40.5, -74.0, 50, [])
+
+    assert index.lookup("norhar2", 40.5, -74.0, radius_km=50) == []
+    # a species that was only ever seen in another response
+    assert index.lookup("houspa", 40.5, -74.0, radius_km=50) is None
+    # the next cell over reaches past the response's circle, where eBird
+    # could have hotspots the index never saw
+    assert index.lookup("easpho", 41.0, -74.0, radius_km=50) is None
+    assert index.get_stats()["answered"] == 1
+
+
+def test_the_most_recent_observation_per_location_is_kept():
+    index = SpeciesIndex(max_age_seconds=60)
+    index.add(
+        "easpho",
+        40.5,
+        -74.0,
+        50,
+        [observation("easpho", "L191106", 40.77, -73.97, "2024-05-02 08:00")],
+    )
+    index.add(
+        "easpho",
+        40.5,
+        -74.0,
+        50,
+        [observation("easpho", "L191106", 40.77, -73.97, "2024-05-01 08:00")],
+    )
+
+    [found] = index.lookup("easpho", 40.5, -74.0, radius_km=50)
+    assert found.obs_dt == "2024-05-02 08:00"
+    assert len(index) == 1
+
+
+def test_old_observations_are_not_served_and_are_pruned():
+    clock = FakeClock()
+    index = SpeciesIndex(max_age_seconds=60, clock=clock)
+    index.add(
+        "easpho",
+        40.5,
+        -74.0,
+        50,
+        [observation("easpho", "L191106", 40.77, -73.97, "2024-05-01 08:00")],
+    )
+
+    clock.now = 61
+    index.add(
+        "houspa",
+        40.5,
+        -74.0,
+        50,
+        [observation("houspa", "L191106", 40.77, -73.97, "2024-05-01 08:00")],
+    )
+
+    assert index.lookup("easpho", 40.5, -74.0, radius_km=50) is None
+    assert index.prune() == 1
+    stats = index.get_stats()
+    assert (stats["observations"], stats["species"]) == (1, 1)
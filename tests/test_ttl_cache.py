@@ -0,0 +1,84 @@
+from cloaca.ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_get_and_set():
+    cache: TTLCache[str, int] = TTLCache(max_entries=2, ttl_seconds=10)
+
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_entries_expire():
+    clock = FakeClock()
+    cache: TTLCache[str, int] = TTLCache(max_entries=2, ttl_seconds=10, clock=clock)
+
+    cache.set("a", 1)
+    clock.now = 9.9
+    assert cache.get("a") == 1
+    clock.now = 10
+    assert cache.get("a") is None
+    assert cache.get_stats()["expirations"] == 1
+
+
+def test_least_recently_used_is_evicted():
+    cache: TTLCache[str, int] = TTLCache(max_entries=2, ttl_seconds=10)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # b is now the least recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_clear_drops_results_from_older_generations():
+    cache: TTLCache[str, int] = TTLCache(max_entries=2, ttl_seconds=10)
+
+    generation = cache.generation
+    cache.clear()
+    cache.set("a", 1, generation=generation)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_stale_entries_are_served_until_the_stale_window_ends():
+    clock = FakeClock()
+    cache: TTLCache[str, int] = TTLCache(
+        max_entries=2, ttl_seconds=10, clock=clock, stale_seconds=5
+    )
+
+    cache.set("a", 1)
+    assert cache.get_allow_stale("a") == (1, False)
+
+    clock.now = 12
+    assert cache.get_allow_stale("a") == (1, True)
+    # only the stale-aware lookup serves it
+    assert cache.get("a") is None
+    assert len(cache) == 1
+
+    clock.now = 15
+    assert cache.get_allow_stale("a") is None
+    assert len(cache) == 0
+
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["stale_hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["expirations"] == 1
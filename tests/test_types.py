@@ -0,0 +1,107 @@
+from cloaca.api.shared import TaxonInfo
+from cloaca.parsing.lifer_table import StringPool
+from cloaca.parsing.parsing_helpers import Lifer, Location
+from cloaca.types import (
+    LocationGrouper,
+    filter_lifers_from_observations,
+    get_uploaded_lifers_from_cache,
+    phoebe_observations_to_lifers,
+    set_lifers_to_cache,
+)
+from phoebe_bird.types.data.observation import Observation as PhoebeObservation
+
+
+def test_uploaded_lifer_names_are_precomputed(make_lifer):
+    set_lifers_to_cache(
+        "types-key",
+        [
+            make_lifer("Northern Harrier", "Circus hudsonius"),
+            make_lifer("House Sparrow", "Passer domesticus"),
+        ],
+    )
+
+    uploaded = get_uploaded_lifers_from_cache("types-key")
+
+    assert uploaded.scientific_names == {"Circus hudsonius", "Passer domesticus"}
+    assert uploaded.common_names == {"Northern Harrier", "House Sparrow"}
+
+
+def test_filter_lifers_from_observations(make_lifer):
+    set_lifers_to_cache("types-key", [make_lifer("House Sparrow", "Passer domesticus")])
+
+    unseen = filter_lifers_from_observations(
+        [
+            make_lifer("House Sparrow", "Passer domesticus"),
+            make_lifer("Eastern Phoebe", "Sayornis phoebe"),
+        ],
+        get_uploaded_lifers_from_cache("types-key"),
+    )
+
+    assert [lifer.common_name for lifer in unseen] == ["Eastern Phoebe"]
+
+
+def test_phoebe_observations_to_lifers():
+    observations = [
+        PhoebeObservation.model_validate(
+            {
+                "speciesCode": species_code,
+                "comName": "Eastern Phoebe",
+                "sciName": "Sayornis phoebe",
+                "locId": "L109516",
+                "locName": "Prospect Park",
+                "obsDt": "2024-05-01 07:30",
+                "lat": 40.6602,
+                "lng": -73.969,
+            }
+        )
+        for species_code in ["easpho", "notabird"]
+    ]
+    taxonomy = {
+        "easpho": TaxonInfo(
+            species_code="easpho",
+            taxon_order=16840,
+            sci_name="Sayornis phoebe",
+            com_name="Eastern Phoebe",
+            species_group="Tyrant Flycatchers",
+        )
+    }
+    strings = StringPool()
+
+    lifers = phoebe_observations_to_lifers(observations, taxonomy, strings)
+
+    assert lifers[0] == Lifer(
+        common_name="Eastern Phoebe",
+        latitude=40.6602,
+        longitude=-73.969,
+        date="2024-05-01 07:30",
+        taxonomic_order=16840,
+        location="Prospect Park",
+        location_id="L109516",
+        scientific_name="Sayornis phoebe",
+        species_code="easpho",
+    )
+    # unknown species still convert, just without a taxonomic order
+    assert lifers[1].taxonomic_order == 0
+    assert lifers[0].location is lifers[1].location
+
+
+def test_location_grouper_uses_the_most_recent_details_in_any_order(make_lifer):
+    renamed = make_lifer("House Sparrow", "Passer domesticus")
+    renamed.date = "2024-05-03"
+    renamed.location = "Prospect Park (renamed)"
+    older = make_lifer("Eastern Phoebe", "Sayornis phoebe")
+    oldest = make_lifer("Blue Jay", "Cyanocitta cristata")
+    oldest.date = "2024-04-01"
+    batches = [[older], [renamed, oldest]]
+
+    grouper = LocationGrouper()
+    for batch in batches:
+        grouper.add(batch)
+    grouped = grouper.result()
+
+    assert grouped["L109516"].location == Location(
+        "Prospect Park (renamed)", 40.6941, -74.0242, "L109516"
+    )
+    assert grouped["L109516"].lifers == [renamed, older, oldest]
+    # the input isn't reordered
+    assert batches == [[older], [renamed, oldest]]
@@ -0,0 +1,207 @@
+import asyncio
+import threading
+
+import pytest
+
+from cloaca.parsing.parsing_helpers import Lifer
+from cloaca.upload_cache import UploadCache, UploadedLifers
+from cloaca.upload_store import (
+    ParquetUploadStore,
+    SQLiteUploadStore,
+    decode_lifers,
+    encode_lifers,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_uploaded(common_name: str) -> UploadedLifers:
+    return UploadedLifers.from_lifers(
+        [
+            Lifer(
+                common_name=common_name,
+                latitude=40.6941,
+                longitude=-74.0242,
+                date="2024-05-01",
+                taxonomic_order=31261,
+                location="Prospect Park",
+                location_id="L109516",
+                scientific_name="Passer domesticus",
+                species_code=None,
+            )
+        ]
+    )
+
+
+def test_lru_entries_spill_to_disk_and_reload(tmp_path):
+    cache = UploadCache(spill_dir=str(tmp_path), max_hot_entries=1)
+
+    first = make_uploaded("House Sparrow")
+    cache.set("first", first)
+    cache.set("second", make_uploaded("Eastern Phoebe"))
+
+    stats = cache.get_stats()
+    assert stats["hot_entries"] == 1
+    assert stats["spilled_entries"] == 1
+    assert (tmp_path / "first.parquet").exists()
+
+    reloaded = cache.get("first")
+    assert reloaded is not None
+    assert reloaded.lifers == first.lifers
+    assert reloaded.scientific_names == first.scientific_names
+    assert cache.get_stats()["reloads"] == 1
+
+
+def test_idle_entries_spill_and_old_spills_expire(tmp_path):
+    clock = FakeClock()
+    cache = UploadCache(
+        spill_dir=str(tmp_path),
+        hot_ttl_seconds=60,
+        disk_ttl_seconds=60 * 60,
+        clock=clock,
+    )
+
+    cache.set("idle", make_uploaded("House Sparrow"))
+    clock.now += 61
+    cache.expire()
+
+    assert cache.get_stats()["hot_entries"] == 0
+    assert (tmp_path / "idle.parquet").exists()
+
+    clock.now = (tmp_path / "idle.parquet").stat().st_mtime + 60 * 60 + 1
+    cache.expire()
+
+    assert not (tmp_path / "idle.parquet").exists()
+    assert cache.get("idle") is None
+
+
+@pytest.mark.asyncio
+async def test_spills_are_written_off_the_event_loop(tmp_path):
+    written_on: list[threading.Thread] = []
+
+    class RecordingStore(ParquetUploadStore):
+        def write(self, key, table, now):
+            written_on.append(threading.current_thread())
+            super().write(key, table, now)
+
+    cache = UploadCache(store=RecordingStore(str(tmp_path)), max_hot_entries=1)
+    first = make_uploaded("House Sparrow")
+    cache.set("first", first)
+    cache.set("second", make_uploaded("Eastern Phoebe"))
+
+    # still served from memory while it's being written
+    assert cache.get_stats()["spilling_entries"] == 1
+    assert cache.get("first") is first
+    # which spilled "second" instead
+    while cache.get_stats()["spilling_entries"]:
+        await asyncio.sleep(0.01)
+
+    assert written_on and threading.main_thread() not in written_on
+    assert (tmp_path / "second.parquet").exists()
+    assert cache.get_stats()["reloads"] == 0
+
+
+def test_spill_dir_with_a_quote(tmp_path):
+    spill_dir = tmp_path / "it's"
+    cache = UploadCache(spill_dir=str(spill_dir), max_hot_entries=1)
+
+    first = make_uploaded("House Sparrow")
+    cache.set("first", first)
+    cache.set("second", make_uploaded("Eastern Phoebe"))
+
+    assert (spill_dir / "first.parquet").exists()
+    reloaded = cache.get("first")
+    assert reloaded is not None
+    assert reloaded.lifers == first.lifers
+
+
+def test_byte_bound(tmp_path):
+    cache = UploadCache(spill_dir=str(tmp_path), max_hot_bytes=1)
+
+    cache.set("first", make_uploaded("House Sparrow"))
+    # the most recent entry always stays in memory
+    assert cache.get_stats()["hot_entries"] == 1
+
+    cache.set("second", make_uploaded("Eastern Phoebe"))
+    assert cache.get_stats()["hot_entries"] == 1
+    assert cache.get_stats()["spills"] == 1
+
+
+def test_keys_cant_escape_spill_dir(tmp_path):
+    cache = UploadCache(spill_dir=str(tmp_path))
+
+    assert cache.get("../../etc/passwd") is None
+    with pytest.raises(ValueError):
+        cache.set("../oops", make_uploaded("House Sparrow"))
+
+
+def test_sqlite_store_shares_uploads_between_workers(tmp_path):
+    # two caches with their own connections stand in for two uvicorn workers
+    path = str(tmp_path / "uploads.db")
+    worker_a = UploadCache(store=SQLiteUploadStore(path))
+    worker_b = UploadCache(store=SQLiteUploadStore(path))
+
+    uploaded = make_uploaded("House Sparrow")
+    worker_a.set("shared", uploaded)
+
+    from_b = worker_b.get("shared")
+    assert from_b is not None
+    assert from_b.lifers == uploaded.lifers
+    assert worker_b.get_stats()["reloads"] == 1
+    assert worker_b.get_stats()["store_backend"] == "sqlite"
+    assert worker_b.get("missing") is None
+
+
+def test_sqlite_store_expires_old_uploads(tmp_path):
+    clock = FakeClock()
+    cache = UploadCache(
+        store=SQLiteUploadStore(str(tmp_path / "uploads.db")),
+        hot_ttl_seconds=60,
+        disk_ttl_seconds=60 * 60,
+        clock=clock,
+    )
+
+    cache.set("old", make_uploaded("House Sparrow"))
+    clock.now += 60 * 60 + 1
+    cache.expire()
+
+    stats = cache.get_stats()
+    assert stats["hot_entries"] == 0
+    assert stats["spilled_entries"] == 0
+    assert stats["disk_expirations"] == 1
+    assert cache.get("old") is None
+
+
+def test_sqlite_store_keeps_uploads_that_are_still_read(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "uploads.db")
+    worker_a = UploadCache(
+        store=SQLiteUploadStore(path), disk_ttl_seconds=60 * 60, clock=clock
+    )
+    worker_b = UploadCache(
+        store=SQLiteUploadStore(path), disk_ttl_seconds=60 * 60, clock=clock
+    )
+
+    worker_a.set("busy", make_uploaded("House Sparrow"))
+    clock.now += 50 * 60
+    assert worker_b.get("busy") is not None
+
+    # past the TTL since it was written, not since it was last read
+    clock.now += 50 * 60
+    worker_a.expire()
+    assert worker_a.get_stats()["disk_expirations"] == 0
+
+    clock.now += 60 * 60 + 1
+    worker_a.expire()
+    assert worker_a.get_stats()["disk_expirations"] == 1
+
+
+def test_columnar_encoding_round_trips():
+    uploaded = make_uploaded("House Sparrow")
+    assert decode_lifers(encode_lifers(uploaded.table)).to_lifers() == uploaded.lifers
@@ -0,0 +1,42 @@
+import datetime
+
+import pytest
+
+from cloaca.warm_up import (
+    PopularHotspotsQuery,
+    WarmUpReport,
+    get_warm_up_popular_hotspots_queries,
+)
+
+
+@pytest.mark.asyncio
+async def test_components_are_timed_and_failures_recorded():
+    report = WarmUpReport(started_at=0)
+
+    async def load() -> str:
+        return "loaded"
+
+    async def fail() -> str:
+        raise ValueError("no file")
+
+    await report.run_component("taxonomy", load)
+    await report.run_component("duck_db", fail)
+
+    assert report.components["taxonomy"].detail == "loaded"
+    assert report.components["taxonomy"].error is None
+    assert report.components["duck_db"].error == "ValueError('no file')"
+    assert all(
+        component.duration_seconds >= 0 for component in report.components.values()
+    )
+    assert not report.finished
+
+    report.finish()
+    assert report.finished
+
+
+def test_popular_hotspots_queries_from_env(monkeypatch):
+    monkeypatch.setenv("WARM_UP_POPULAR_HOTSPOTS", "40.7,-74.0,10;")
+
+    assert get_warm_up_popular_hotspots_queries() == [
+        PopularHotspotsQuery(40.7, -74.0, 10, datetime.date.today().month)
+    ]